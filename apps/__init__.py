@@ -1,4 +1,4 @@
 from .auto_reply import auto_reply
-from .recording_logs import recording_logs
+from .recording_logs import recording_logs, flush_logs
 
-__all__ = ['auto_reply', 'recording_logs']
\ No newline at end of file
+__all__ = ['auto_reply', 'recording_logs', 'flush_logs']
\ No newline at end of file
@@ -1,9 +1,16 @@
 """
 メッセージルーティングモジュール
 コマンドを適切なハンドラーに振り分ける
+
+ルートは core.router.Router に登録し、テキストコマンドの優先順位は段（TIER_*）で表す。
 """
-from linebot.models import MessageEvent, TextMessage, TextSendMessage
+from linebot.models import TextSendMessage
 from core.api import line_bot_api
+from core.router import Router, RouteContext, SCOPE_USER, SCOPE_GROUP, COST_CHEAP, COST_DB, COST_RENDER
+from core.rate_limit import rate_limiter
+from core.metrics import metrics
+from core.session_store import session_store, SessionConflict
+from core.responder import responder
 from apps.help_flex import get_detail_account_flex, get_detail_janken_flex, get_detail_shop_flex, get_detail_stock_flex, get_detail_utility_flex
 from apps.help_flex import get_detail_tax_flex, get_detail_loan_flex
 
@@ -20,584 +27,682 @@ from apps.prison import prison_service
 from apps.rich_menu import menu_manager
 
 
-def auto_reply(event, text, user_id, group_id, display_name, sessions):
-    """
-    メッセージを受け取り、適切なコマンドハンドラーに振り分ける
-    """
-    # Postbackイベントで詳細ヘルプを返す
-    if hasattr(event, 'postback') and event.postback and hasattr(event.postback, 'data'):
-        data = event.postback.data
+router = Router()
 
-        # richmenuswitch のpostback（切替自体はLINE側で即時に完了）
-        # 余計な処理や通知を走らせないため、ここで終了する。
-        if data.startswith("action=richmenu_switched"):
-            return
+# テキスト処理の段（小さいほど先に評価される）
+TIER_FLEX_FLOW = 0      # 税/借金のテキスト入力フロー
+TIER_CANCEL = 1         # ?キャンセル
+TIER_PRIORITY = 2       # セッション中でも実行できるコマンド
+TIER_SESSION = 3        # 株式/ショップ/振り込み/口座開設セッションの入力
+TIER_SESSION_START = 4  # 口座開設・振り込みなどの開始コマンド、じゃんけんの手
+TIER_CHIP_SESSION = 5   # チップ送受信セッションの入力
+TIER_COMMAND = 6        # その他のコマンド
 
-        # リッチメニューページ切り替え
-        if data.startswith("action=richmenu_page"):
-            import urllib.parse
-            parsed_data = dict(urllib.parse.parse_qsl(data))
-            page = parsed_data.get("page", "1-1")  # 例: "1-1", "2-2"
-            menu_manager.switch_user_menu(user_id, page)
-            return
 
-        # リッチメニューからの各種アクション
-        # 口座開設
-        elif data == "action=account_create":
-            banking_commands.handle_account_opening(event, "?口座開設", user_id, display_name, sessions)
-            return
-        # 通帳
-        elif data == "action=passbook":
-            banking_commands.handle_passbook(event, user_id)
-            return
-        # 振り込み
-        elif data == "action=transfer":
-            banking_commands.handle_transfer(event, user_id, sessions)
-            return
-        # ショップホーム
-        elif data == "action=shop_home":
-            from apps.banking.main_bank_system import get_db
-            db = next(get_db())
-            try:
-                response = shop_commands.handle_shop_command(user_id, db)
-                line_bot_api.reply_message(event.reply_token, response)
-            finally:
-                db.close()
-            return
-        # チップ残高
-        elif data == "action=chip_balance":
-            from apps.banking.main_bank_system import get_db
-            db = next(get_db())
-            try:
-                response = shop_commands.handle_chip_balance_command(user_id, db)
-                line_bot_api.reply_message(event.reply_token, response)
-            finally:
-                db.close()
-            return
-        # チップ換金（リッチメニュー用）
-        elif data == "action=chip_exchange":
-            from apps.banking.main_bank_system import get_db
-            from apps.shop.shop_flex import get_chip_exchange_flex
-            db = next(get_db())
-            try:
-                chip_balance = shop_commands.get_user_chip_balance(user_id, db)
-                line_bot_api.reply_message(
-                    event.reply_token,
-                    get_chip_exchange_flex(chip_balance)
-                )
-            finally:
-                db.close()
-            return
-        # チップ全額換金
-        elif data == "action=chip_exchange_all":
-            from apps.banking.main_bank_system import get_db
-            db = next(get_db())
-            try:
-                response = shop_commands.handle_chip_exchange_all(user_id, db)
-                line_bot_api.reply_message(event.reply_token, response)
-            finally:
-                db.close()
-            return
-        # チップ一覧（ショップFlexMessage）
-        elif data == "action=chip_list":
-            from apps.banking.main_bank_system import get_db
-            db = next(get_db())
-            try:
-                response = shop_commands.handle_shop_command(user_id, db)
-                line_bot_api.reply_message(event.reply_token, response)
-            finally:
-                db.close()
-            return
-        # 株式ダッシュボード
-        elif data == "action=stock_home":
-            stock_commands.handle_stock_command(event, user_id)
-            return
-        # 銘柄一覧
-        elif data == "action=stock_list":
-            stock_commands.handle_stock_list(event, user_id)
-            return
-        # ゲームメニュー
-        elif data == "action=game_home":
-            game_commands.handle_game_menu(event, user_id)
-            return
-        # おみくじ
-        elif data == "action=omikuji":
-            utility_commands.handle_omikuji(event, user_id, display_name, "?おみくじ")
-            return
-        # 明日の時間割
-        elif data == "action=timetable":
-            utility_commands.handle_timetable(event)
-            return
-        # 労働
-        elif data == "action=work_home":
-            work_commands.handle_work_command(event, user_id)
-            return
-        elif data == "action=help_home":
-            utility_commands.handle_help(event)
-            return
+def _reply(ctx: RouteContext, message):
+    line_bot_api.reply_message(ctx.reply_token, message)
 
-        # === 税/借金 (Flex) ===
-        elif data.startswith("action=tax_") or data.startswith("action=loan_"):
-            import urllib.parse
-            parsed = dict(urllib.parse.parse_qsl(data))
-            action = parsed.get('action')
-
-            # 税
-            if action and action.startswith('tax_'):
-                from apps.tax.ui import handle_tax_postback
-                resp = handle_tax_postback(action=action, parsed=parsed, user_id=user_id, sessions=sessions)
-                if resp:
-                    line_bot_api.reply_message(event.reply_token, resp)
-                return
 
-            # 借金
-            if action and action.startswith('loan_'):
-                from apps.loans.ui import handle_loan_postback
-                resp = handle_loan_postback(action=action, parsed=parsed, user_id=user_id, sessions=sessions)
-                if resp:
-                    line_bot_api.reply_message(event.reply_token, resp)
-                return
+def _reply_with_bank_db(ctx: RouteContext, build):
+    """銀行DBセッションを開いて応答を作り、返信する"""
+    from apps.banking.main_bank_system import get_db
+    db = next(get_db())
+    try:
+        response = build(db)
+        if response:
+            _reply(ctx, response)
+    finally:
+        db.close()
 
-        # 既存のヘルプ詳細 (action=プレフィックス対応)
-        if data == "action=help_detail_account" or data == "help_detail_account":
-            line_bot_api.reply_message(event.reply_token, get_detail_account_flex())
-            return
-        elif data == "action=help_detail_janken" or data == "help_detail_janken" or data == "action=help_detail_game":
-            line_bot_api.reply_message(event.reply_token, get_detail_janken_flex())
-            return
-        elif data == "action=help_detail_shop" or data == "help_detail_shop":
-            line_bot_api.reply_message(event.reply_token, get_detail_shop_flex())
-            return
-        elif data == "action=help_detail_stock" or data == "help_detail_stock":
-            line_bot_api.reply_message(event.reply_token, get_detail_stock_flex())
-            return
-        elif data == "action=help_detail_utility" or data == "help_detail_utility":
-            line_bot_api.reply_message(event.reply_token, get_detail_utility_flex())
-            return
-        elif data == "action=help_detail_tax" or data == "help_detail_tax":
-            line_bot_api.reply_message(event.reply_token, get_detail_tax_flex())
-            return
-        elif data == "action=help_detail_loan" or data == "help_detail_loan":
-            line_bot_api.reply_message(event.reply_token, get_detail_loan_flex())
-            return
-        # 通帳表示のpostbackアクション
-        elif data.startswith("action=view_passbook"):
-            banking_commands.handle_passbook_postback(event, data)
-            return
-        # 振り込み用口座選択のpostbackアクション
-        elif data.startswith("action=select_transfer_account"):
-            banking_commands.handle_transfer_account_selection_postback(event, data, user_id, sessions)
-            return
-        # じゃんけんゲームのpostbackアクション
-        elif data == "action=join_janken":
-            if event.source.type == 'group':
-                game_commands.handle_join_game(event, user_id, display_name, group_id)
-            return
-        elif data == "action=start_janken":
-            if event.source.type == 'group':
-                game_commands.handle_game_start(event, user_id, group_id)
-            return
-        elif data == "action=cancel_janken":
-            if event.source.type == 'group':
-                game_commands.handle_game_cancel(event, user_id, group_id)
-            return
-        # ショップのpostbackアクション
-        elif data.startswith("action=shop_") or data.startswith("action=confirm_shop_payment_account") or data.startswith("action=select_shop_payment_account"):
-            from apps.banking.main_bank_system import get_db
-            db = next(get_db())
-            try:
-                # postbackデータをパース
-                import urllib.parse
-                parsed_data = dict(urllib.parse.parse_qsl(data))
-                # ショップpostback処理
-                response = shop_commands.handle_shop_postback(user_id, parsed_data, db)
-                if response:
-                    line_bot_api.reply_message(event.reply_token, response)
-            finally:
-                db.close()
-            return
-        # 株式のpostbackアクション
-        elif data.startswith("action=stock_") or data.startswith("action=confirm_stock_") or data.startswith("action=buy_stock") or data.startswith("action=sell_stock") or data.startswith("action=confirm_buy") or data.startswith("action=confirm_sell") or data.startswith("action=cancel_trade") or data.startswith("action=my_holdings") or data.startswith("action=market_news") or data.startswith("action=select_stock_account"):
-            import urllib.parse
-            parsed_data = dict(urllib.parse.parse_qsl(data))
-            stock_commands.handle_stock_postback(event, parsed_data, user_id)
-            return
-        # 労働システムのpostbackアクション
-        elif data.startswith("action=select_work_salary_account") or data.startswith("action=confirm_work_salary_account"):
-            import urllib.parse
-            parsed_data = dict(urllib.parse.parse_qsl(data))
-            work_commands.handle_work_postback(event, parsed_data, user_id)
-            return
-        # 個別ゲームのpostbackアクション
-        elif data.startswith("action=select_game"):
-            import urllib.parse
-            parsed_data = dict(urllib.parse.parse_qsl(data))
-            game_commands.handle_game_selection(event, user_id, parsed_data)
-            return
-        elif data.startswith("action=add_bet"):
-            import urllib.parse
-            parsed_data = dict(urllib.parse.parse_qsl(data))
-            game_commands.handle_add_bet(event, user_id, parsed_data)
-            return
-        elif data.startswith("action=reset_bet"):
-            import urllib.parse
-            parsed_data = dict(urllib.parse.parse_qsl(data))
-            game_commands.handle_reset_bet(event, user_id, parsed_data)
-            return
-        elif data.startswith("action=confirm_bet"):
-            import urllib.parse
-            parsed_data = dict(urllib.parse.parse_qsl(data))
-            game_commands.handle_confirm_bet(event, user_id, parsed_data)
-            return
-        elif data in ["action=hit", "action=stand", "action=double"]:
-            action = data.split('=')[1]
-            game_commands.handle_blackjack_action(event, user_id, action)
-            return
 
-    state = sessions.get(user_id)
+# レート制限にかかったときの応答（毎回作らずに使い回す）
+_RATE_LIMITED_MESSAGE = TextSendMessage(text="⏳ 操作が集中しています。少し時間をおいてから再度お試しください。")
+# セッションの競合は処理（送金・チップの移動など）の確定後に分かるため、処理自体は反映されている場合がある
+_SESSION_CONFLICT_MESSAGE = TextSendMessage(text="⚠️ 同時に別の操作が行われたため、入力途中の状態を保存できませんでした。\n送金などの操作は完了している場合があります。残高や履歴を確認してから、必要なら操作し直してください。")
 
-    # === 回収（督促）の割り込み ===
-    # 全発言に対して督促文をpushで送る（返信枠を消費しない）
-    if event.source.type == 'user':
-        try:
-            from apps.collections.collections_service import get_inline_notice_text
-            notice = get_inline_notice_text(user_id)
-            if notice:
-                line_bot_api.push_message(user_id, TextSendMessage(text=notice))
-        except Exception as e:
-            print(f"[AutoReply] inline notice push failed user={user_id} err={e}")
 
-    # === 懲役中ユーザーの制限チェック ===
-    prisoner_status = prison_service.get_prisoner_status(user_id)
-    if prisoner_status['is_imprisoned']:
-        # 懲役中のユーザーは?労働のみを許可
-        if text != "?労働" and not text.startswith("?キャンセル"):
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="❌ 懲役中のため、?労働のみが実行可能です")
-            )
-            return
+def _rate_limit_guard(ctx: RouteContext, route) -> bool:
+    """ルート実行前のレート制限（超過時は DB に触れずに定型文だけを返す）"""
+    if rate_limiter.allow(ctx.user_id, ctx.group_id, route.cost):
+        return True
+    try:
+        _reply(ctx, _RATE_LIMITED_MESSAGE)
+    except Exception as e:
+        print(f"[AutoReply] rate limit reply failed user={ctx.user_id} err={e}")
+    return False
 
-    # === 税/借金: テキスト入力フロー（PIN/金額など） ===
-    if event.source.type == 'user' and isinstance(state, dict) and state.get('flex_flow'):
-        from apps.tax.ui import handle_tax_text_flow
-        from apps.loans.ui import handle_loan_text_flow
 
-        resp = handle_tax_text_flow(text=text, user_id=user_id, sessions=sessions)
-        if resp:
-            line_bot_api.reply_message(event.reply_token, resp)
-            return
+router.set_guard(_rate_limit_guard)
 
-        resp = handle_loan_text_flow(text=text, user_id=user_id, sessions=sessions)
-        if resp:
-            line_bot_api.reply_message(event.reply_token, resp)
-            return
 
-    # === ?コマンドの優先処理（セッション中でも実行可能） ===
-    # キャンセルコマンド（最優先）
-    if text.strip() == "?キャンセル":
-        # 銀行セッションのキャンセル
-        if isinstance(state, dict) and (state.get("step") or state.get("transfer")):
-            if state.get("transfer"):
-                if banking_commands.handle_transfer_cancel(event, user_id, sessions):
-                    return
-            elif state.get("step"):
-                if banking_commands.handle_cancel(event, user_id, sessions):
-                    return
-        # ゲームセッションのキャンセル
-        if event.source.type == 'group':
-            if game_commands.handle_game_cancel(event, user_id, group_id):
-                return
+def _require_admin(ctx: RouteContext) -> bool:
+    if not prison_commands.is_admin(ctx.user_id):
+        _reply(ctx, TextSendMessage(text="❌ このコマンドは管理者のみ実行可能です"))
+        return False
+    return True
 
-    # その他の?コマンド（セッション中でも実行可能）
-    if text == "?userid":
-        utility_commands.handle_userid(event, user_id)
-        return
 
-    if text in ["?ヘルプ", "?help"]:
-        utility_commands.handle_help(event)
-        return
+# =========================================
+# Postback
+# =========================================
 
-    # リッチメニュー管理コマンド
-    if text == "?メニュー作成":
-        from apps.rich_menu import commands as richmenu_commands
-        richmenu_commands.handle_menu_create(event)
-        return
+# richmenuswitch のpostback（切替自体はLINE側で即時に完了）
+# 余計な処理や通知を走らせないため、ここで終了する。
+@router.postback("action=richmenu_switched", prefix=True)
+def _pb_richmenu_switched(ctx):
+    return
 
-    if text == "?メニュー削除":
-        from apps.rich_menu import commands as richmenu_commands
-        richmenu_commands.handle_menu_delete(event)
-        return
 
-    if text == "?メニュー状態":
-        from apps.rich_menu import commands as richmenu_commands
-        richmenu_commands.handle_menu_status(event)
-        return
+# リッチメニューページ切り替え
+@router.postback("action=richmenu_page", prefix=True)
+def _pb_richmenu_page(ctx):
+    page = ctx.params.get("page", "1-1")  # 例: "1-1", "2-2"
+    menu_manager.switch_user_menu(ctx.user_id, page)
 
-    if text == "?口座情報":
-        banking_commands.handle_account_info(event, user_id)
-        return
 
-    if text == "?通帳":
-        banking_commands.handle_passbook(event, user_id)
-        return
+# リッチメニューからの各種アクション
+# 口座開設
+@router.postback("action=account_create")
+def _pb_account_create(ctx):
+    banking_commands.handle_account_opening(ctx.event, "?口座開設", ctx.user_id, ctx.display_name, ctx.sessions)
 
-    if text == "?株":
-        stock_commands.handle_stock_command(event, user_id)
-        return
 
-    if text == "?チップ残高":
-        from apps.banking.main_bank_system import get_db
-        db = next(get_db())
-        try:
-            response = shop_commands.handle_chip_balance_command(user_id, db)
-            line_bot_api.reply_message(event.reply_token, response)
-        finally:
-            db.close()
-        return
+# 通帳
+@router.postback("action=passbook", cost=COST_DB)
+def _pb_passbook(ctx):
+    banking_commands.handle_passbook(ctx.event, ctx.user_id)
 
-    if text == "?チップ履歴":
-        from apps.banking.main_bank_system import get_db
-        db = next(get_db())
-        try:
-            response = shop_commands.handle_chip_history_command(user_id, db)
-            line_bot_api.reply_message(event.reply_token, response)
-        finally:
-            db.close()
-        return
 
-    # === 税/借金 ===
-    if text.strip() == "?税":
-        if event.source.type != 'user':
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text="税は個別チャットで利用してください"))
-            return
-        from apps.tax.ui import build_dashboard
-        line_bot_api.reply_message(event.reply_token, build_dashboard(user_id))
-        return
+# 振り込み
+@router.postback("action=transfer")
+def _pb_transfer(ctx):
+    banking_commands.handle_transfer(ctx.event, ctx.user_id, ctx.sessions)
 
-    if text.strip() == "?借金":
-        if event.source.type != 'user':
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text="借金は個別チャットで利用してください"))
-            return
-        from apps.loans.ui import build_dashboard
-        line_bot_api.reply_message(event.reply_token, build_dashboard(user_id))
-        return
 
-    if text.startswith("?納税"):
-        from apps.tax.commands import handle_tax_command
-        line_bot_api.reply_message(event.reply_token, handle_tax_command(user_id, text))
-        return
+# ショップホーム / チップ一覧（ショップFlexMessage）
+@router.postback("action=shop_home", "action=chip_list", cost=COST_DB)
+def _pb_shop_home(ctx):
+    _reply_with_bank_db(ctx, lambda db: shop_commands.handle_shop_command(ctx.user_id, db))
 
-    if text.startswith("?借入"):
-        from apps.loans.commands import handle_loan_command
-        line_bot_api.reply_message(event.reply_token, handle_loan_command(user_id, text))
-        return
 
-    if text.startswith("?返済"):
-        from apps.loans.commands import handle_loan_command
-        line_bot_api.reply_message(event.reply_token, handle_loan_command(user_id, text))
-        return
+# チップ残高
+@router.postback("action=chip_balance", cost=COST_DB)
+def _pb_chip_balance(ctx):
+    _reply_with_bank_db(ctx, lambda db: shop_commands.handle_chip_balance_command(ctx.user_id, db))
 
-    if text == "?ゲーム":
-        game_commands.handle_game_menu(event, user_id)
-        return
 
-    # === 銀行機能（個別チャット） ===
-    if event.source.type == 'user':
-        # 株式トレードセッション中の処理
-        from apps.stock.api import stock_api
-        if stock_api.has_session(user_id):
-            if stock_commands.handle_stock_session(event, user_id, text.strip()):
-                return
+# チップ換金（リッチメニュー用）
+@router.postback("action=chip_exchange", cost=COST_DB)
+def _pb_chip_exchange(ctx):
+    from apps.shop.shop_flex import get_chip_exchange_flex
+    _reply_with_bank_db(ctx, lambda db: get_chip_exchange_flex(shop_commands.get_user_chip_balance(ctx.user_id, db)))
 
-        # ショップ支払い口座登録セッション中の処理
-        from apps.shop.commands import shop_session_manager
-        shop_state = shop_session_manager.get_session(user_id)
-        if shop_state and shop_state.get('type') == 'payment_registration':
-            from apps.banking.main_bank_system import get_db
-            db = next(get_db())
-            try:
-                response = shop_commands.handle_payment_registration_session(user_id, text.strip(), db)
-                if response:
-                    line_bot_api.reply_message(event.reply_token, response)
-            finally:
-                db.close()
-            return
 
-        # 振り込みセッション中の処理
-        if isinstance(state, dict) and state.get("transfer"):
-            # セッション中の入力処理
-            banking_commands.handle_transfer_session_input(event, text, user_id, sessions)
-            return
+# チップ全額換金
+@router.postback("action=chip_exchange_all", cost=COST_DB)
+def _pb_chip_exchange_all(ctx):
+    _reply_with_bank_db(ctx, lambda db: shop_commands.handle_chip_exchange_all(ctx.user_id, db))
 
-        # 口座開設フロー中の処理
-        if isinstance(state, dict) and state.get("step"):
-            # セッション中に新たな開始コマンドが来た場合は拒否
-            if text.strip() in ["?口座開設", "?振り込み"]:
-                line_bot_api.reply_message(event.reply_token, TextSendMessage(text="現在登録フロー中です。キャンセルまたは完了後に再度お試しください。"))
-                return
 
-            # 戻るコマンド
-            if text.strip() == "?戻る":
-                banking_commands.handle_back(event, text, user_id, display_name, sessions)
-                return
+# 株式ダッシュボード
+@router.postback("action=stock_home", cost=COST_DB)
+def _pb_stock_home(ctx):
+    stock_commands.handle_stock_command(ctx.event, ctx.user_id)
 
-            # セッション中の入力処理
-            banking_commands.handle_session_input(event, text, user_id, display_name, sessions)
-            return
 
-        # 新規開始コマンド
-        if text.strip() == "?口座開設":
-            banking_commands.handle_account_opening(event, text, user_id, display_name, sessions)
-            return
+# 銘柄一覧
+@router.postback("action=stock_list", cost=COST_DB)
+def _pb_stock_list(ctx):
+    stock_commands.handle_stock_list(ctx.event, ctx.user_id)
 
-        # プレイヤーの手入力（じゃんけん）
-        if game_commands.handle_player_move(event, user_id, text):
-            return
 
-    if text in ["?ヘルプ", "?help"]:
-        utility_commands.handle_help(event)
-        return
+# ゲームメニュー
+@router.postback("action=game_home", cost=COST_DB)
+def _pb_game_home(ctx):
+    game_commands.handle_game_menu(ctx.event, ctx.user_id)
 
-    if text == "?アップデート":
-        from apps.help_flex import get_update_announcement_flex
-        line_bot_api.reply_message(event.reply_token, get_update_announcement_flex())
-        return
 
-    if text == "?口座情報":
-        banking_commands.handle_account_info(event, user_id)
-        return
+# おみくじ
+@router.postback("action=omikuji", cost=COST_DB)
+def _pb_omikuji(ctx):
+    utility_commands.handle_omikuji(ctx.event, ctx.user_id, ctx.display_name, "?おみくじ")
 
-    if text == "?通帳":
-        banking_commands.handle_passbook(event, user_id)
-        return
 
-    # === セッションが必要なコマンド（個別チャット） ===
-    if event.source.type == 'user':
-        if text == "?振り込み":
-            banking_commands.handle_transfer(event, user_id, sessions)
-            return
+# 明日の時間割
+@router.postback("action=timetable")
+def _pb_timetable(ctx):
+    utility_commands.handle_timetable(ctx.event)
 
-        if text == "?チップ送受信":
-            banking_commands.handle_chip_transfer(event, user_id, sessions)
-            return
 
-        # チップ送受信セッション中の処理
-        if isinstance(state, dict) and state.get("chip_transfer"):
-            banking_commands.handle_chip_transfer_session_input(event, text, user_id, sessions)
+# 労働
+@router.postback("action=work_home", cost=COST_DB)
+def _pb_work_home(ctx):
+    work_commands.handle_work_command(ctx.event, ctx.user_id)
+
+
+@router.postback("action=help_home")
+def _pb_help_home(ctx):
+    utility_commands.handle_help(ctx.event)
+
+
+# === 税/借金 (Flex) ===
+@router.postback("action=tax_", prefix=True, cost=COST_DB)
+def _pb_tax(ctx):
+    from apps.tax.ui import handle_tax_postback
+    resp = handle_tax_postback(action=ctx.params.get('action'), parsed=ctx.params, user_id=ctx.user_id, sessions=ctx.sessions)
+    if resp:
+        _reply(ctx, resp)
+
+
+@router.postback("action=loan_", prefix=True, cost=COST_DB)
+def _pb_loan(ctx):
+    from apps.loans.ui import handle_loan_postback
+    resp = handle_loan_postback(action=ctx.params.get('action'), parsed=ctx.params, user_id=ctx.user_id, sessions=ctx.sessions)
+    if resp:
+        _reply(ctx, resp)
+
+
+# 既存のヘルプ詳細 (action=プレフィックス対応)
+_HELP_DETAILS = {
+    get_detail_account_flex: ("action=help_detail_account", "help_detail_account"),
+    get_detail_janken_flex: ("action=help_detail_janken", "help_detail_janken", "action=help_detail_game"),
+    get_detail_shop_flex: ("action=help_detail_shop", "help_detail_shop"),
+    get_detail_stock_flex: ("action=help_detail_stock", "help_detail_stock"),
+    get_detail_utility_flex: ("action=help_detail_utility", "help_detail_utility"),
+    get_detail_tax_flex: ("action=help_detail_tax", "help_detail_tax"),
+    get_detail_loan_flex: ("action=help_detail_loan", "help_detail_loan"),
+}
+
+
+def _register_help_detail(build_flex, patterns):
+    def _pb_help_detail(ctx):
+        _reply(ctx, build_flex())
+    _pb_help_detail.__name__ = f"_pb_help_detail[{build_flex.__name__}]"
+    router.postback(*patterns)(_pb_help_detail)
+
+
+for _build_flex, _patterns in _HELP_DETAILS.items():
+    _register_help_detail(_build_flex, _patterns)
+
+
+# 通帳表示のpostbackアクション
+@router.postback("action=view_passbook", prefix=True, cost=COST_DB)
+def _pb_view_passbook(ctx):
+    banking_commands.handle_passbook_postback(ctx.event, ctx.data)
+
+
+# 振り込み用口座選択のpostbackアクション
+@router.postback("action=select_transfer_account", prefix=True)
+def _pb_select_transfer_account(ctx):
+    banking_commands.handle_transfer_account_selection_postback(ctx.event, ctx.data, ctx.user_id, ctx.sessions)
+
+
+# じゃんけんゲームのpostbackアクション（グループ以外では何もしない）
+@router.postback("action=join_janken")
+def _pb_join_janken(ctx):
+    if ctx.source_type == SCOPE_GROUP:
+        game_commands.handle_join_game(ctx.event, ctx.user_id, ctx.display_name, ctx.group_id)
+
+
+@router.postback("action=start_janken")
+def _pb_start_janken(ctx):
+    if ctx.source_type == SCOPE_GROUP:
+        game_commands.handle_game_start(ctx.event, ctx.user_id, ctx.group_id)
+
+
+@router.postback("action=cancel_janken")
+def _pb_cancel_janken(ctx):
+    if ctx.source_type == SCOPE_GROUP:
+        game_commands.handle_game_cancel(ctx.event, ctx.user_id, ctx.group_id)
+
+
+# ショップのpostbackアクション
+@router.postback("action=shop_", "action=confirm_shop_payment_account", "action=select_shop_payment_account", prefix=True, cost=COST_DB)
+def _pb_shop(ctx):
+    _reply_with_bank_db(ctx, lambda db: shop_commands.handle_shop_postback(ctx.user_id, ctx.params, db))
+
+
+# 株式のpostbackアクション
+@router.postback(
+    "action=stock_", "action=confirm_stock_", "action=buy_stock", "action=sell_stock",
+    "action=my_holdings", "action=market_news", "action=select_stock_account",
+    prefix=True, cost=COST_DB,
+)
+def _pb_stock(ctx):
+    stock_commands.handle_stock_postback(ctx.event, ctx.params, ctx.user_id)
+
+
+# 銘柄詳細（チャート画像の生成とアップロードを伴う）
+router.postback("action=stock_detail", prefix=True, cost=COST_RENDER)(_pb_stock)
+
+# 取引の確定/取り消し（途中の取引を必ず終えられるよう、閲覧で使い切る DB バケットとは別にする）
+router.postback("action=confirm_buy", "action=confirm_sell", "action=cancel_trade", prefix=True, cost=COST_CHEAP)(_pb_stock)
+
+
+# 労働システムのpostbackアクション
+@router.postback("action=select_work_salary_account", "action=confirm_work_salary_account", prefix=True)
+def _pb_work(ctx):
+    work_commands.handle_work_postback(ctx.event, ctx.params, ctx.user_id)
+
+
+# 個別ゲームのpostbackアクション
+@router.postback("action=select_game", prefix=True)
+def _pb_select_game(ctx):
+    game_commands.handle_game_selection(ctx.event, ctx.user_id, ctx.params)
+
+
+@router.postback("action=add_bet", prefix=True)
+def _pb_add_bet(ctx):
+    game_commands.handle_add_bet(ctx.event, ctx.user_id, ctx.params)
+
+
+@router.postback("action=reset_bet", prefix=True)
+def _pb_reset_bet(ctx):
+    game_commands.handle_reset_bet(ctx.event, ctx.user_id, ctx.params)
+
+
+@router.postback("action=confirm_bet", prefix=True)
+def _pb_confirm_bet(ctx):
+    game_commands.handle_confirm_bet(ctx.event, ctx.user_id, ctx.params)
+
+
+@router.postback("action=hit", "action=stand", "action=double")
+def _pb_blackjack_action(ctx):
+    game_commands.handle_blackjack_action(ctx.event, ctx.user_id, ctx.data.split('=')[1])
+
+
+# =========================================
+# セッション入力フック
+# =========================================
+
+# === 税/借金: テキスト入力フロー（PIN/金額など） ===
+@router.session_hook(tier=TIER_FLEX_FLOW, scope=SCOPE_USER)
+def _hook_flex_flow(ctx):
+    if not (isinstance(ctx.state, dict) and ctx.state.get('flex_flow')):
+        return False
+    from apps.tax.ui import handle_tax_text_flow
+    from apps.loans.ui import handle_loan_text_flow
+
+    resp = handle_tax_text_flow(text=ctx.text, user_id=ctx.user_id, sessions=ctx.sessions)
+    if resp:
+        _reply(ctx, resp)
+        return True
+
+    resp = handle_loan_text_flow(text=ctx.text, user_id=ctx.user_id, sessions=ctx.sessions)
+    if resp:
+        _reply(ctx, resp)
+        return True
+    return False
+
+
+# 株式トレードセッション中の処理
+@router.session_hook(tier=TIER_SESSION, scope=SCOPE_USER)
+def _hook_stock_session(ctx):
+    from apps.stock.api import stock_api
+    if stock_api.has_session(ctx.user_id):
+        return bool(stock_commands.handle_stock_session(ctx.event, ctx.user_id, ctx.text.strip()))
+    return False
+
+
+# ショップ支払い口座登録セッション中の処理
+@router.session_hook(tier=TIER_SESSION, scope=SCOPE_USER)
+def _hook_shop_payment_registration(ctx):
+    shop_state = shop_commands.shop_session_manager.get_session(ctx.user_id)
+    if not (shop_state and shop_state.get('type') == 'payment_registration'):
+        return False
+    _reply_with_bank_db(ctx, lambda db: shop_commands.handle_payment_registration_session(ctx.user_id, ctx.text.strip(), db))
+    return True
+
+
+# 振り込みセッション中の処理
+@router.session_hook(tier=TIER_SESSION, scope=SCOPE_USER)
+def _hook_transfer_session(ctx):
+    if not (isinstance(ctx.state, dict) and ctx.state.get("transfer")):
+        return False
+    banking_commands.handle_transfer_session_input(ctx.event, ctx.text, ctx.user_id, ctx.sessions)
+    return True
+
+
+# 口座開設フロー中の処理
+@router.session_hook(tier=TIER_SESSION, scope=SCOPE_USER)
+def _hook_account_opening_session(ctx):
+    if not (isinstance(ctx.state, dict) and ctx.state.get("step")):
+        return False
+
+    text = ctx.text.strip()
+    # セッション中に新たな開始コマンドが来た場合は拒否
+    if text in ["?口座開設", "?振り込み"]:
+        _reply(ctx, TextSendMessage(text="現在登録フロー中です。キャンセルまたは完了後に再度お試しください。"))
+        return True
+
+    # 戻るコマンド
+    if text == "?戻る":
+        banking_commands.handle_back(ctx.event, ctx.text, ctx.user_id, ctx.display_name, ctx.sessions)
+        return True
+
+    # セッション中の入力処理
+    banking_commands.handle_session_input(ctx.event, ctx.text, ctx.user_id, ctx.display_name, ctx.sessions)
+    return True
+
+
+# チップ送受信セッション中の処理
+@router.session_hook(tier=TIER_CHIP_SESSION, scope=SCOPE_USER)
+def _hook_chip_transfer_session(ctx):
+    if not (isinstance(ctx.state, dict) and ctx.state.get("chip_transfer")):
+        return False
+    banking_commands.handle_chip_transfer_session_input(ctx.event, ctx.text, ctx.user_id, ctx.sessions)
+    return True
+
+
+# =========================================
+# テキストコマンド
+# =========================================
+
+# キャンセルコマンド（最優先）
+@router.text("?キャンセル", tier=TIER_CANCEL, allow_imprisoned=True)
+def _cmd_cancel(ctx):
+    state = ctx.state
+    # 銀行セッションのキャンセル
+    if isinstance(state, dict) and (state.get("step") or state.get("transfer")):
+        if state.get("transfer"):
+            if banking_commands.handle_transfer_cancel(ctx.event, ctx.user_id, ctx.sessions):
+                return
+        elif state.get("step"):
+            if banking_commands.handle_cancel(ctx.event, ctx.user_id, ctx.sessions):
+                return
+    # ゲームセッションのキャンセル
+    if ctx.source_type == 'group':
+        if game_commands.handle_game_cancel(ctx.event, ctx.user_id, ctx.group_id):
             return
+    return False
 
-    # === ショップ機能 ===
-    if text == "?ショップ":
-        from apps.banking.main_bank_system import get_db
-        db = next(get_db())
-        try:
-            response = shop_commands.handle_shop_command(user_id, db)
-            line_bot_api.reply_message(event.reply_token, response)
-        finally:
-            db.close()
-        return
 
-    if text.startswith("?チップ換金"):
-        from apps.banking.main_bank_system import get_db
-        db = next(get_db())
-        try:
-            response = shop_commands.handle_chip_redeem_command(user_id, text, db)
-            line_bot_api.reply_message(event.reply_token, response)
-        finally:
-            db.close()
-        return
+# === ?コマンドの優先処理（セッション中でも実行可能） ===
+@router.text("?userid", tier=TIER_PRIORITY)
+def _cmd_userid(ctx):
+    utility_commands.handle_userid(ctx.event, ctx.user_id)
 
-    if text == "?明日の時間割":
-        utility_commands.handle_timetable(event)
-        return
 
-    if text == "?おみくじ":
-        utility_commands.handle_omikuji(event, user_id, display_name, text)
-        return
+@router.text("?ヘルプ", "?help", tier=TIER_PRIORITY)
+def _cmd_help(ctx):
+    utility_commands.handle_help(ctx.event)
+
+
+# リッチメニュー管理コマンド
+@router.text("?メニュー作成", tier=TIER_PRIORITY)
+def _cmd_menu_create(ctx):
+    from apps.rich_menu import commands as richmenu_commands
+    richmenu_commands.handle_menu_create(ctx.event)
+
+
+@router.text("?メニュー削除", tier=TIER_PRIORITY)
+def _cmd_menu_delete(ctx):
+    from apps.rich_menu import commands as richmenu_commands
+    richmenu_commands.handle_menu_delete(ctx.event)
+
+
+@router.text("?メニュー状態", tier=TIER_PRIORITY)
+def _cmd_menu_status(ctx):
+    from apps.rich_menu import commands as richmenu_commands
+    richmenu_commands.handle_menu_status(ctx.event)
+
+
+@router.text("?口座情報", tier=TIER_PRIORITY, cost=COST_DB)
+def _cmd_account_info(ctx):
+    banking_commands.handle_account_info(ctx.event, ctx.user_id)
+
+
+@router.text("?通帳", tier=TIER_PRIORITY, cost=COST_DB)
+def _cmd_passbook(ctx):
+    banking_commands.handle_passbook(ctx.event, ctx.user_id)
+
+
+@router.text("?株", tier=TIER_PRIORITY, cost=COST_DB)
+def _cmd_stock(ctx):
+    stock_commands.handle_stock_command(ctx.event, ctx.user_id)
+
 
-    if text.startswith("?RPN"):
-        utility_commands.handle_rpn(event, text)
+@router.text("?チップ残高", tier=TIER_PRIORITY, cost=COST_DB)
+def _cmd_chip_balance(ctx):
+    _reply_with_bank_db(ctx, lambda db: shop_commands.handle_chip_balance_command(ctx.user_id, db))
+
+
+@router.text("?チップ履歴", tier=TIER_PRIORITY, cost=COST_DB)
+def _cmd_chip_history(ctx):
+    _reply_with_bank_db(ctx, lambda db: shop_commands.handle_chip_history_command(ctx.user_id, db))
+
+
+# === 税/借金 ===
+@router.text("?税", tier=TIER_PRIORITY, cost=COST_DB)
+def _cmd_tax_dashboard(ctx):
+    if ctx.source_type != 'user':
+        _reply(ctx, TextSendMessage(text="税は個別チャットで利用してください"))
         return
+    from apps.tax.ui import build_dashboard
+    _reply(ctx, build_dashboard(ctx.user_id))
 
-    if text.startswith("?setname"):
-        utility_commands.handle_setname(event, user_id, text)
+
+@router.text("?借金", tier=TIER_PRIORITY, cost=COST_DB)
+def _cmd_loan_dashboard(ctx):
+    if ctx.source_type != 'user':
+        _reply(ctx, TextSendMessage(text="借金は個別チャットで利用してください"))
         return
+    from apps.loans.ui import build_dashboard
+    _reply(ctx, build_dashboard(ctx.user_id))
+
+
+@router.text("?納税", tier=TIER_PRIORITY, prefix=True, cost=COST_DB)
+def _cmd_tax(ctx):
+    from apps.tax.commands import handle_tax_command
+    _reply(ctx, handle_tax_command(ctx.user_id, ctx.text))
+
+
+@router.text("?借入", "?返済", tier=TIER_PRIORITY, prefix=True, cost=COST_DB)
+def _cmd_loan(ctx):
+    from apps.loans.commands import handle_loan_command
+    _reply(ctx, handle_loan_command(ctx.user_id, ctx.text))
+
+
+@router.text("?ゲーム", tier=TIER_PRIORITY, cost=COST_DB)
+def _cmd_game_menu(ctx):
+    game_commands.handle_game_menu(ctx.event, ctx.user_id)
+
+
+# === セッションが必要なコマンドの開始（個別チャット） ===
+@router.text("?口座開設", tier=TIER_SESSION_START, scope=SCOPE_USER)
+def _cmd_account_opening(ctx):
+    banking_commands.handle_account_opening(ctx.event, ctx.text, ctx.user_id, ctx.display_name, ctx.sessions)
+
+
+# プレイヤーの手入力（じゃんけん）
+@router.text(*game_commands.PLAYER_MOVE_TEXTS, tier=TIER_SESSION_START, scope=SCOPE_USER)
+def _cmd_player_move(ctx):
+    return game_commands.handle_player_move(ctx.event, ctx.user_id, ctx.text)
+
 
-    if text == "?労働":
-        work_commands.handle_work_command(event, user_id)
+@router.text("?アップデート", tier=TIER_SESSION_START)
+def _cmd_update_announcement(ctx):
+    from apps.help_flex import get_update_announcement_flex
+    _reply(ctx, get_update_announcement_flex())
+
+
+@router.text("?振り込み", tier=TIER_SESSION_START, scope=SCOPE_USER)
+def _cmd_transfer(ctx):
+    banking_commands.handle_transfer(ctx.event, ctx.user_id, ctx.sessions)
+
+
+@router.text("?チップ送受信", tier=TIER_SESSION_START, scope=SCOPE_USER)
+def _cmd_chip_transfer(ctx):
+    banking_commands.handle_chip_transfer(ctx.event, ctx.user_id, ctx.sessions)
+
+
+# === ショップ機能 ===
+@router.text("?ショップ", tier=TIER_COMMAND, cost=COST_DB)
+def _cmd_shop(ctx):
+    _reply_with_bank_db(ctx, lambda db: shop_commands.handle_shop_command(ctx.user_id, db))
+
+
+@router.text("?チップ換金", tier=TIER_COMMAND, prefix=True, cost=COST_DB)
+def _cmd_chip_redeem(ctx):
+    _reply_with_bank_db(ctx, lambda db: shop_commands.handle_chip_redeem_command(ctx.user_id, ctx.text, db))
+
+
+@router.text("?明日の時間割", tier=TIER_COMMAND)
+def _cmd_timetable(ctx):
+    utility_commands.handle_timetable(ctx.event)
+
+
+@router.text("?おみくじ", tier=TIER_COMMAND, cost=COST_DB)
+def _cmd_omikuji(ctx):
+    utility_commands.handle_omikuji(ctx.event, ctx.user_id, ctx.display_name, ctx.text)
+
+
+@router.text("?RPN", tier=TIER_COMMAND, prefix=True)
+def _cmd_rpn(ctx):
+    utility_commands.handle_rpn(ctx.event, ctx.text)
+
+
+@router.text("?setname", tier=TIER_COMMAND, prefix=True)
+def _cmd_setname(ctx):
+    utility_commands.handle_setname(ctx.event, ctx.user_id, ctx.text)
+
+
+@router.text("?労働", tier=TIER_COMMAND, allow_imprisoned=True, cost=COST_DB)
+def _cmd_work(ctx):
+    work_commands.handle_work_command(ctx.event, ctx.user_id)
+
+
+# === 管理者コマンド ===
+@router.text("?ユーザー口座 ", tier=TIER_COMMAND, prefix=True)
+def _cmd_admin_user_accounts(ctx):
+    if not _require_admin(ctx):
         return
+    target_user_id = ctx.text.replace("?ユーザー口座 ", "").strip()
+    prison_commands.handle_admin_user_accounts(ctx.event, ctx.user_id, target_user_id)
 
-    # === 管理者コマンド ===
-    if text.startswith("?ユーザー口座 "):
-        if not prison_commands.is_admin(user_id):
-            line_bot_api.reply_message(event.reply_token,
-                TextSendMessage(text="❌ このコマンドは管理者のみ実行可能です"))
-            return
-        target_user_id = text.replace("?ユーザー口座 ", "").strip()
-        prison_commands.handle_admin_user_accounts(event, user_id, target_user_id)
+
+@router.text("?口座番号 ", tier=TIER_COMMAND, prefix=True)
+def _cmd_admin_account_number(ctx):
+    parts = ctx.text.replace("?口座番号 ", "").strip().split("-")
+    if len(parts) != 2:
+        _reply(ctx, TextSendMessage(text="❌ 形式: ?口座番号 [支店番号-口座番号]"))
         return
+    branch_number, account_number = parts
+    prison_commands.handle_admin_account_number(ctx.event, ctx.user_id, branch_number, account_number)
 
-    if text.startswith("?口座番号 "):
-        parts = text.replace("?口座番号 ", "").strip().split("-")
-        if len(parts) != 2:
-            line_bot_api.reply_message(event.reply_token,
-                TextSendMessage(text="❌ 形式: ?口座番号 [支店番号-口座番号]"))
-            return
-        branch_number, account_number = parts
-        prison_commands.handle_admin_account_number(event, user_id, branch_number, account_number)
+
+@router.text("?ジョブ", tier=TIER_COMMAND)
+def _cmd_admin_jobs(ctx):
+    if not _require_admin(ctx):
         return
+    utility_commands.handle_job_status(ctx.event)
 
-    if text.startswith("?懲役 "):
-        if not prison_commands.is_admin(user_id):
-            line_bot_api.reply_message(event.reply_token,
-                TextSendMessage(text="❌ このコマンドは管理者のみ実行可能です"))
-            return
-        # パース: "?懲役 [user_id] [start_date] [days] [quota]"
-        params = text.replace("?懲役 ", "").split()
-        if len(params) < 4:
-            line_bot_api.reply_message(event.reply_token,
-                TextSendMessage(text="❌ 形式: ?懲役 [user_id] [施行日(YYYY-MM-DD)] [日数] [ノルマ]"))
-            return
-        prison_commands.handle_admin_sentence(event, user_id, params[0], params[1], int(params[2]), int(params[3]))
+
+@router.text("?懲役 ", tier=TIER_COMMAND, prefix=True)
+def _cmd_admin_sentence(ctx):
+    if not _require_admin(ctx):
+        return
+    # パース: "?懲役 [user_id] [start_date] [days] [quota]"
+    params = ctx.text.replace("?懲役 ", "").split()
+    if len(params) < 4:
+        _reply(ctx, TextSendMessage(text="❌ 形式: ?懲役 [user_id] [施行日(YYYY-MM-DD)] [日数] [ノルマ]"))
         return
+    prison_commands.handle_admin_sentence(ctx.event, ctx.user_id, params[0], params[1], int(params[2]), int(params[3]))
 
-    if text.startswith("?凍結 "):
-        if not prison_commands.is_admin(user_id):
-            line_bot_api.reply_message(event.reply_token,
-                TextSendMessage(text="❌ このコマンドは管理者のみ実行可能です"))
-            return
-        account_number = text.replace("?凍結 ", "").strip()
-        prison_commands.handle_admin_freeze_account(event, user_id, account_number)
+
+@router.text("?凍結 ", tier=TIER_COMMAND, prefix=True)
+def _cmd_admin_freeze(ctx):
+    if not _require_admin(ctx):
         return
+    account_number = ctx.text.replace("?凍結 ", "").strip()
+    prison_commands.handle_admin_freeze_account(ctx.event, ctx.user_id, account_number)
 
-    if text.startswith("?釈放 "):
-        if not prison_commands.is_admin(user_id):
-            line_bot_api.reply_message(event.reply_token,
-                TextSendMessage(text="❌ このコマンドは管理者のみ実行可能です"))
-            return
-        target_user_id = text.replace("?釈放 ", "").strip()
-        prison_commands.handle_admin_release(event, user_id, target_user_id)
+
+@router.text("?釈放 ", tier=TIER_COMMAND, prefix=True)
+def _cmd_admin_release(ctx):
+    if not _require_admin(ctx):
         return
+    target_user_id = ctx.text.replace("?釈放 ", "").strip()
+    prison_commands.handle_admin_release(ctx.event, ctx.user_id, target_user_id)
 
-    # お遊びコマンド
-    if utility_commands.handle_fun_commands(event, text):
+
+# お遊びコマンド
+@router.text(*utility_commands.FUN_COMMAND_TEXTS, tier=TIER_COMMAND)
+def _cmd_fun(ctx):
+    return utility_commands.handle_fun_commands(ctx.event, ctx.text)
+
+
+# === ゲーム機能（グループチャット） ===
+@router.text("?じゃんけん", tier=TIER_COMMAND, scope=SCOPE_GROUP)
+def _cmd_janken_start(ctx):
+    game_commands.handle_janken_start(ctx.event, ctx.user_id, ctx.text, ctx.display_name, ctx.group_id, ctx.sessions)
+
+
+@router.text("?参加", tier=TIER_COMMAND, scope=SCOPE_GROUP)
+def _cmd_janken_join(ctx):
+    game_commands.handle_join_game(ctx.event, ctx.user_id, ctx.display_name, ctx.group_id)
+
+
+@router.text("?開始", tier=TIER_COMMAND, scope=SCOPE_GROUP)
+def _cmd_janken_begin(ctx):
+    game_commands.handle_game_start(ctx.event, ctx.user_id, ctx.group_id)
+
+
+def auto_reply(event, text, user_id, group_id, display_name, sessions):
+    """
+    メッセージを受け取り、適切なコマンドハンドラーに振り分ける
+    """
+    ctx = RouteContext(event, text, user_id, group_id, display_name, sessions)
+    # セッションの変更はイベント処理の最後にまとめて保存され、その後で返信をまとめて送る
+    # （他のワーカーと競合して保存できなかった場合は、処理は反映済みかもしれないことと確認のお願いを返信に加える）
+    with metrics.command_timer() as timer, responder.scope(event):
+        try:
+            with session_store.request_scope():
+                _dispatch(ctx)
+        except SessionConflict as e:
+            print(f"[AutoReply] session write conflict user={user_id} {e.conflicts}")
+            _reply(ctx, _SESSION_CONFLICT_MESSAGE)
+        finally:
+            timer.name = ctx.handled_by or 'unmatched'
+
+
+def _dispatch(ctx: RouteContext):
+    event = ctx.event
+    user_id = ctx.user_id
+
+    # Postback（該当するアクションがなければテキストと同じ流れで処理する）
+    route = router.match_postback(ctx)
+    if route is not None:
+        router.run_postback(ctx, route)
         return
 
-    # === ゲーム機能（グループチャット） ===
-    if event.source.type == 'group':
-        if text == "?じゃんけん":
-            game_commands.handle_janken_start(event, user_id, text, display_name, group_id, sessions)
-            return
+    ctx.state = ctx.sessions.get(user_id)
 
-        if text == "?参加":
-            game_commands.handle_join_game(event, user_id, display_name, group_id)
-            return
+    # === 回収（督促）の割り込み ===
+    # 督促文をpushで送る（返信枠を消費しない。同じユーザーには COLLECTIONS_NOTICE_PUSH_INTERVAL 秒に1回まで）
+    if event.source.type == 'user':
+        try:
+            from apps.collections.collections_service import take_inline_notice
+            notice = take_inline_notice(user_id)
+            if notice:
+                line_bot_api.push_message(user_id, TextSendMessage(text=notice))
+        except Exception as e:
+            print(f"[AutoReply] inline notice push failed user={user_id} err={e}")
+
+    route = router.match_text(ctx)
 
-        if text == "?開始":
-            game_commands.handle_game_start(event, user_id, group_id)
+    # === 懲役中ユーザーの制限チェック ===
+    if prison_service.is_imprisoned(user_id):
+        # 懲役中のユーザーは?労働（と?キャンセルで始まる発言）のみを許可
+        if (route is None or not route.allow_imprisoned) and not (ctx.text or '').startswith("?キャンセル"):
+            ctx.handled_by = 'prison_gate'
+            _reply(ctx, TextSendMessage(text="❌ 懲役中のため、?労働のみが実行可能です"))
             return
 
+    if router.run_text(ctx, route):
+        return
+
     # === デフォルト応答 ===
     if event.source.type == 'user':
+        ctx.handled_by = 'default'
         utility_commands.handle_default_user_message(event)
@@ -132,6 +132,26 @@ class BankingAPI:
         service = _get_bank_service()
         return service.transfer_funds(from_account_number, to_account_number, amount, currency, description)
 
+    @staticmethod
+    def post_transfer(db, from_account_number: str, to_account_number: str,
+                      amount: Any, currency: str = 'JPY', description: str = None) -> dict:
+        """
+        口座間送金を呼び出し側のトランザクション内で記帳（コミット・再実行は呼び出し側）
+
+        Args:
+            db: 銀行DBと同じエンジンのセッション（トランザクション開始済み）
+            from_account_number: 送金元口座番号
+            to_account_number: 送金先口座番号
+            amount: 金額
+            currency: 通貨コード
+            description: 摘要（オプション）
+
+        Returns:
+            取引情報の辞書
+        """
+        service = _get_bank_service()
+        return service.post_transfer(db, from_account_number, to_account_number, amount, currency, description)
+
     @staticmethod
     def withdraw_by_account(account_number: str, branch_code: str,
                             amount: Any, currency: str = 'JPY') -> bool:
@@ -189,6 +209,24 @@ class BankingAPI:
         service = _get_bank_service()
         return service.get_account_transactions_by_account(account_number, branch_code, limit)
 
+    @staticmethod
+    def get_passbook_page(account_number: str, branch_code: str, limit: int = 20,
+                          cursor: Optional[str] = None) -> dict:
+        """
+        取引履歴を1ページ分取得（キーセット方式）
+
+        Args:
+            account_number: 口座番号
+            branch_code: 支店コード
+            limit: 取得件数上限
+            cursor: 前のページの next_cursor（先頭ページは None）
+
+        Returns:
+            {'items': 取引履歴辞書のリスト, 'next_cursor': 次のページのカーソル or None}
+        """
+        service = _get_bank_service()
+        return service.get_passbook_page(account_number, branch_code, limit, cursor)
+
     # --- 認証 ---
 
     @staticmethod
@@ -35,6 +35,10 @@ from apps.banking.main_bank_system import (
     TransactionEntry,
 )
 import config
+from core.db import record_lock_wait, retryable_reason, run_with_retry
+from apps.banking.bulk_posting import post_batch, BulkPostingError, DEPOSIT, WITHDRAWAL
+from apps.banking.hot_accounts import hot_accounts
+from apps.banking.passbook import get_passbook_page, get_passbook_page_by_user
 from apps.utilities.timezone_utils import now_jst
 from linebot.models import FlexSendMessage
 
@@ -283,109 +287,161 @@ def transfer_initial_funds(to_account_number: str, to_branch_code: str, user_id:
         db.close()
 
 
+def lock_accounts(db: Session, account_numbers, name: str) -> dict:
+    """
+    口座をまとめて行ロックして取得する（account_number -> Account）
+
+    ロックは常に account_id の昇順で取るため、逆向きの送金が同時に走ってもデッドロックしない。
+
+    Args:
+        name: ロック待ち時間の統計のキー
+    """
+    start = time.perf_counter()
+    rows = db.execute(
+        select(Account)
+        .where(Account.account_number.in_(set(account_numbers)))
+        .order_by(Account.account_id)
+        .with_for_update()
+    ).scalars().all()
+    record_lock_wait(name, time.perf_counter() - start)
+    accounts = {}
+    for acc in rows:
+        accounts.setdefault(acc.account_number, acc)
+    return accounts
+
+
 def transfer_funds(from_account_number: str, to_account_number: str, amount, currency: str = 'JPY', description: str = None):
     """
     送金処理: 二重仕訳 + 残高更新 を単一の DB トランザクションで行う。
+    デッドロック/直列化失敗の場合はトランザクションごと再実行する。
     Returns the Transaction object.
 
     Args:
         description: 摘要（取引の説明）
     """
-    db = SessionLocal()
     amount = Decimal(amount)
-    try:
-        with db.begin():
-            # 送金元・送金先をロックして取得
-            from_acc = db.execute(select(Account).filter_by(account_number=from_account_number).with_for_update()).scalars().first()
-            to_acc = db.execute(select(Account).filter_by(account_number=to_account_number).with_for_update()).scalars().first()
-
-            if not from_acc:
-                raise ValueError("From account not found")
-            if not to_acc:
-                raise ValueError("To account not found")
-            # Normalize currency/status checks
-            try:
-                from_currency = str(getattr(from_acc, 'currency', '')).strip().upper()
-            except Exception:
-                from_currency = None
-            try:
-                to_currency = str(getattr(to_acc, 'currency', '')).strip().upper()
-            except Exception:
-                to_currency = None
-            if from_currency != str(currency).strip().upper() or to_currency != str(currency).strip().upper():
-                raise ValueError(f"Currency mismatch (from={repr(getattr(from_acc, 'currency', None))} to={repr(getattr(to_acc, 'currency', None))} expected={repr(currency)})")
-            try:
-                from_status = str(getattr(from_acc, 'status', '')).strip().lower()
-            except Exception:
-                from_status = None
-            try:
-                to_status = str(getattr(to_acc, 'status', '')).strip().lower()
-            except Exception:
-                to_status = None
-            if from_status not in ('active', 'frozen') or to_status not in ('active', 'frozen'):
-                raise ValueError(f"One of accounts is not active or frozen (from_status={repr(getattr(from_acc, 'status', None))} to_status={repr(getattr(to_acc, 'status', None))})")
-            if from_acc.balance < amount:
-                raise ValueError("Insufficient funds")
-
-            # 相手口座情報を取得
-            to_branch_code = getattr(to_acc.branch, 'code', '') if to_acc.branch else ''
-            other_account_info = f"{to_branch_code}-{to_acc.account_number}" if to_branch_code else to_acc.account_number
-
-            # トランザクションレコード作成
-            tx = Transaction(
-                from_account_id=from_acc.account_id,
-                to_account_id=to_acc.account_id,
-                amount=amount,
-                currency=currency,
-                type='transfer',
-                status='completed',
-                description=description,  # 摘要を追加
-                other_account_number=other_account_info,  # 相手口座を追加
-                executed_at=now_jst(),
-            )
-            db.add(tx)
-            db.flush()  # tx.transaction_id を得るため
+    return run_with_retry(
+        'transfer_funds',
+        lambda: _transfer_funds_once(from_account_number, to_account_number, amount, currency, description),
+    )
 
-            # 二重仕訳エントリ
-            debit_entry = TransactionEntry(
-                transaction_id=tx.transaction_id,
-                account_id=from_acc.account_id,
-                entry_type='debit',
-                amount=amount,
-            )
-            credit_entry = TransactionEntry(
-                transaction_id=tx.transaction_id,
-                account_id=to_acc.account_id,
-                entry_type='credit',
-                amount=amount,
-            )
-            db.add_all([debit_entry, credit_entry])
-
-            # 残高更新
-            from_acc.balance = from_acc.balance - amount
-            to_acc.balance = to_acc.balance + amount
-
-        # commit は with db.begin() で行われる
-        # セッション外でアクセスされる前に transaction_id を抽出
-        transaction_id = tx.transaction_id
-        
-        return {
-            'transaction_id': transaction_id,
-            'from_account_id': from_acc.account_id,
-            'to_account_id': to_acc.account_id,
-            'amount': amount,
-            'currency': currency,
-            'status': 'completed'
-        }
 
+def _transfer_funds_once(from_account_number: str, to_account_number: str, amount: Decimal, currency: str, description: str):
+    db = SessionLocal()
+    try:
+        with db.begin():
+            return post_transfer(db, from_account_number, to_account_number, amount, currency, description)
     except Exception as e:
         db.rollback()
-        print(f"[BankService] transfer_funds failed: {e}")
+        if retryable_reason(e) is None:
+            print(f"[BankService] transfer_funds failed: {e}")
         raise
     finally:
         db.close()
 
 
+def post_transfer(db: Session, from_account_number: str, to_account_number: str, amount: Decimal,
+                  currency: str = 'JPY', description: str = None) -> dict:
+    """
+    送金を記帳する（db のトランザクション内で呼ぶ。コミット・再実行は呼び出し側）
+
+    送金と同じトランザクションで他の記録（配当金の支払い記録など）を書く場合に使う。
+    単独の送金は transfer_funds を使う。
+    """
+    amount = Decimal(amount)
+    # 送金元・送金先を1回のクエリで account_id 順にロックして取得
+    # 送金先がシステム口座ならロックせず、入金はバケットに分散する
+    credit_to_bucket = hot_accounts.is_hot(to_account_number) and to_account_number != from_account_number
+    if credit_to_bucket:
+        accounts = lock_accounts(db, [from_account_number], 'transfer_funds')
+        accounts[to_account_number] = db.execute(
+            select(Account).filter_by(account_number=to_account_number)
+        ).scalars().first()
+    else:
+        accounts = lock_accounts(db, [from_account_number, to_account_number], 'transfer_funds')
+    from_acc = accounts.get(from_account_number)
+    to_acc = accounts.get(to_account_number)
+
+    if not from_acc:
+        raise ValueError("From account not found")
+    if not to_acc:
+        raise ValueError("To account not found")
+    # Normalize currency/status checks
+    try:
+        from_currency = str(getattr(from_acc, 'currency', '')).strip().upper()
+    except Exception:
+        from_currency = None
+    try:
+        to_currency = str(getattr(to_acc, 'currency', '')).strip().upper()
+    except Exception:
+        to_currency = None
+    if from_currency != str(currency).strip().upper() or to_currency != str(currency).strip().upper():
+        raise ValueError(f"Currency mismatch (from={repr(getattr(from_acc, 'currency', None))} to={repr(getattr(to_acc, 'currency', None))} expected={repr(currency)})")
+    try:
+        from_status = str(getattr(from_acc, 'status', '')).strip().lower()
+    except Exception:
+        from_status = None
+    try:
+        to_status = str(getattr(to_acc, 'status', '')).strip().lower()
+    except Exception:
+        to_status = None
+    if from_status not in ('active', 'frozen') or to_status not in ('active', 'frozen'):
+        raise ValueError(f"One of accounts is not active or frozen (from_status={repr(getattr(from_acc, 'status', None))} to_status={repr(getattr(to_acc, 'status', None))})")
+    hot_accounts.ensure_funds(db, from_acc, amount)
+    if from_acc.balance < amount:
+        raise ValueError("Insufficient funds")
+
+    # 相手口座情報を取得
+    to_branch_code = getattr(to_acc.branch, 'code', '') if to_acc.branch else ''
+    other_account_info = f"{to_branch_code}-{to_acc.account_number}" if to_branch_code else to_acc.account_number
+
+    # トランザクションレコード作成
+    tx = Transaction(
+        from_account_id=from_acc.account_id,
+        to_account_id=to_acc.account_id,
+        amount=amount,
+        currency=currency,
+        type='transfer',
+        status='completed',
+        description=description,  # 摘要を追加
+        other_account_number=other_account_info,  # 相手口座を追加
+        executed_at=now_jst(),
+    )
+    db.add(tx)
+    db.flush()  # tx.transaction_id を得るため
+
+    # 二重仕訳エントリ
+    debit_entry = TransactionEntry(
+        transaction_id=tx.transaction_id,
+        account_id=from_acc.account_id,
+        entry_type='debit',
+        amount=amount,
+    )
+    credit_entry = TransactionEntry(
+        transaction_id=tx.transaction_id,
+        account_id=to_acc.account_id,
+        entry_type='credit',
+        amount=amount,
+    )
+    db.add_all([debit_entry, credit_entry])
+
+    # 残高更新
+    from_acc.balance = from_acc.balance - amount
+    if credit_to_bucket:
+        hot_accounts.credit(db, to_acc.account_id, amount)
+    else:
+        to_acc.balance = to_acc.balance + amount
+
+    return {
+        'transaction_id': tx.transaction_id,
+        'from_account_id': from_acc.account_id,
+        'to_account_id': to_acc.account_id,
+        'amount': amount,
+        'currency': currency,
+        'status': 'completed'
+    }
+
+
 def get_active_account_by_user(user_id: str):
     """ユーザーIDからアクティブな口座を取得するヘルパー。見つからなければ None を返す。
     注: active または frozen の口座のみを返す（closed は除外）
@@ -408,47 +464,56 @@ def get_active_account_by_user(user_id: str):
         db.close()
 
 
+# 口座情報の辞書に使う列（支店と、システム口座のバケットを含む残高まで1回のクエリで取得する）
+_ACCOUNT_INFO_COLUMNS = (
+    Account.account_id,
+    Account.account_number,
+    hot_accounts.balance_column(),
+    Account.currency,
+    Account.type,
+    Account.status,
+    Account.created_at,
+    Branch.code.label('branch_code'),
+    Branch.name.label('branch_name'),
+)
+
+
+def _account_info(row) -> dict:
+    """_ACCOUNT_INFO_COLUMNS の行を口座情報の辞書にする"""
+    return {
+        'account_id': row.account_id,
+        'account_number': row.account_number,
+        'balance': format(row.balance, '.2f') if row.balance is not None else None,
+        'currency': row.currency,
+        'type': row.type,
+        'branch_code': row.branch_code,
+        'branch_name': row.branch_name,
+        'status': row.status,
+        'created_at': row.created_at,
+    }
+
+
 def get_account_info_by_user(user_id: str):
     """ユーザーIDから口座の主要情報を辞書で返す。口座が無ければ None を返す。
     注: active または frozen の口座のみを返す（closed は除外）
     """
     db = SessionLocal()
     try:
-        acc = db.execute(select(Account).filter_by(user_id=user_id)).scalars().first()
-        if not acc:
+        row = db.execute(
+            select(*_ACCOUNT_INFO_COLUMNS)
+            .outerjoin(Branch, Branch.branch_id == Account.branch_id)
+            .where(Account.user_id == user_id)
+            .order_by(Account.account_id)
+            .limit(1)
+        ).first()
+        if not row:
             return None
 
         # closedの口座は除外
-        status = getattr(acc, 'status', None)
-        if status == 'closed':
+        if row.status == 'closed':
             return None
 
-        # branch はリレーション経由で取得可能（セッション内）
-        branch_code = None
-        branch_name = None
-        try:
-            if getattr(acc, 'branch', None):
-                branch_code = getattr(acc.branch, 'code', None)
-                branch_name = getattr(acc.branch, 'name', None)
-        except Exception:
-            branch_code = None
-            branch_name = None
-
-        balance = getattr(acc, 'balance', None)
-        balance_str = format(balance, '.2f') if balance is not None else None
-
-        info = {
-            'account_id': getattr(acc, 'account_id', None),
-            'account_number': getattr(acc, 'account_number', None),
-            'balance': balance_str,
-            'currency': getattr(acc, 'currency', None),
-            'type': getattr(acc, 'type', None),
-            'branch_code': branch_code,
-            'branch_name': branch_name,
-            'status': status,
-            'created_at': getattr(acc, 'created_at', None),
-        }
-        return info
+        return _account_info(row)
     finally:
         db.close()
 
@@ -463,18 +528,13 @@ def get_account_ids_by_user(user_id: str):
 
     db = SessionLocal()
     try:
-        all_accounts = db.execute(select(Account).filter_by(user_id=user_id)).scalars().all()
-        accounts = [acc for acc in all_accounts if getattr(acc, 'status', None) in ('active', 'frozen')]
-
         # できるだけ決定的な順序にする（DBの返却順が不安定な環境を考慮）
-        accounts.sort(key=lambda a: getattr(a, 'account_id', 0) or 0)
-
-        result = []
-        for acc in accounts:
-            aid = getattr(acc, 'account_id', None)
-            if aid is not None:
-                result.append(aid)
-        return result
+        rows = db.execute(
+            select(Account.account_id, Account.status)
+            .where(Account.user_id == user_id)
+            .order_by(Account.account_id)
+        ).all()
+        return [row.account_id for row in rows if row.status in ('active', 'frozen')]
     finally:
         db.close()
 
@@ -501,50 +561,21 @@ def get_accounts_by_account_ids(account_ids: list):
 
     db = SessionLocal()
     try:
-        accounts = (
-            db.execute(select(Account).where(Account.account_id.in_(normalized_ids)))
-            .scalars()
-            .all()
-        )
+        # 名義も同じクエリで取得
+        rows = db.execute(
+            select(*_ACCOUNT_INFO_COLUMNS, Customer.full_name)
+            .outerjoin(Branch, Branch.branch_id == Account.branch_id)
+            .outerjoin(Customer, Customer.customer_id == Account.customer_id)
+            .where(Account.account_id.in_(normalized_ids))
+        ).all()
 
         info_by_id = {}
-        for acc in accounts:
-            status = getattr(acc, 'status', None)
-            if status not in ('active', 'frozen'):
+        for row in rows:
+            if row.status not in ('active', 'frozen'):
                 continue
-
-            branch_code = None
-            branch_name = None
-            try:
-                if getattr(acc, 'branch', None):
-                    branch_code = getattr(acc.branch, 'code', None)
-                    branch_name = getattr(acc.branch, 'name', None)
-            except Exception:
-                branch_code = None
-                branch_name = None
-
-            balance = getattr(acc, 'balance', None)
-            balance_str = format(balance, '.2f') if balance is not None else None
-
-            full_name = None
-            try:
-                if hasattr(acc, 'customer') and acc.customer:
-                    full_name = getattr(acc.customer, 'full_name', None)
-            except Exception:
-                full_name = None
-
-            info_by_id[getattr(acc, 'account_id', None)] = {
-                'account_id': getattr(acc, 'account_id', None),
-                'account_number': getattr(acc, 'account_number', None),
-                'balance': balance_str,
-                'currency': getattr(acc, 'currency', None),
-                'type': getattr(acc, 'type', None),
-                'branch_code': branch_code,
-                'branch_name': branch_name,
-                'status': status,
-                'created_at': getattr(acc, 'created_at', None),
-                'full_name': full_name,
-            }
+            info = _account_info(row)
+            info['full_name'] = row.full_name
+            info_by_id[row.account_id] = info
 
         # 入力順を維持して返す
         result = []
@@ -560,6 +591,7 @@ def get_accounts_by_account_ids(account_ids: list):
 def get_account_transactions_by_account(account_number: str, branch_code: str, limit: int = 20):
     """指定口座の取引履歴（最近のものから）をリストで返す。
     各要素は dict を返す。口座が無ければ空リストを返す。
+    続きのページが必要な場合は passbook.get_passbook_page を使う。
 
     Args:
         account_number: 口座番号
@@ -569,77 +601,7 @@ def get_account_transactions_by_account(account_number: str, branch_code: str, l
     Returns:
         取引履歴辞書のリスト
     """
-    db = SessionLocal()
-    try:
-        # 支店情報を取得
-        branch = db.execute(select(Branch).filter_by(code=str(branch_code))).scalars().first()
-        if not branch:
-            return []
-
-        # 口座を取得（active/frozenのみ、closedは除外）
-        acc = db.execute(
-            select(Account).filter_by(
-                account_number=account_number,
-                branch_id=branch.branch_id
-            )
-        ).scalars().first()
-        if not acc:
-            return []
-        # closedの口座は除外
-        status = getattr(acc, 'status', None)
-        if status == 'closed':
-            return []
-
-        # 口座関係のトランザクションを取得（from または to）でcompletedのみ
-        txs = (
-            db.execute(
-                select(Transaction)
-                .filter(
-                    ((Transaction.from_account_id == acc.account_id) | (Transaction.to_account_id == acc.account_id)),
-                    Transaction.status == 'completed'
-                )
-                .order_by(Transaction.executed_at.desc().nullslast(), Transaction.created_at.desc())
-                .limit(limit)
-            )
-            .scalars()
-            .all()
-        )
-
-        result = []
-        for t in txs:
-            try:
-                direction = '出金' if t.from_account_id == acc.account_id else '入金'
-
-                # 相手口座番号を取得（優先順位: other_account_number > リレーション）
-                other_acc_num = getattr(t, 'other_account_number', None)
-                if not other_acc_num:
-                    try:
-                        if t.from_account_id == acc.account_id:
-                            other_acc_num = getattr(t.to_account, 'account_number', None)
-                        else:
-                            other_acc_num = getattr(t.from_account, 'account_number', None)
-                    except Exception:
-                        other_acc_num = None
-
-                dt = t.executed_at if getattr(t, 'executed_at', None) else getattr(t, 'created_at', None)
-
-                result.append({
-                    'transaction_id': getattr(t, 'transaction_id', None),
-                    'direction': direction,
-                    'type': getattr(t, 'type', None),
-                    'amount': format(getattr(t, 'amount', 0), '.2f'),
-                    'currency': getattr(t, 'currency', None),
-                    'other_account_number': other_acc_num,
-                    'description': getattr(t, 'description', None),
-                    'executed_at': dt,
-                    'status': getattr(t, 'status', None),
-                })
-            except Exception:
-                continue
-
-        return result
-    finally:
-        db.close()
+    return get_passbook_page(account_number, branch_code, limit)['items']
 
 
 def get_account_transactions_by_user(user_id: str, limit: int = 20):
@@ -649,32 +611,7 @@ def get_account_transactions_by_user(user_id: str, limit: int = 20):
     Note: この関数は後方互換性のために残しています。
           新しいコードでは get_account_transactions_by_account を使用してください。
     """
-    db = SessionLocal()
-    try:
-        # 口座を取得（active/frozenのみ、closedは除外）
-        acc = db.execute(select(Account).filter_by(user_id=user_id)).scalars().first()
-        if not acc:
-            return []
-        # closedの口座は除外
-        status = getattr(acc, 'status', None)
-        if status == 'closed':
-            return []
-
-        # 支店情報を取得
-        branch_code = None
-        try:
-            if getattr(acc, 'branch', None):
-                branch_code = getattr(acc.branch, 'code', None)
-        except Exception:
-            return []
-
-        if not branch_code:
-            return []
-
-        # 新しい関数を使用
-        return get_account_transactions_by_account(acc.account_number, branch_code, limit)
-    finally:
-        db.close()
+    return get_passbook_page_by_user(user_id, limit)['items']
 
 
 def reply_account_creation(event, account_info: dict, account_data: dict):
@@ -855,6 +792,7 @@ def withdraw_by_account_number(account_number: str, branch_code: str, amount, cu
                 raise ValueError(f"Account not active or frozen (status={repr(getattr(acc, 'status', None))})")
 
             # 残高チェック
+            hot_accounts.ensure_funds(db, acc, amt)
             if acc.balance < amt:
                 raise ValueError("Insufficient funds")
 
@@ -983,12 +921,10 @@ def deposit_by_account_number(account_number: str, branch_code: str, amount, cur
             if not branch:
                 raise ValueError(f"Branch not found: {branch_code}")
 
-            # 口座番号と支店IDで口座を取得してロック
-            acc = db.execute(
-                select(Account)
-                .filter_by(account_number=account_number, branch_id=branch.branch_id)
-                .with_for_update()
-            ).scalars().first()
+            # 口座番号と支店IDで口座を取得してロック（システム口座はロックせずバケットに入金）
+            credit_to_bucket = hot_accounts.is_hot(account_number)
+            query = select(Account).filter_by(account_number=account_number, branch_id=branch.branch_id)
+            acc = db.execute(query if credit_to_bucket else query.with_for_update()).scalars().first()
 
             if not acc:
                 raise ValueError(f"Account not found: {account_number} at branch {branch_code}")
@@ -1010,7 +946,10 @@ def deposit_by_account_number(account_number: str, branch_code: str, amount, cur
                 raise ValueError(f"Account not active or frozen (status={repr(getattr(acc, 'status', None))})")
 
             # 残高を更新
-            acc.balance = acc.balance + amt
+            if credit_to_bucket:
+                hot_accounts.credit(db, acc.account_id, amt)
+            else:
+                acc.balance = acc.balance + amt
 
             # トランザクションレコード作成(入金)
             tx = Transaction(
@@ -1062,11 +1001,9 @@ def deposit_by_account_number_return_tx_id(
             if not branch:
                 raise ValueError(f"Branch not found: {branch_code}")
 
-            acc = db.execute(
-                select(Account)
-                .filter_by(account_number=account_number, branch_id=branch.branch_id)
-                .with_for_update()
-            ).scalars().first()
+            credit_to_bucket = hot_accounts.is_hot(account_number)
+            query = select(Account).filter_by(account_number=account_number, branch_id=branch.branch_id)
+            acc = db.execute(query if credit_to_bucket else query.with_for_update()).scalars().first()
             if not acc:
                 raise ValueError(f"Account not found: {account_number} at branch {branch_code}")
 
@@ -1078,7 +1015,10 @@ def deposit_by_account_number_return_tx_id(
             if acc_status not in ('active', 'frozen'):
                 raise ValueError("Account not active or frozen")
 
-            acc.balance = acc.balance + amt
+            if credit_to_bucket:
+                hot_accounts.credit(db, acc.account_id, amt)
+            else:
+                acc.balance = acc.balance + amt
 
             tx = Transaction(
                 from_account_id=None,
@@ -1192,6 +1132,7 @@ def batch_withdraw(withdrawals: list) -> dict:
     """
     複数口座からの一括引き落とし処理。
     全て成功するか、全て失敗するかのアトミックな操作。
+    件数によらない数の SQL でまとめて記帳する（bulk_posting.post_batch）。
 
     Args:
         withdrawals: [
@@ -1203,96 +1144,18 @@ def batch_withdraw(withdrawals: list) -> dict:
         {
             'success': True/False,
             'completed': [list of account_numbers],
-            'failed': [{'account_number': str, 'error': str}, ...],
+            'failed': [{'account_number': str, 'error': str}, ...],  # 検証に失敗した全項目
             'total_amount': Decimal
         }
     """
-    db = SessionLocal()
-    amt_total = Decimal('0')
-    completed = []
-
-    try:
-        with db.begin():
-            for w in withdrawals:
-                account_number = w['account_number']
-                branch_code = w['branch_code']
-                amount = Decimal(str(w['amount']))
-
-                # 支店取得
-                branch = db.execute(
-                    select(Branch).filter_by(code=str(branch_code))
-                ).scalars().first()
-                if not branch:
-                    raise ValueError(f"Branch not found: {branch_code}")
-
-                # 口座ロックして取得
-                acc = db.execute(
-                    select(Account)
-                    .filter_by(account_number=account_number, branch_id=branch.branch_id)
-                    .with_for_update()
-                ).scalars().first()
-
-                if not acc:
-                    raise ValueError(f"Account not found: {account_number}")
-
-                acc_status = str(getattr(acc, 'status', '')).strip().lower()
-                if acc_status not in ('active', 'frozen'):
-                    raise ValueError(f"Account not active or frozen: {account_number}")
-
-                if acc.balance < amount:
-                    raise ValueError(f"Insufficient funds: {account_number} (balance: {acc.balance}, required: {amount})")
-
-                # 残高更新
-                acc.balance -= amount
-                amt_total += amount
-
-                # トランザクション記録
-                tx = Transaction(
-                    from_account_id=acc.account_id,
-                    amount=amount,
-                    currency='JPY',
-                    type='withdrawal',
-                    status='completed',
-                    executed_at=now_jst(),
-                )
-                db.add(tx)
-                db.flush()
-
-                # 仕訳エントリ
-                entry = TransactionEntry(
-                    transaction_id=tx.transaction_id,
-                    account_id=acc.account_id,
-                    entry_type='debit',
-                    amount=amount,
-                )
-                db.add(entry)
-
-                completed.append(account_number)
-
-        return {
-            'success': True,
-            'completed': completed,
-            'failed': [],
-            'total_amount': amt_total
-        }
-
-    except Exception as e:
-        db.rollback()
-        print(f"[BankService] batch_withdraw failed: {e}")
-        return {
-            'success': False,
-            'completed': [],
-            'failed': [{'error': str(e)}],
-            'total_amount': Decimal('0')
-        }
-    finally:
-        db.close()
+    return _run_batch_posting(withdrawals, WITHDRAWAL, 'batch_withdraw')
 
 
 def batch_deposit(deposits: list) -> dict:
     """
     複数口座への一括入金処理。
     全て成功するか、全て失敗するかのアトミックな操作。
+    件数によらない数の SQL でまとめて記帳する（bulk_posting.post_batch）。
 
     Args:
         deposits: [
@@ -1304,84 +1167,43 @@ def batch_deposit(deposits: list) -> dict:
         {
             'success': True/False,
             'completed': [list of account_numbers],
-            'failed': [{'account_number': str, 'error': str}, ...],
+            'failed': [{'account_number': str, 'error': str}, ...],  # 検証に失敗した全項目
             'total_amount': Decimal
         }
     """
-    db = SessionLocal()
-    amt_total = Decimal('0')
-    completed = []
-
-    try:
-        with db.begin():
-            for d in deposits:
-                account_number = d['account_number']
-                branch_code = d['branch_code']
-                amount = Decimal(str(d['amount']))
-
-                # 支店取得
-                branch = db.execute(
-                    select(Branch).filter_by(code=str(branch_code))
-                ).scalars().first()
-                if not branch:
-                    raise ValueError(f"Branch not found: {branch_code}")
-
-                # 口座ロックして取得
-                acc = db.execute(
-                    select(Account)
-                    .filter_by(account_number=account_number, branch_id=branch.branch_id)
-                    .with_for_update()
-                ).scalars().first()
-
-                if not acc:
-                    raise ValueError(f"Account not found: {account_number}")
-
-                acc_status = str(getattr(acc, 'status', '')).strip().lower()
-                if acc_status not in ('active', 'frozen'):
-                    raise ValueError(f"Account not active or frozen: {account_number}")
-
-                # 残高更新
-                acc.balance += amount
-                amt_total += amount
-
-                # トランザクション記録
-                tx = Transaction(
-                    to_account_id=acc.account_id,
-                    amount=amount,
-                    currency='JPY',
-                    type='deposit',
-                    status='completed',
-                    executed_at=now_jst(),
-                )
-                db.add(tx)
-                db.flush()
+    return _run_batch_posting(deposits, DEPOSIT, 'batch_deposit')
 
-                # 仕訳エントリ
-                entry = TransactionEntry(
-                    transaction_id=tx.transaction_id,
-                    account_id=acc.account_id,
-                    entry_type='credit',
-                    amount=amount,
-                )
-                db.add(entry)
 
-                completed.append(account_number)
+def _run_batch_posting(items: list, kind: str, name: str) -> dict:
+    def post_once():
+        db = SessionLocal()
+        try:
+            with db.begin():
+                post_batch(db, items, kind)
+        finally:
+            db.close()
 
+    try:
+        run_with_retry(name, post_once)
+    except BulkPostingError as e:
+        print(f"[BankService] {name} failed: {e}")
         return {
-            'success': True,
-            'completed': completed,
-            'failed': [],
-            'total_amount': amt_total
+            'success': False,
+            'completed': [],
+            'failed': e.failed,
+            'total_amount': Decimal('0')
         }
-
     except Exception as e:
-        db.rollback()
-        print(f"[BankService] batch_deposit failed: {e}")
+        print(f"[BankService] {name} failed: {e}")
         return {
             'success': False,
             'completed': [],
             'failed': [{'error': str(e)}],
             'total_amount': Decimal('0')
         }
-    finally:
-        db.close()
+    return {
+        'success': True,
+        'completed': [item['account_number'] for item in items],
+        'failed': [],
+        'total_amount': sum((Decimal(str(item['amount'])) for item in items), Decimal('0'))
+    }
@@ -0,0 +1,156 @@
+"""
+口座への一括記帳（入金/引き落とし）
+
+件数に比例した往復をせず、件数によらない数の SQL で記帳する。
+1. 対象口座を支店と合わせて1回のクエリで取得し、account_id 順に行ロックする
+2. 全件を検証する（失敗は項目ごとにすべて集め、1件でもあれば何も書き込まない）
+3. 残高を UPDATE ... FROM (VALUES ...) の1文で更新する
+4. transactions を複数行 INSERT ... RETURNING で挿入して取引IDを得て、
+   transaction_entries も複数行 INSERT で挿入する
+"""
+import time
+from decimal import Decimal
+from typing import Dict, List
+
+from sqlalchemy import BigInteger, Numeric, column, func, insert, select, update, values
+from sqlalchemy.orm import Session
+
+from apps.banking.hot_accounts import hot_accounts
+from apps.banking.main_bank_system import Account, Branch, Transaction, TransactionEntry
+from apps.utilities.timezone_utils import now_jst
+from core.db import record_lock_wait
+
+DEPOSIT = 'deposit'
+WITHDRAWAL = 'withdrawal'
+
+# 記帳の種類 -> (取引の口座列, 仕訳の貸借)
+_POSTING_SIDES = {
+    DEPOSIT: ('to_account_id', 'credit'),
+    WITHDRAWAL: ('from_account_id', 'debit'),
+}
+
+
+class BulkPostingError(Exception):
+    """検証に失敗した項目がある（何も書き込んでいない）"""
+
+    def __init__(self, failed: List[Dict]):
+        super().__init__(f"{len(failed)} item(s) failed: {failed[0]['error']}")
+        self.failed = failed
+
+
+def post_batch(db: Session, items: list, kind: str) -> List[int]:
+    """
+    複数口座への入金/引き落としを記帳する（db のトランザクション内で呼ぶ）
+
+    Args:
+        db: 銀行DBセッション
+        items: [{'account_number': str, 'branch_code': str, 'amount': Decimal or int}, ...]
+        kind: DEPOSIT または WITHDRAWAL
+
+    Returns:
+        List[int]: items と同じ順の取引ID
+
+    Raises:
+        BulkPostingError: 検証に失敗した項目がある場合（failed に項目ごとのエラー）
+    """
+    account_column, entry_type = _POSTING_SIDES[kind]
+    postings = [
+        (str(item['account_number']), str(item['branch_code']), Decimal(str(item['amount'])))
+        for item in items
+    ]
+    if not postings:
+        return []
+
+    # 1. 支店と合わせて取得し、account_id 順にロック
+    start = time.perf_counter()
+    rows = db.execute(
+        select(Account.account_id, Account.account_number, Account.balance, Account.status, Branch.code)
+        .join(Branch, Account.branch_id == Branch.branch_id)
+        .where(Account.account_number.in_({p[0] for p in postings}))
+        .order_by(Account.account_id)
+        .with_for_update(of=Account)
+    ).all()
+    record_lock_wait(f'batch_{kind}', time.perf_counter() - start)
+    accounts = {row.account_number: row for row in rows}
+
+    # 2. 検証（同じ口座が複数回あれば、引き落としは前の項目を引いた残高で判定する）
+    missing_branches = set()
+    if any(p[0] not in accounts or accounts[p[0]].code != p[1] for p in postings):
+        known = set(db.execute(select(Branch.code).where(Branch.code.in_({p[1] for p in postings}))).scalars())
+        missing_branches = {p[1] for p in postings} - known
+
+    balances = {row.account_id: row.balance for row in rows}
+    # システム口座からの引き落としで行の残高が足りなければ、送金と同じくバケットを寄せる
+    folded: Dict[int, Decimal] = {}
+    if kind == WITHDRAWAL:
+        required: Dict[str, Decimal] = {}
+        for account_number, _, amount in postings:
+            required[account_number] = required.get(account_number, Decimal('0')) + amount
+        for account_number, amount in required.items():
+            row = accounts.get(account_number)
+            if row is not None and row.balance < amount and hot_accounts.is_hot(account_number):
+                folded[row.account_id] = hot_accounts.take_buckets(db, row.account_id)
+                balances[row.account_id] += folded[row.account_id]
+    failed = []
+    for account_number, branch_code, amount in postings:
+        acc = accounts.get(account_number)
+        if branch_code in missing_branches:
+            error = f"Branch not found: {branch_code}"
+        elif acc is None or acc.code != branch_code:
+            error = f"Account not found: {account_number}"
+        elif str(acc.status or '').strip().lower() not in ('active', 'frozen'):
+            error = f"Account not active or frozen: {account_number}"
+        elif kind == WITHDRAWAL and balances[acc.account_id] < amount:
+            error = f"Insufficient funds: {account_number} (balance: {balances[acc.account_id]}, required: {amount})"
+        else:
+            balances[acc.account_id] += amount if kind == DEPOSIT else -amount
+            continue
+        failed.append({'account_number': account_number, 'error': error})
+    if failed:
+        raise BulkPostingError(failed)
+
+    # 3. 残高を1文で更新（寄せたバケットの分も加える）
+    deltas: Dict[int, Decimal] = dict(folded)
+    for account_number, _, amount in postings:
+        account_id = accounts[account_number].account_id
+        deltas[account_id] = deltas.get(account_id, Decimal('0')) + (amount if kind == DEPOSIT else -amount)
+    delta_rows = values(
+        column('account_id', BigInteger), column('delta', Numeric(18, 2)), name='deltas',
+    ).data(sorted(deltas.items()))
+    accounts_table = Account.__table__
+    db.execute(
+        update(accounts_table)
+        .where(accounts_table.c.account_id == delta_rows.c.account_id)
+        .values(balance=accounts_table.c.balance + delta_rows.c.delta, updated_at=func.now())
+    )
+
+    # 4. 取引と仕訳を複数行 INSERT
+    executed_at = now_jst()
+    tx_table = Transaction.__table__
+    transaction_ids = db.execute(
+        insert(tx_table).returning(tx_table.c.transaction_id, sort_by_parameter_order=True),
+        [
+            {
+                account_column: accounts[account_number].account_id,
+                'amount': amount,
+                'currency': 'JPY',
+                'type': kind,
+                'status': 'completed',
+                'executed_at': executed_at,
+            }
+            for account_number, _, amount in postings
+        ],
+    ).scalars().all()
+    db.execute(
+        insert(TransactionEntry.__table__),
+        [
+            {
+                'transaction_id': transaction_id,
+                'account_id': accounts[account_number].account_id,
+                'entry_type': entry_type,
+                'amount': amount,
+            }
+            for transaction_id, (account_number, _, amount) in zip(transaction_ids, postings)
+        ],
+    )
+    return transaction_ids
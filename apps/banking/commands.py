@@ -128,12 +128,15 @@ def handle_passbook_by_account_ids(event, account_ids: list):
     line_bot_api.reply_message(event.reply_token, flex_message)
 
 
-def _display_transaction_history(event, account_number, branch_code):
-    """取引履歴をカルーセル形式で表示（内部関数）"""
-    txs = banking_api.get_transactions(account_number, branch_code, limit=20)
+def _display_transaction_history(event, account_number, branch_code, cursor=None):
+    """取引履歴をカルーセル形式で表示（内部関数）。続きがあれば最後のページに「次の20件」を付ける"""
+    page_data = banking_api.get_passbook_page(account_number, branch_code, limit=20, cursor=cursor)
+    txs = page_data['items']
+    next_cursor = page_data['next_cursor']
 
     if not txs:
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(text="この口座の取引履歴が見つかりません。"))
+        text = "これより前の取引履歴はありません。" if cursor else "この口座の取引履歴が見つかりません。"
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=text))
         return
 
     # 5件ずつ分割してカルーセル表示
@@ -214,6 +217,23 @@ def _display_transaction_history(event, account_number, branch_code):
                 "paddingAll": "18px"
             }
         }
+        if next_cursor and page_idx == len(pages) - 1:
+            bubble["footer"] = {
+                "type": "box",
+                "layout": "vertical",
+                "contents": [
+                    {
+                        "type": "button",
+                        "style": "link",
+                        "height": "sm",
+                        "action": {
+                            "type": "postback",
+                            "label": "次の20件",
+                            "data": f"action=view_passbook&branch_code={branch_code}&account_number={account_number}&cursor={next_cursor}",
+                        }
+                    }
+                ]
+            }
         bubbles.append(bubble)
 
     carousel = {
@@ -273,6 +293,7 @@ def handle_passbook_postback(event, data):
     """通帳表示のpostbackアクション処理"""
     # dataから口座情報を抽出
     # 形式: "action=view_passbook&branch_code=001&account_number=1234567"
+    # 次のページは "&cursor=..." が付く
     import urllib.parse
 
     params = {}
@@ -286,7 +307,7 @@ def handle_passbook_postback(event, data):
         account_number = params.get('account_number')
 
         if branch_code and account_number:
-            _display_transaction_history(event, account_number, branch_code)
+            _display_transaction_history(event, account_number, branch_code, params.get('cursor'))
         else:
             line_bot_api.reply_message(event.reply_token, TextSendMessage(text="口座情報の取得に失敗しました。"))
     else:
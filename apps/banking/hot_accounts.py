@@ -0,0 +1,204 @@
+"""
+システム口座の残高の分散（サブ元帳）
+
+準備預金・ショップ運営・給与支払元・税金の納付先・ミニゲーム運営口座は
+ほとんどのお金の動きの相手になるため、口座の行を FOR UPDATE すると全体がこの1行で直列化される。
+
+これらの口座（HOT_ACCOUNT_NUMBERS。未設定なら default_account_numbers()）への入金は、口座の行ではなく account_balance_buckets の
+HOT_ACCOUNT_BUCKETS 行のどれか1行（ラウンドロビン）に加算する。
+- 口座の残高 = accounts.balance + バケットの合計（balance_column）
+- 取引・仕訳（transactions / transaction_entries）は従来どおり口座ID宛てに記録するので、
+  帳簿は分散の有無によらず正確
+- 出金は口座の行をロックし、行の残高が足りなければバケットをその場で行に寄せてから判定する
+  （バケットが減るのは口座の行をロックして寄せるときだけなので、ロック中に合計が減ることはない）
+- 定期ジョブ（apps.banking.ledger_sweeper）がバケットを口座の行に寄せる
+ロックは常に 口座の行 → バケットの行 の順に取る。
+"""
+import itertools
+import random
+import threading
+import time
+from decimal import Decimal
+from typing import Callable, Dict, Any, FrozenSet, Iterable, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+import config
+from apps.banking.main_bank_system import SessionLocal, Account, AccountBalanceBucket
+from core.db import record_lock_wait, run_with_retry
+
+
+def default_account_numbers() -> List[str]:
+    """分散する口座の既定値（各機能が持つ口座番号の定数から作る）"""
+    from apps.banking.bank_service import RESERVE_ACCOUNT_NUMBER, MINIGAME_FEE_ACCOUNT
+    from apps.shop.shop_service import SHOP_OPERATIONS_ACCOUNT
+    from apps.work.work_service import WORK_PAYER_ACCOUNT_NUMBER
+    return [
+        RESERVE_ACCOUNT_NUMBER,
+        SHOP_OPERATIONS_ACCOUNT['account_number'],
+        WORK_PAYER_ACCOUNT_NUMBER,
+        config.TAX_DEST_ACCOUNT_NUMBER,
+        MINIGAME_FEE_ACCOUNT['account_number'],
+    ]
+
+
+class HotAccountLedger:
+    """システム口座の入金をバケットに分散する"""
+
+    def __init__(self, account_numbers: Callable[[], Iterable[str]], buckets: int):
+        """
+        Args:
+            account_numbers: 分散する口座番号を返す関数（循環 import を避けるため初回の参照時に呼ぶ）
+            buckets: 1口座あたりのバケット数（1 以下なら分散しない）
+        """
+        self._account_numbers_source = account_numbers
+        self._account_numbers: Optional[FrozenSet[str]] = None
+        self.buckets = max(1, buckets)
+        # プロセスごとに開始位置をずらし、複数ワーカーが同じバケットから使い始めないようにする
+        self._next_bucket = itertools.count(random.randrange(self.buckets))
+        self._lock = threading.Lock()
+        self._credits = 0
+        self._credited_amount = Decimal('0')
+        self._folds = 0
+        self._sweeps = 0
+        self._swept_amount = Decimal('0')
+        self._last_sweep_at: Optional[float] = None
+
+    @property
+    def account_numbers(self) -> FrozenSet[str]:
+        if self._account_numbers is None:
+            numbers = frozenset(str(n).strip() for n in self._account_numbers_source() if str(n).strip())
+            with self._lock:
+                if self._account_numbers is None:
+                    self._account_numbers = numbers
+        return self._account_numbers
+
+    def is_hot(self, account_number: str) -> bool:
+        return self.buckets > 1 and str(account_number) in self.account_numbers
+
+    # ---- 入金/出金（呼び出し側のトランザクション内で呼ぶ） ----
+
+    def credit(self, db: Session, account_id: int, amount: Decimal):
+        """口座の行をロックせず、バケットの1行に入金額を加算する"""
+        bucket_no = next(self._next_bucket) % self.buckets
+        stmt = pg_insert(AccountBalanceBucket).values(account_id=account_id, bucket_no=bucket_no, balance=amount)
+        start = time.perf_counter()
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[AccountBalanceBucket.account_id, AccountBalanceBucket.bucket_no],
+            set_={
+                'balance': AccountBalanceBucket.balance + stmt.excluded.balance,
+                'updated_at': func.now(),
+            },
+        ))
+        record_lock_wait('hot_account_credit', time.perf_counter() - start)
+        with self._lock:
+            self._credits += 1
+            self._credited_amount += amount
+
+    def fold(self, db: Session, acc: Account) -> Decimal:
+        """
+        バケットを口座の行に寄せる（acc は FOR UPDATE でロック済みであること）
+
+        Returns:
+            Decimal: 寄せた金額
+        """
+        total = self.take_buckets(db, acc.account_id)
+        if total:
+            acc.balance = acc.balance + total
+        return total
+
+    def take_buckets(self, db: Session, account_id: int) -> Decimal:
+        """
+        バケットを削除して合計を返す（口座の行はロック済みであること。
+        返した金額は呼び出し側が同じトランザクションで accounts.balance に加える）
+        """
+        amounts = db.execute(
+            delete(AccountBalanceBucket)
+            .where(AccountBalanceBucket.account_id == account_id)
+            .returning(AccountBalanceBucket.balance)
+        ).scalars().all()
+        with self._lock:
+            self._folds += 1
+        return sum(amounts, Decimal('0'))
+
+    def ensure_funds(self, db: Session, acc: Account, amount: Decimal):
+        """出金の前に呼ぶ: 口座の行の残高が足りなければバケットを寄せる（acc はロック済み）"""
+        if acc.balance < amount and self.is_hot(acc.account_number):
+            self.fold(db, acc)
+
+    # ---- 残高の参照 ----
+
+    def balance_column(self):
+        """
+        口座の残高（accounts.balance + バケットの合計）の列。
+        Account を含む select に加えれば、残高を追加のクエリなしで取得できる。
+        """
+        if self.buckets <= 1:
+            return Account.balance.label('balance')
+        bucket_sum = (
+            select(func.coalesce(func.sum(AccountBalanceBucket.balance), 0))
+            .where(AccountBalanceBucket.account_id == Account.account_id)
+            .correlate(Account)
+            .scalar_subquery()
+        )
+        return (Account.balance + bucket_sum).label('balance')
+
+    # ---- 定期的な寄せ ----
+
+    def sweep(self) -> Dict[str, Any]:
+        """全ての分散口座のバケットを口座の行に寄せる（口座ごとに1トランザクション）"""
+        swept = {}
+        for account_number in sorted(self.account_numbers):
+            try:
+                amount = run_with_retry('hot_account_sweep', lambda: self._sweep_one(account_number))
+            except Exception as e:
+                print(f"[HotAccounts] sweep failed account={account_number} err={e}")
+                continue
+            if amount is not None:
+                swept[account_number] = amount
+        with self._lock:
+            self._sweeps += 1
+            self._swept_amount += sum(swept.values(), Decimal('0'))
+            self._last_sweep_at = time.time()
+        return swept
+
+    def _sweep_one(self, account_number: str) -> Optional[Decimal]:
+        db = SessionLocal()
+        try:
+            with db.begin():
+                start = time.perf_counter()
+                acc = db.execute(
+                    select(Account).filter_by(account_number=account_number).with_for_update()
+                ).scalars().first()
+                record_lock_wait('hot_account_sweep', time.perf_counter() - start)
+                if acc is None:
+                    return None
+                return self.fold(db, acc)
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """分散と寄せの統計"""
+        accounts = len(self.account_numbers)
+        with self._lock:
+            return {
+                'accounts': accounts,
+                'buckets': self.buckets,
+                'credits': self._credits,
+                'credited_amount': float(self._credited_amount),
+                'folds': self._folds,
+                'sweeps': self._sweeps,
+                'swept_amount': float(self._swept_amount),
+                'last_sweep_age_seconds': (
+                    round(time.time() - self._last_sweep_at, 1) if self._last_sweep_at is not None else None
+                ),
+            }
+
+
+# グローバルインスタンス
+hot_accounts = HotAccountLedger(
+    account_numbers=lambda: config.HOT_ACCOUNT_NUMBERS.split(',') if config.HOT_ACCOUNT_NUMBERS.strip() else default_account_numbers(),
+    buckets=config.HOT_ACCOUNT_BUCKETS,
+)
@@ -0,0 +1,30 @@
+"""
+システム口座のバケットを口座の残高に寄せる定期ジョブ（統合スケジューラー core.scheduler に登録）
+
+寄せなくても残高（accounts.balance + バケットの合計）は正しいが、
+バケットの行が溜まり続けないよう、また accounts.balance を直接見る処理とのずれを小さくするため定期的に寄せる。
+"""
+import logging
+
+from apscheduler.triggers.interval import IntervalTrigger
+
+import config
+from apps.banking.hot_accounts import hot_accounts
+from core.scheduler import job_scheduler, TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+
+def run_sweep():
+    swept = hot_accounts.sweep()
+    moved = {number: amount for number, amount in swept.items() if amount}
+    if moved:
+        logger.info(f"[口座バケット] 寄せた金額: {moved}")
+
+
+if hot_accounts.buckets > 1:
+    job_scheduler.register(
+        'banking.sweep_hot_accounts', 'システム口座のバケット寄せ', run_sweep,
+        IntervalTrigger(seconds=config.HOT_ACCOUNT_SWEEP_INTERVAL, timezone=TIMEZONE),
+        misfire_grace_time=config.HOT_ACCOUNT_SWEEP_INTERVAL,
+    )
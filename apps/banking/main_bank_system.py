@@ -1,6 +1,5 @@
 from core.api import handler, line_bot_api
 from linebot.models import MessageEvent, TextMessage, TextSendMessage, ImageSendMessage
-import config
 import psycopg2
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 from sqlalchemy import (
@@ -10,7 +9,6 @@ from sqlalchemy import (
     String,
     Numeric,
     DateTime,
-    create_engine,
     func,
     text,
 )
@@ -18,15 +16,8 @@ from sqlalchemy.dialects.postgresql import ENUM as PG_ENUM
 from sqlalchemy import Integer, CHAR
 import datetime
 
-# データベースに接続するためのエンジンを作成
-# 接続プールの設定を追加してSSLエラーを回避
-engine = create_engine(
-    config.DATABASE_URL,
-    pool_pre_ping=True,  # 接続を使う前に有効性を確認
-    pool_recycle=3600,   # 1時間ごとに接続を再作成
-    pool_size=5,         # 接続プールサイズ
-    max_overflow=10      # 最大オーバーフロー接続数
-)
+# データベースエンジンはプロセス全体で共有する（接続プール設定は core/db.py）
+from core.db import engine
 
 Base = declarative_base()
 
@@ -237,6 +228,24 @@ class TransactionEntry(Base):
         return f"<TransactionEntry(entry_id={self.entry_id}, transaction_id={self.transaction_id}, account_id={self.account_id}, amount={self.amount})>"
 
 
+class AccountBalanceBucket(Base):
+    """account_balance_buckets テーブルの ORM 定義
+
+    システム口座への入金の分散先（apps.banking.hot_accounts）。
+    口座の残高は accounts.balance とこのテーブルの合計。
+    """
+
+    __tablename__ = 'account_balance_buckets'
+
+    account_id = Column(BigInteger, ForeignKey('accounts.account_id', ondelete='CASCADE'), primary_key=True)
+    bucket_no = Column(Integer, primary_key=True)
+    balance = Column(Numeric(18, 2), nullable=False, server_default=text('0'))
+    updated_at = Column(DateTime(timezone=True), server_default=text('now()'))
+
+    def __repr__(self):
+        return f"<AccountBalanceBucket(account_id={self.account_id}, bucket_no={self.bucket_no}, balance={self.balance})>"
+
+
 class MinigameChip(Base):
     """minigame_chips テーブルの ORM 定義
 
@@ -0,0 +1,138 @@
+"""
+通帳（取引履歴）のページ取得
+
+transactions を (from_account_id = X OR to_account_id = X) で探して executed_at で並べると
+インデックスが効かないため、口座ごとの仕訳 transaction_entries を
+(account_id, created_at DESC, entry_id DESC) のキーセットで辿る。
+- 口座の特定・取引・相手口座番号を1つのクエリで取得する（行ごとの追加クエリなし）
+- 次のページは前のページの最後の仕訳の (created_at, entry_id) より前を取る（OFFSET を使わない）
+- インデックスは migrations/create_passbook_indexes.sql、過去の取引の仕訳の補完は migrations/backfill_passbook_entries.sql
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Tuple
+
+from sqlalchemy import case, select, tuple_
+from sqlalchemy.orm import aliased
+
+from apps.banking.main_bank_system import SessionLocal, Account, Branch, Transaction, TransactionEntry
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# 1ページの最大件数
+MAX_PAGE_SIZE = 50
+
+
+def encode_cursor(created_at: datetime, entry_id: int) -> str:
+    """ページの最後の仕訳から次のページのカーソルを作る（postback に載せる短い文字列）"""
+    micros = (created_at - _EPOCH) // timedelta(microseconds=1)
+    return f"{micros}.{entry_id}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """カーソルを (created_at, entry_id) に戻す（不正な値は None = 先頭ページ）"""
+    if not cursor:
+        return None
+    try:
+        micros, entry_id = cursor.split('.', 1)
+        return _EPOCH + timedelta(microseconds=int(micros)), int(entry_id)
+    except (ValueError, OverflowError):
+        return None
+
+
+def get_passbook_page(account_number: str, branch_code: str, limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    口座の取引履歴を新しい順に1ページ分取得する（口座が無い・closed なら空）
+
+    Args:
+        account_number: 口座番号
+        branch_code: 支店コード
+        limit: 取得件数（最大 MAX_PAGE_SIZE）
+        cursor: 前のページの next_cursor（先頭ページは None）
+
+    Returns:
+        {'items': [取引履歴辞書, ...], 'next_cursor': str or None}
+    """
+    return _fetch_page(
+        [Account.account_number == str(account_number), Branch.code == str(branch_code)],
+        limit, cursor,
+    )
+
+
+def get_passbook_page_by_user(user_id: str, limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    ユーザーの口座（user_id の口座のうち account_id が最小のもの）の取引履歴を1ページ分取得する
+
+    口座が無い・closed・支店が無い場合は空。引数と戻り値は get_passbook_page と同じ。
+    """
+    first_account_id = (
+        select(Account.account_id).where(Account.user_id == user_id)
+        .order_by(Account.account_id).limit(1).correlate(None).scalar_subquery()
+    )
+    return _fetch_page([Account.account_id == first_account_id], limit, cursor)
+
+
+def _fetch_page(account_filters: list, limit: int, cursor: Optional[str]) -> Dict[str, Any]:
+    """口座の条件（Account / Branch の列）に合う口座の仕訳を1クエリで1ページ分取得する"""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    entry = TransactionEntry
+    tx = Transaction
+    counterpart = aliased(Account)
+    # 出金（debit）なら送金先、入金（credit）なら送金元が相手口座
+    counterpart_id = case((entry.entry_type == 'debit', tx.to_account_id), else_=tx.from_account_id)
+
+    stmt = (
+        select(
+            entry.entry_id,
+            entry.entry_type,
+            entry.amount,
+            entry.created_at.label('entry_created_at'),
+            tx.transaction_id,
+            tx.type,
+            tx.currency,
+            tx.description,
+            tx.other_account_number,
+            tx.executed_at,
+            tx.created_at,
+            tx.status,
+            counterpart.account_number.label('counterpart_number'),
+        )
+        .join(Account, Account.account_id == entry.account_id)
+        .join(Branch, Branch.branch_id == Account.branch_id)
+        .join(tx, tx.transaction_id == entry.transaction_id)
+        .outerjoin(counterpart, counterpart.account_id == counterpart_id)
+        .where(
+            *account_filters,
+            Account.status != 'closed',
+            tx.status == 'completed',
+        )
+        .order_by(entry.created_at.desc(), entry.entry_id.desc())
+        .limit(limit + 1)
+    )
+    position = decode_cursor(cursor)
+    if position is not None:
+        stmt = stmt.where(tuple_(entry.created_at, entry.entry_id) < tuple_(*position))
+
+    db = SessionLocal()
+    try:
+        rows = db.execute(stmt).all()
+    finally:
+        db.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [
+        {
+            'transaction_id': row.transaction_id,
+            'direction': '出金' if row.entry_type == 'debit' else '入金',
+            'type': row.type,
+            'amount': format(row.amount, '.2f'),
+            'currency': row.currency,
+            'other_account_number': row.other_account_number or row.counterpart_number,
+            'description': row.description,
+            'executed_at': row.executed_at or row.created_at,
+            'status': row.status,
+        }
+        for row in rows
+    ]
+    next_cursor = encode_cursor(rows[-1].entry_created_at, rows[-1].entry_id) if has_more else None
+    return {'items': items, 'next_cursor': next_cursor}
@@ -1,14 +1,17 @@
 """
 銀行機能専用セッション管理
 """
-from typing import Dict, Any, Optional
+from typing import Any, Optional
+
+import config
+from core.session_store import session_store
 
 
 class BankingSessionManager:
     """銀行機能のセッション管理クラス"""
 
     def __init__(self):
-        self._sessions: Dict[str, Any] = {}
+        self._sessions = session_store.namespace('banking', config.SESSION_TTL_BANKING)
 
     def get(self, user_id: str) -> Optional[Any]:
         """セッション取得"""
@@ -5,12 +5,13 @@ from datetime import datetime, timedelta, date
 from decimal import Decimal
 from typing import Any, Dict, Optional, List
 
-from sqlalchemy import select, func
+from sqlalchemy import select, func, event
 from sqlalchemy.exc import SQLAlchemyError
 
 import config
 from apps.banking.main_bank_system import SessionLocal, Account
 from apps.collections.models import CreditProfile, CollectionsCase, CollectionsAccrual, CollectionsEvent
+from apps.collections.notice_index import notice_index
 from apps.tax.models import TaxAssessment
 from apps.loans.models import Loan
 from apps.utilities.timezone_utils import now_jst
@@ -114,6 +115,7 @@ def ensure_loan_case_for_loan(*, db, user_id: str, loan_id: int, failed_since: d
     if not c.overdue_started_at:
         c.overdue_started_at = failed_since
     db.add(c)
+    _refresh_notice_after_commit(db, user_id)
     return c
 
 
@@ -127,53 +129,31 @@ def mark_case_resolved_if_exists(db, *, case_type: str, reference_id: int, note:
     c.resolved_at = now_jst()
     db.add(c)
     add_event(db, c.case_id, 'case_resolved', note=note)
+    _refresh_notice_after_commit(db, c.user_id)
 
 
 def get_inline_notice_text(user_id: str, now: Optional[datetime] = None) -> Optional[str]:
+    """督促通知文を取得（メモリ上の索引を引くだけで、通常は DB に問い合わせない）"""
     now = now or now_jst()
-    db = SessionLocal()
     try:
-        cases = db.execute(
-            select(CollectionsCase)
-            .where(CollectionsCase.user_id == user_id)
-            .where(CollectionsCase.status.in_(['overdue', 'seizure']))
-        ).scalars().all()
-
-        if not cases:
-            # loan overdue>=7 のために overdueケース自体はあるが、7日未満なら出さない
-            pending_loan = db.execute(
-                select(CollectionsCase)
-                .where(CollectionsCase.user_id == user_id)
-                .where(CollectionsCase.case_type == 'loan')
-                .where(CollectionsCase.status == 'overdue')
-            ).scalars().all()
-            if not pending_loan:
-                return None
-
-        # tax: 即表示
-        for c in cases:
-            if c.case_type == 'tax':
-                return '⚠️ 納税が未完了です。?税 で確認/納付してください。'
-
-        # loan: 7日目以降で表示
-        for c in db.execute(
-            select(CollectionsCase)
-            .where(CollectionsCase.user_id == user_id)
-            .where(CollectionsCase.case_type == 'loan')
-            .where(CollectionsCase.status == 'overdue')
-        ).scalars().all():
-            if not c.overdue_started_at:
-                continue
-            if (now - c.overdue_started_at).days >= 7:
-                return '⚠️ 借金の返済が滞っています。?借金 で返済してください。'
-
-        return None
+        return notice_index.notice_text(user_id, now)
     except SQLAlchemyError as e:
         # 権限不足等は通知を出せないだけなので黙ってスキップ
         print(f"[Collections] get_inline_notice_text failed user={user_id} err={e}")
         return None
-    finally:
-        db.close()
+
+
+def take_inline_notice(user_id: str, now: Optional[datetime] = None) -> Optional[str]:
+    """push すべき督促通知文を取得（同じユーザーには COLLECTIONS_NOTICE_PUSH_INTERVAL 秒に1回まで）"""
+    notice = get_inline_notice_text(user_id, now)
+    if notice and notice_index.should_push(user_id):
+        return notice
+    return None
+
+
+def _refresh_notice_after_commit(db, user_id: str):
+    """ケースの状態を変えたトランザクションのコミット後に、そのユーザーの督促通知の索引を読み直す"""
+    event.listen(db, 'after_commit', lambda session: notice_index.refresh_user(user_id), once=True)
 
 
 def _latest_accrual_end_date(db, case_id: int) -> Optional[date]:
@@ -352,6 +332,9 @@ def process_collections_daily(run_at: Optional[datetime] = None) -> Dict[str, An
                         seizures += 1
                         add_event(db, c.case_id, 'seizure_collected', meta={'seized': str(seized)})
 
+        # 延滞化・解決を督促通知の索引に反映
+        notice_index.load()
+
         return {
             'success': True,
             'transitioned_overdue': transitioned_overdue,
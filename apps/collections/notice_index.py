@@ -0,0 +1,161 @@
+"""
+督促通知の索引（ユーザーごとの未解決ケース）
+
+1:1 の全発言で行う督促通知の判定を DB に問い合わせずに済ませるため、
+通知対象になりうるケース（税: overdue/seizure、ローン: overdue）を
+ユーザー単位でメモリ上に保持する。
+日次の回収処理の後に全件を読み直し、ケースの解決・延滞化はコミット後にそのユーザー分だけ読み直す。
+再読み込みの仕組みは core.index_cache.ReloadableIndex。
+"""
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import config
+from core.index_cache import ReloadableIndex
+
+TAX_NOTICE = '⚠️ 納税が未完了です。?税 で確認/納付してください。'
+LOAN_NOTICE = '⚠️ 借金の返済が滞っています。?借金 で返済してください。'
+
+# ローンの延滞は overdue になってからこの日数以降に通知する
+LOAN_NOTICE_AFTER_DAYS = 7
+
+
+class _UserNotice:
+    """1ユーザー分の通知対象"""
+    __slots__ = ('tax', 'loan_overdue_since')
+
+    def __init__(self):
+        self.tax = False
+        # overdue 中のローンのうち最も古い延滞開始日時
+        self.loan_overdue_since: Optional[datetime] = None
+
+    def add(self, case_type: str, status: str, overdue_started_at: Optional[datetime]):
+        if case_type == 'tax' and status in ('overdue', 'seizure'):
+            self.tax = True
+        elif case_type == 'loan' and status == 'overdue' and overdue_started_at:
+            if self.loan_overdue_since is None or overdue_started_at < self.loan_overdue_since:
+                self.loan_overdue_since = overdue_started_at
+
+    def text(self, now: datetime) -> Optional[str]:
+        if self.tax:
+            return TAX_NOTICE
+        if self.loan_overdue_since is not None and (now - self.loan_overdue_since).days >= LOAN_NOTICE_AFTER_DAYS:
+            return LOAN_NOTICE
+        return None
+
+    def __bool__(self):
+        return self.tax or self.loan_overdue_since is not None
+
+
+class NoticeIndex(ReloadableIndex):
+    """督促通知の索引と push の頻度制限"""
+
+    def __init__(self, refresh_interval: int, push_interval: int):
+        """
+        Args:
+            refresh_interval: DB から全件を再読み込みする間隔（秒）
+            push_interval: 同じユーザーに督促を push する最小間隔（秒）
+        """
+        super().__init__('Collections', refresh_interval)
+        self.push_interval = push_interval
+        # user_id -> 最後に push した時刻（monotonic）
+        self._last_push: Dict[str, float] = {}
+        self._pushes = 0
+        self._suppressed = 0
+
+    # ---- 読み込み ----
+
+    def _fetch(self):
+        return self._query()
+
+    def _build(self, rows) -> Dict[str, _UserNotice]:
+        notices: Dict[str, _UserNotice] = {}
+        for user_id, case_type, status, overdue_started_at in rows:
+            notices.setdefault(user_id, _UserNotice()).add(case_type, status, overdue_started_at)
+        return notices
+
+    def _on_loaded(self, notices: Dict[str, _UserNotice]):
+        self._last_push = {u: t for u, t in self._last_push.items() if u in notices}
+
+    def refresh_user(self, user_id: str):
+        """1ユーザー分を読み直す（ケースの状態を変えたトランザクションのコミット後に呼ぶ）"""
+        try:
+            notice = self._query_user(user_id)
+        except Exception as e:
+            print(f"[Collections] 督促通知の索引の更新に失敗 user={user_id} err={e}")
+            self.invalidate()
+            return
+
+        def apply(notices: Dict[str, _UserNotice]):
+            if notice:
+                notices[user_id] = notice
+            else:
+                notices.pop(user_id, None)
+                self._last_push.pop(user_id, None)
+
+        self.update(apply)
+
+    @staticmethod
+    def _query(user_id: Optional[str] = None):
+        from sqlalchemy import select
+        from apps.banking.main_bank_system import SessionLocal
+        from apps.collections.models import CollectionsCase
+
+        stmt = (
+            select(CollectionsCase.user_id, CollectionsCase.case_type, CollectionsCase.status,
+                   CollectionsCase.overdue_started_at)
+            .where(CollectionsCase.status.in_(['overdue', 'seizure']))
+        )
+        if user_id is not None:
+            stmt = stmt.where(CollectionsCase.user_id == user_id)
+        db = SessionLocal()
+        try:
+            return db.execute(stmt).all()
+        finally:
+            db.close()
+
+    def _query_user(self, user_id: str) -> _UserNotice:
+        notice = _UserNotice()
+        for _, case_type, status, overdue_started_at in self._query(user_id):
+            notice.add(case_type, status, overdue_started_at)
+        return notice
+
+    # ---- 参照 ----
+
+    def notice_text(self, user_id: str, now: datetime) -> Optional[str]:
+        """
+        通知文を取得（索引を引くだけ。読み込めていない間のみそのユーザー分を DB で判定する）
+        """
+        loaded, notice = self.lookup(user_id)
+        if not loaded:
+            notice = self._query_user(user_id)
+        return notice.text(now) if notice else None
+
+    def should_push(self, user_id: str) -> bool:
+        """push_interval 内にまだ push していなければ記録して True"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_push.get(user_id)
+            if last is not None and now - last < self.push_interval:
+                self._suppressed += 1
+                return False
+            self._last_push[user_id] = now
+            self._pushes += 1
+            return True
+
+    def _stats(self, notices: Dict[str, _UserNotice]) -> Dict[str, Any]:
+        return {
+            'users': len(notices),
+            'tax_users': sum(1 for n in notices.values() if n.tax),
+            'loan_users': sum(1 for n in notices.values() if n.loan_overdue_since is not None),
+            'pushes': self._pushes,
+            'suppressed': self._suppressed,
+        }
+
+
+# グローバルインスタンス
+notice_index = NoticeIndex(
+    refresh_interval=config.COLLECTIONS_NOTICE_REFRESH_INTERVAL,
+    push_interval=config.COLLECTIONS_NOTICE_PUSH_INTERVAL,
+)
@@ -3,6 +3,7 @@
 """
 from linebot.models import TextSendMessage
 from core.api import line_bot_api
+from core.responder import expect_delay
 from apps.games.rps_game import play_rps_game
 from apps.games.minigames import (
     manager, GameState, join_game_session, cancel_game_session,
@@ -11,8 +12,7 @@ from apps.games.minigames import (
 from apps.games.session_manager import individual_game_manager
 from apps.games import game_flex, blackjack_flex, blackjack_game
 from apps.banking.chip_service import get_chip_balance, batch_lock_chips, distribute_chips
-import psycopg2
-import config
+from core.db import raw_connection
 import urllib.parse
 from datetime import datetime
 from typing import Dict
@@ -50,11 +50,8 @@ def handle_join_game(event, user_id, display_name, group_id):
         line_bot_api.reply_message(event.reply_token, TextSendMessage(text="ゲーム参加はグループチャットでのみ利用可能です。"))
         return
 
-    conn = psycopg2.connect(config.DATABASE_URL)
-    try:
+    with raw_connection() as conn:
         join_message = join_game_session(group_id, user_id, display_name, conn)
-    finally:
-        conn.close()
     line_bot_api.reply_message(event.reply_token, TextSendMessage(text=join_message))
 
 
@@ -118,10 +115,14 @@ def handle_game_start(event, user_id, group_id):
         )
 
 
+# 個別チャットで受け付けるじゃんけんの手
+PLAYER_MOVE_TEXTS = ("グー", "ぐー", "チョキ", "ちょき", "パー", "ぱー")
+
+
 def handle_player_move(event, user_id, text):
     """プレイヤーの手の入力処理"""
     if event.source.type == 'user':
-        if text.strip() in ["グー", "ぐー", "チョキ", "ちょき", "パー", "ぱー"]:
+        if text.strip() in PLAYER_MOVE_TEXTS:
             submit_player_move(user_id, text.strip(), line_bot_api, reply_token=event.reply_token)
             return True
     return False
@@ -340,6 +341,9 @@ def handle_confirm_bet(event, user_id, data: Dict):
             )
             return
 
+        # チップのロック・精算が長引いた場合は途中経過を先に返信する
+        expect_delay("🃏 ゲームを準備しています…")
+
         # チップをロック
         game_session_id = f"blackjack_{user_id}_{datetime.now().timestamp()}"
         lock_result = batch_lock_chips([{
@@ -581,8 +585,14 @@ def _finish_blackjack_game(event, user_id: str, session: Dict, is_doubled: bool
         # セッションはハンドラー側で渡されるが、ダブルダウン等で
         # セッションが更新されている可能性があるため最新を再取得する。
         latest_session = individual_game_manager.get_session(user_id)
-        if latest_session:
-            session = latest_session
+        if latest_session is None:
+            # 期限切れで破棄済み（ロック中のチップは返却済み）
+            line_bot_api.reply_message(
+                event.reply_token,
+                TextSendMessage(text="ゲームの有効期限が切れました。\nベットしたチップは返却されています。")
+            )
+            return
+        session = latest_session
 
         player_hand = session['player_hand']
         dealer_hand = session['dealer_hand']
@@ -11,7 +11,7 @@
 
 from dataclasses import dataclass, field
 from typing import Dict, List
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
 from linebot.models import TextSendMessage, FlexSendMessage
 from apps.utilities.timezone_utils import now_jst
@@ -530,6 +530,7 @@ class GroupManager:
             return None
         return grp.current_game
 
+# プロセス内のみ（session_store の対象外で、複数ワーカー構成でもワーカー間で共有しない）
 manager = GroupManager()
 
 def check_chip_balance(user_id, min_chips):
@@ -719,7 +720,6 @@ def reset_game_session(group_id: str):
 # --- 以下、ゲーム進行用ユーティリティ ---
 def start_game_session(group_id: str, line_bot_api, timeout_seconds: int = 30, reply_token=None):
     from threading import Timer
-    from datetime import timedelta
     group = manager.groups.get(group_id)
     if not group or not group.current_game:
         return "このグループではゲームが開催されていません。"
@@ -1103,6 +1103,7 @@ def finish_game_session(group_id: str, line_bot_api):
 
         # タイマー再設定
         timeout_seconds = 30
+        session.deadline = now_jst() + timedelta(seconds=timeout_seconds)
 
         def _finish():
             try:
@@ -1254,6 +1255,7 @@ def finish_game_session(group_id: str, line_bot_api):
 
         # タイマー再設定
         timeout_seconds = 30
+        session.deadline = now_jst() + timedelta(seconds=timeout_seconds)
 
         def _finish():
             try:
@@ -1285,3 +1287,118 @@ def finish_game_session(group_id: str, line_bot_api):
             pass
         group.current_game = None
         return
+
+
+# --- 停止/起動をまたいだ引き継ぎ ---
+
+# 起動時に読み戻した進行中ゲームの締め切りが過ぎていても、再送される手を待つ最小秒数
+_RESTORE_MIN_SECONDS = 10
+
+
+def _serialize_game(session: GameSession) -> dict:
+    return {
+        'game_type': session.game_type,
+        'state': session.state.value,
+        'created_at': session.created_at,
+        'min_balance': session.min_balance,
+        'host_user_id': session.host_user_id,
+        'max_players': session.max_players,
+        'players': [[p.user_id, p.display_name, p.data] for p in session.players.values()],
+        'start_time': session.start_time,
+        'deadline': session.deadline,
+        'round_count': session.round_count,
+        'eliminated_players': session.eliminated_players,
+        'round_history': session.round_history,
+    }
+
+
+def _deserialize_game(data: dict) -> GameSession:
+    return GameSession(
+        game_type=data['game_type'],
+        state=GameState(data['state']),
+        created_at=data['created_at'],
+        min_balance=data['min_balance'],
+        host_user_id=data['host_user_id'],
+        max_players=data['max_players'],
+        players={uid: Player(user_id=uid, display_name=name, data=hand) for uid, name, hand in data['players']},
+        start_time=data['start_time'],
+        deadline=data['deadline'],
+        round_count=data['round_count'],
+        eliminated_players=data['eliminated_players'],
+        round_history=data['round_history'],
+    )
+
+
+def persist_pending_games() -> int:
+    """
+    停止前に呼ぶ。募集中・進行中のゲームを pending_janken_games に退避する
+    （進行中のゲームのタイマーは止め、起動時に残り時間で張り直す。ロック中の参加費はそのまま）
+    """
+    from core.db import raw_connection
+    from core.session_store import dumps_session
+
+    rows = []
+    for group_id, group in list(manager.groups.items()):
+        session = group.current_game
+        if not session or session.state == GameState.FINISHED:
+            continue
+        if session.timer:
+            session.timer.cancel()
+        rows.append((group_id, dumps_session(_serialize_game(session))))
+    if not rows:
+        return 0
+    with raw_connection() as conn:
+        with conn.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO pending_janken_games (group_id, payload, saved_at) VALUES (%s, %s, now())
+                ON CONFLICT (group_id) DO UPDATE SET payload = EXCLUDED.payload, saved_at = now()
+                """,
+                rows,
+            )
+        conn.commit()
+    return len(rows)
+
+
+def restore_pending_games(line_bot_api) -> int:
+    """起動時に呼ぶ。persist_pending_games で退避したゲームを読み戻し、進行中ならタイマーを張り直す"""
+    from threading import Timer
+    from core.db import raw_connection
+    from core.session_store import loads_session
+
+    try:
+        with raw_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM pending_janken_games RETURNING group_id, payload")
+                rows = cur.fetchall()
+            conn.commit()
+    except Exception as e:
+        print(f"[Minigames] 退避したゲームの読み込みに失敗: {e}")
+        return 0
+
+    restored = 0
+    for group_id, payload in rows:
+        try:
+            session = _deserialize_game(loads_session(payload))
+        except Exception as e:
+            print(f"[Minigames] 退避したゲームを読み戻せません group={group_id} err={e}")
+            continue
+        manager.groups[group_id] = Group(group_id=group_id, current_game=session)
+        restored += 1
+        if session.state != GameState.IN_PROGRESS:
+            continue
+
+        remaining = (session.deadline - now_jst()).total_seconds() if session.deadline else 0
+        delay = max(remaining, _RESTORE_MIN_SECONDS)
+
+        def _finish(gid=group_id):
+            try:
+                finish_game_session(gid, line_bot_api)
+            except Exception as e:
+                print(f"[Minigames] Error in timer finish: {e}")
+
+        timer = Timer(delay, _finish)
+        session.timer = timer
+        timer.daemon = True
+        timer.start()
+    return restored
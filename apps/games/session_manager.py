@@ -4,6 +4,9 @@
 このモジュールは補助的な役割を果たす
 """
 from typing import Dict, Any, Optional
+
+import config
+from core.session_store import session_store, REASON_EXPIRED
 from apps.games.minigames import manager, GroupManager
 
 
@@ -13,7 +16,7 @@ class GameSessionManager:
     def __init__(self):
         # グループゲームセッションはminigames.pyのmanagerで管理
         # ここでは個別チャット用の一時データなどを管理
-        self._user_sessions: Dict[str, Any] = {}
+        self._user_sessions = session_store.namespace('game_user', config.SESSION_TTL_GAME)
 
     def get_user_session(self, user_id: str) -> Optional[Any]:
         """ユーザーセッション取得"""
@@ -42,11 +45,44 @@ class GameSessionManager:
         self._user_sessions.clear()
 
 
+def _release_locked_chips(user_id: str, session: Dict, reason: str):
+    """
+    破棄されたプレイ中セッションのロック中チップを返却する（セッションストアのコールバック）
+
+    払戻 = ロック額で精算するので、勝敗はつかずベットがそのまま戻る。
+    """
+    if session.get('type') != 'playing':
+        return
+    locked_base = session.get('locked_base', session.get('locked_chips', 0))
+    if not locked_base:
+        return
+
+    from apps.banking.chip_service import distribute_chips
+    game_session_id = session.get('game_session_id')
+    result = distribute_chips({
+        user_id: {
+            'locked_base': locked_base,
+            'locked_bonus': 0,
+            'payout': locked_base
+        }
+    }, game_session_id)
+    label = '期限切れ' if reason == REASON_EXPIRED else 'メモリ上限'
+    if result.get('success'):
+        print(f"[GameSession] {label}のため {locked_base} チップのロックを解除: user={user_id}, session={game_session_id}")
+    else:
+        print(f"[GameSession] ERROR: {label}セッションのチップ返却に失敗: user={user_id}, {result.get('error')}")
+
+
 class IndividualGameSessionManager:
-    """個別チャット用ゲームセッション管理クラス"""
+    """個別チャット用ゲームセッション管理クラス
+
+    放置されたプレイ中のセッションは期限切れで破棄され、ロック中のチップが返却される。
+    """
 
     def __init__(self):
-        self._sessions: Dict[str, Dict] = {}
+        self._sessions = session_store.namespace(
+            'individual_game', config.SESSION_TTL_GAME, on_expire=_release_locked_chips
+        )
 
     def create_session(self, user_id: str, game_type: str, session_data: Dict = None) -> Dict:
         """
@@ -97,8 +133,10 @@ class IndividualGameSessionManager:
         Returns:
             bool: 更新成功か
         """
-        if user_id in self._sessions:
-            self._sessions[user_id].update(updates)
+        session = self._sessions.get(user_id)
+        if session is not None:
+            session.update(updates)
+            self._sessions.touch(user_id)
             return True
         return False
 
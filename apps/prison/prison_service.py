@@ -19,6 +19,7 @@ from apps.banking.main_bank_system import (
 )
 from apps.banking.bank_service import RESERVE_ACCOUNT_NUMBER, RESERVE_BRANCH_CODE
 from apps.utilities.timezone_utils import now_jst
+from apps.prison.sentence_index import sentence_index
 
 # ============================================
 # 給付金専用口座の定義
@@ -31,9 +32,31 @@ REHABILITATION_FUND_ACCOUNT_NUMBER = '4979348'
 # 懲役管理機能
 # ============================================
 
+_NOT_IMPRISONED = {
+    'is_imprisoned': False,
+    'remaining_days': None,
+    'end_date': None,
+    'daily_quota': None,
+    'completed_today': None,
+    'last_work_date': None
+}
+
+
+def is_imprisoned(user_id: str) -> bool:
+    """
+    懲役中かどうかだけを判定（メモリ上の索引を引くだけで DB には問い合わせない）
+
+    索引を読み込めていない場合のみ get_prisoner_status で DB を確認する。
+    """
+    result = sentence_index.is_imprisoned(user_id)
+    if result is None:
+        return get_prisoner_status(user_id)['is_imprisoned']
+    return result
+
+
 def get_prisoner_status(user_id: str) -> dict:
     """
-    ユーザーの懲役ステータスを取得
+    ユーザーの懲役ステータスを取得（懲役中でなければ DB に問い合わせない）
     
     Returns:
         {
@@ -45,32 +68,21 @@ def get_prisoner_status(user_id: str) -> dict:
             'last_work_date': date or None
         }
     """
+    if sentence_index.is_imprisoned(user_id) is False:
+        return dict(_NOT_IMPRISONED)
+
     db = SessionLocal()
     try:
         stmt = select(PrisonSentence).where(PrisonSentence.user_id == user_id)
         sentence = db.execute(stmt).scalars().first()
         
         if not sentence:
-            return {
-                'is_imprisoned': False,
-                'remaining_days': None,
-                'end_date': None,
-                'daily_quota': None,
-                'completed_today': None,
-                'last_work_date': None
-            }
+            return dict(_NOT_IMPRISONED)
         
-        # 自動釈放チェック
+        # 自動釈放チェック（通常は release_expired_prisoners の定期ジョブで釈放済み）
         if sentence.end_date <= date.today():
             release_prisoner(user_id)
-            return {
-                'is_imprisoned': False,
-                'remaining_days': None,
-                'end_date': None,
-                'daily_quota': None,
-                'completed_today': None,
-                'last_work_date': None
-            }
+            return dict(_NOT_IMPRISONED)
         
         return {
             'is_imprisoned': True,
@@ -161,6 +173,7 @@ def sentence_prisoner(
             db.add(account)
         
         db.commit()
+        sentence_index.set(user_id, end_date)
         
         return {
             'success': True,
@@ -205,6 +218,7 @@ def release_prisoner(user_id: str) -> dict:
             db.add(account)
         
         db.commit()
+        sentence_index.discard(user_id)
         
         return {
             'success': True,
@@ -220,6 +234,36 @@ def release_prisoner(user_id: str) -> dict:
         db.close()
 
 
+def release_expired_prisoners() -> dict:
+    """
+    釈放日を迎えた全ユーザーを釈放（定期ジョブから呼ぶ）
+
+    Returns:
+        {
+            'released': int,
+            'failed': int
+        }
+    """
+    db = SessionLocal()
+    try:
+        user_ids = db.execute(
+            select(PrisonSentence.user_id).where(PrisonSentence.end_date <= date.today())
+        ).scalars().all()
+    finally:
+        db.close()
+
+    released = 0
+    failed = 0
+    for user_id in user_ids:
+        result = release_prisoner(user_id)
+        if result['success']:
+            released += 1
+        else:
+            failed += 1
+            print(f"[Prison] 自動釈放に失敗: user={user_id}, {result['message']}")
+    return {'released': released, 'failed': failed}
+
+
 # ============================================
 # 懲役中の?労働処理
 # ============================================
@@ -338,6 +382,12 @@ def do_prison_work(user_id: str) -> dict:
         )
         db.add(transaction)
         db.flush()
+        db.add(TransactionEntry(
+            transaction_id=transaction.transaction_id,
+            account_id=rehabilitation_account.account_id,
+            entry_type='credit',
+            amount=salary,
+        ))
         
         # 最後の労働時刻を更新（15分制限用）
         sentence.last_work_datetime = datetime.now()
@@ -499,6 +549,21 @@ def distribute_rehabilitation_fund() -> dict:
                 executed_at=now_jst()
             )
             db.add(transaction)
+            db.flush()
+            db.add_all([
+                TransactionEntry(
+                    transaction_id=transaction.transaction_id,
+                    account_id=rehabilitation_account.account_id,
+                    entry_type='debit',
+                    amount=amount_per_recipient,
+                ),
+                TransactionEntry(
+                    transaction_id=transaction.transaction_id,
+                    account_id=account.account_id,
+                    entry_type='credit',
+                    amount=amount_per_recipient,
+                ),
+            ])
         
         # 給付金専用口座をリセット
         rehabilitation_account.balance = Decimal('0')
@@ -1,67 +1,49 @@
 """
-犯罪者更生給付金の配布スケジューラー
-毎日午前9時に実行
+懲役システムの定期ジョブ（統合スケジューラー core.scheduler に登録）
+- 犯罪者更生給付金の配布: 毎日午前9時
+- 釈放日を迎えたユーザーの自動釈放: 毎時5分
 """
 import logging
-from apscheduler.schedulers.background import BackgroundScheduler
+from datetime import timedelta
 from apscheduler.triggers.cron import CronTrigger
-from apps.prison.prison_service import distribute_rehabilitation_fund
-from apps.utilities.timezone_utils import now_jst
+from apps.prison.prison_service import distribute_rehabilitation_fund, release_expired_prisoners
+from core.scheduler import job_scheduler, TIMEZONE
 
 logger = logging.getLogger(__name__)
-scheduler = None
 
 
 def run_daily_distribution():
     """
     1日1回実行：犯罪者更生給付金を配布
     """
-    try:
-        result = distribute_rehabilitation_fund()
-        if result['success']:
-            logger.info(f"[給付金配布] 成功: {result['message']}")
-        else:
-            logger.info(f"[給付金配布] スキップ: {result['message']}")
-    except Exception as e:
-        logger.error(f"[給付金配布] エラー: {str(e)}", exc_info=True)
+    result = distribute_rehabilitation_fund()
+    if result['success']:
+        logger.info(f"[給付金配布] 成功: {result['message']}")
+    else:
+        logger.info(f"[給付金配布] スキップ: {result['message']}")
 
 
-def start_rehabilitation_distribution_scheduler():
+def run_release_sweep():
     """
-    スケジューラーを開始
-    毎日午前9時（日本時間）に給付金配布を実行
+    釈放日を迎えたユーザーを釈放する（メッセージ処理中には釈放しない）
     """
-    global scheduler
-    
-    if scheduler is not None:
-        logger.info("[スケジューラー] 既に起動しています")
-        return
-    
-    try:
-        scheduler = BackgroundScheduler(timezone='Asia/Tokyo')
-        
-        # 毎日午前9時に実行
-        scheduler.add_job(
-            run_daily_distribution,
-            CronTrigger(hour=9, minute=0, timezone='Asia/Tokyo'),
-            id='prison_rehabilitation_distribution',
-            name='犯罪者更生給付金配布',
-            replace_existing=True
-        )
-        
-        scheduler.start()
-        logger.info("[スケジューラー] 犯罪者更生給付金配布スケジューラーを開始しました (毎日午前9時)")
-    except Exception as e:
-        logger.error(f"[スケジューラー] 起動エラー: {str(e)}", exc_info=True)
+    result = release_expired_prisoners()
+    if result['released'] or result['failed']:
+        logger.info(f"[自動釈放] 釈放: {result['released']}件, 失敗: {result['failed']}件")
 
 
-def stop_rehabilitation_distribution_scheduler():
-    """
-    スケジューラーを停止
-    """
-    global scheduler
-    
-    if scheduler is not None:
-        scheduler.shutdown()
-        scheduler = None
-        logger.info("[スケジューラー] 犯罪者更生給付金配布スケジューラーを停止しました")
+# 毎日午前9時（配布済みの日は distribute_rehabilitation_fund 側でスキップされる）
+job_scheduler.register(
+    'prison.rehabilitation_fund', '犯罪者更生給付金配布', run_daily_distribution,
+    CronTrigger(hour=9, minute=0, timezone=TIMEZONE),
+    misfire_grace_time=3 * 3600,
+    catch_up=timedelta(hours=14),
+)
+
+# 毎時5分（起動時にも取りこぼし分を1回実行する）
+job_scheduler.register(
+    'prison.release_sweep', '懲役の自動釈放', run_release_sweep,
+    CronTrigger(minute=5, timezone=TIMEZONE),
+    misfire_grace_time=30 * 60,
+    catch_up=timedelta(hours=1),
+)
@@ -0,0 +1,65 @@
+"""
+懲役中ユーザーの索引（user_id → 釈放日）
+
+全メッセージで行う懲役チェックを DB に問い合わせずに済ませるため、
+服役中の懲役をメモリ上に保持する。起動時に読み込み、
+sentence_prisoner / release_prisoner で更新する。
+再読み込みの仕組みは core.index_cache.ReloadableIndex。
+"""
+from datetime import date
+from typing import Dict, Any, Optional
+
+import config
+from core.index_cache import ReloadableIndex
+
+
+class SentenceIndex(ReloadableIndex):
+    """服役中の懲役の索引"""
+
+    def __init__(self, refresh_interval: int):
+        """
+        Args:
+            refresh_interval: DB から再読み込みする間隔（秒）
+        """
+        super().__init__('Prison', refresh_interval)
+
+    def _fetch(self):
+        from sqlalchemy import select
+        from apps.banking.main_bank_system import SessionLocal
+        from apps.prison.prison_models import PrisonSentence
+
+        db = SessionLocal()
+        try:
+            return db.execute(select(PrisonSentence.user_id, PrisonSentence.end_date)).all()
+        finally:
+            db.close()
+
+    def _build(self, rows) -> Dict[str, date]:
+        return {user_id: end_date for user_id, end_date in rows}
+
+    def _stats(self, data: Dict[str, date]) -> Dict[str, Any]:
+        return {'prisoners': len(data)}
+
+    def is_imprisoned(self, user_id: str) -> Optional[bool]:
+        """
+        服役中か（釈放日を過ぎたものは服役中とみなさない。釈放処理は定期ジョブで行う）
+
+        Returns:
+            Optional[bool]: 索引を読み込めていない場合は None
+        """
+        loaded, end_date = self.lookup(user_id)
+        if not loaded:
+            return None
+        return end_date is not None and end_date > date.today()
+
+    def set(self, user_id: str, end_date: date):
+        """懲役を設定したときに呼ぶ"""
+        self.update(lambda end_dates: end_dates.__setitem__(user_id, end_date))
+
+    def discard(self, user_id: str):
+        """釈放したときに呼ぶ"""
+        self.update(lambda end_dates: end_dates.pop(user_id, None))
+
+
+# グローバルインスタンス
+sentence_index = SentenceIndex(refresh_interval=config.PRISON_INDEX_REFRESH_INTERVAL)
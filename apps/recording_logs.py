@@ -1,27 +1,213 @@
-import psycopg2
+"""
+メッセージログ記録
+
+イベントごとに接続を開かず、バックグラウンドのログシンクに行を積んで
+複数行 INSERT でまとめて書き込む。
+"""
+import atexit
+import queue
+import threading
+import time
+from psycopg2.extras import execute_values
 from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, Optional
 import config
+from core.db import raw_connection
+
+JST = timezone(timedelta(hours=9))
+
+_INSERT_SQL = """
+    INSERT INTO logs (user_id, message, sent_at, display_name, type, group_id)
+    VALUES %s
+"""
+
+
+class _FlushRequest:
+    """キュー内の同期フラッシュ要求（これより前に積まれた行の書き込み完了を通知する）"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class LogSink:
+    """logs テーブルへのバッチ書き込みを行うバックグラウンドシンク"""
+
+    _STOP = object()
+
+    def __init__(self, batch_size: int, flush_interval_ms: int, queue_max: int):
+        """
+        Args:
+            batch_size: 1回の INSERT でまとめる最大行数
+            flush_interval_ms: 行が溜まらなくても書き込むまでの最大待ち時間（ミリ秒）
+            queue_max: 書き込み待ちキューの上限
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_max)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+        self._batches = 0
+
+    def enqueue(self, row: tuple):
+        """
+        ログ行を書き込み待ちに積む（キューが満杯なら破棄して件数を記録）
+
+        Args:
+            row: (user_id, message, sent_at, display_name, type, group_id)
+                 display_name が None の場合は書き込みの直前にシンクのスレッドで取得する
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        呼び出し時点までに積まれた行の書き込み完了を待つ
+
+        Returns:
+            bool: 時間内に書き込みが完了したか
+        """
+        if self._thread is None:
+            return True
+        request = _FlushRequest()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return False
+        return request.done.wait(timeout)
+
+    def stop(self, timeout: float = 10.0):
+        """残りの行を書き込んでシンクを停止"""
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            print("[LogSink] 停止要求を投入できませんでした（キュー満杯）")
+            return
+        thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """書き込み件数などの統計を取得"""
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'written': self._written,
+                'dropped': self._dropped,
+                'failed': self._failed,
+                'batches': self._batches,
+            }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='log-sink', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = []
+            waiters = []
+            stop = False
+            deadline = None
+
+            # 最初の1件は無期限に待ち、以降は flush_interval まで溜める
+            item = self._queue.get()
+            while True:
+                if item is self._STOP:
+                    stop = True
+                    break
+                if isinstance(item, _FlushRequest):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.done.set()
+            if stop:
+                return
+
+    @staticmethod
+    def _resolve_display_names(batch) -> Dict[tuple, str]:
+        """
+        表示名のない行の表示名をまとめて解決する（リクエストのスレッドではなくシンクのスレッドで呼ぶ）
+
+        キャッシュになければ LINE API で取得する（ユーザーごとに1回。取得できなければ空文字）。
+        """
+        from core.profile_cache import profile_cache
+        names = {}
+        for user_id, _, _, display_name, _, group_id in batch:
+            key = (group_id, user_id)
+            if display_name is not None or key in names:
+                continue
+            try:
+                names[key] = profile_cache.get_display_name(user_id, group_id)
+            except Exception as e:
+                print(f"[LogSink] 表示名を取得できません user={user_id}: {e}")
+                names[key] = ''
+        return names
+
+    def _write(self, batch):
+        names = self._resolve_display_names(batch)
+        rows = [
+            (user_id, message, sent_at,
+             display_name if display_name is not None else names[(group_id, user_id)],
+             source_type, group_id if group_id else 'None')
+            for user_id, message, sent_at, display_name, source_type, group_id in batch
+        ]
+        try:
+            with raw_connection() as conn:
+                with conn.cursor() as cur:
+                    execute_values(cur, _INSERT_SQL, rows, page_size=self.batch_size)
+                conn.commit()
+            with self._lock:
+                self._written += len(rows)
+                self._batches += 1
+        except Exception as e:
+            print("DB Error:", e)
+            with self._lock:
+                self._failed += len(rows)
+
+
+# グローバルインスタンス
+log_sink = LogSink(
+    batch_size=config.LOG_BATCH_SIZE,
+    flush_interval_ms=config.LOG_FLUSH_INTERVAL_MS,
+    queue_max=config.LOG_QUEUE_MAX,
+)
+atexit.register(log_sink.stop)
+
 
 def recording_logs(event, user_id, text, display_name):
-    # データベースに接続し、メッセージログを記録
-    conn = None
-    cur = None
-    try:
-        conn = psycopg2.connect(config.DATABASE_URL)
-        cur = conn.cursor()
-        JST = timezone(timedelta(hours=9))
-        jst_now = datetime.now(timezone.utc).astimezone(JST)
-        cur.execute("""
-            INSERT INTO logs (user_id, message, sent_at, display_name, type, group_id)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """,
-            (user_id, text, jst_now, display_name, event.source.type, getattr(event.source, 'group_id', 'None'))
-        )
-        conn.commit()
-    except Exception as e:
-        print("DB Error:", e)
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+    """メッセージログを記録（バッチ書き込み。display_name が None なら書き込み時にシンクのスレッドで取得する）"""
+    jst_now = datetime.now(timezone.utc).astimezone(JST)
+    log_sink.enqueue(
+        (user_id, text, jst_now, display_name, event.source.type, getattr(event.source, 'group_id', None))
+    )
+
+
+def flush_logs(timeout: float = 5.0) -> bool:
+    """積まれているログを同期で書き込む（直前の発言を読む処理の前に呼ぶ）"""
+    return log_sink.flush(timeout)
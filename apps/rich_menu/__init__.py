@@ -7,12 +7,16 @@ from .menu_manager import (
     create_rich_menus,
     delete_all_rich_menus,
     set_default_rich_menu,
-    switch_user_menu
+    start_rich_menu_bootstrap,
+    switch_user_menu,
+    sync_rich_menus
 )
 
 __all__ = [
     'create_rich_menus',
     'delete_all_rich_menus',
     'set_default_rich_menu',
-    'switch_user_menu'
+    'start_rich_menu_bootstrap',
+    'switch_user_menu',
+    'sync_rich_menus'
 ]
@@ -3,29 +3,42 @@
 
 LINE Messaging APIを使用したリッチメニューのCRUD操作
 """
+import hashlib
+import json
 import os
-from linebot import LineBotApi
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
 from linebot.models import RichMenu, RichMenuSize, RichMenuArea, RichMenuBounds
 from linebot.models.actions import PostbackAction
 from linebot.models.actions import RichMenuSwitchAction
 from config import LINE_CHANNEL_ACCESS_TOKEN
+from core.api import line_bot_api
+from core.http_client import http_client
+from core.db import raw_connection
 from .menu_templates import get_all_templates
 
-import requests
+PAGE_KEYS = ("page1-1", "page1-2", "page1-3", "page2-1", "page2-2", "page2-3")
 
+# 画像命名規則: rich_menu_page_(ページ番号-左から数えて何番目か)_(カテゴリ名).png
+MENU_IMAGES = {
+    "page1-1": "rich_menu_page_1-1_account.png",
+    "page1-2": "rich_menu_page_1-2_shop.png",
+    "page1-3": "rich_menu_page_1-3_stock.png",
+    "page2-1": "rich_menu_page_2-1_game.png",
+    "page2-2": "rich_menu_page_2-2_utility.png",
+    "page2-3": "rich_menu_page_2-3_help.png",
+}
 
-# LINE Bot API初期化
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+DEFAULT_IMAGE_DIR = "apps/rich_menu/images"
 
-# リッチメニューIDを保存（グローバル変数）
-RICHMENU_IDS = {
-    "page1-1": None,
-    "page1-2": None,
-    "page1-3": None,
-    "page2-1": None,
-    "page2-2": None,
-    "page2-3": None
-}
+# 起動時の同期処理を複数ワーカーで同時に走らせないための advisory lock キー
+_BOOTSTRAP_LOCK_KEY = 0x52494348  # 'RICH'
+
+# 並列アップロード数
+_UPLOAD_WORKERS = 3
 
 # richMenuAliasId（固定）: richmenuswitch が参照する
 RICHMENU_ALIASES = {
@@ -39,6 +52,132 @@ RICHMENU_ALIASES = {
 }
 
 
+class RichMenuRegistry:
+    """ページ → リッチメニューID の対応表
+
+    rich_menu_registry テーブルに永続化し、プロセス内では一定間隔で読み直す。
+    （DBに接続できない場合はプロセス内の値のみで動作する）
+    """
+
+    _REFRESH_INTERVAL = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # page_key -> (rich_menu_id, content_hash)
+        self._entries: Dict[str, Tuple[str, str]] = {}
+        self._loaded_at: Optional[float] = None
+
+    def get(self, page_key: str) -> Optional[str]:
+        entry = self.entry(page_key)
+        return entry[0] if entry else None
+
+    def entry(self, page_key: str) -> Optional[Tuple[str, str]]:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self._REFRESH_INTERVAL:
+            self.reload()
+        with self._lock:
+            return self._entries.get(page_key)
+
+    def all(self) -> Dict[str, Optional[str]]:
+        """全ページのIDを取得（未作成のページは None）"""
+        self.entry(PAGE_KEYS[0])
+        with self._lock:
+            return {key: self._entries[key][0] if key in self._entries else None for key in PAGE_KEYS}
+
+    def reload(self):
+        try:
+            with raw_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT page_key, rich_menu_id, content_hash FROM rich_menu_registry")
+                    rows = cur.fetchall()
+        except Exception as e:
+            print(f"[リッチメニュー] ID対応表の読み込みに失敗: {e}")
+            # 失敗してもしばらくは読み直さない
+            self._loaded_at = time.monotonic()
+            return
+        with self._lock:
+            self._entries = {page_key: (menu_id, content_hash) for page_key, menu_id, content_hash in rows}
+            self._loaded_at = time.monotonic()
+
+    def save(self, page_key: str, menu_id: str, content_hash: str):
+        with self._lock:
+            self._entries[page_key] = (menu_id, content_hash)
+        try:
+            with raw_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        INSERT INTO rich_menu_registry (page_key, rich_menu_id, content_hash, updated_at)
+                        VALUES (%s, %s, %s, now())
+                        ON CONFLICT (page_key) DO UPDATE
+                            SET rich_menu_id = EXCLUDED.rich_menu_id,
+                                content_hash = EXCLUDED.content_hash,
+                                updated_at = now()
+                        """,
+                        (page_key, menu_id, content_hash),
+                    )
+                conn.commit()
+        except Exception as e:
+            print(f"[リッチメニュー] ID対応表の保存に失敗: {page_key} {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+        try:
+            with raw_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM rich_menu_registry")
+                conn.commit()
+        except Exception as e:
+            print(f"[リッチメニュー] ID対応表の削除に失敗: {e}")
+
+
+# グローバルインスタンス
+registry = RichMenuRegistry()
+
+
+def _content_hash(template: dict, image_path: str) -> Optional[str]:
+    """テンプレートと画像の内容から変更検知用のハッシュを作る（画像がなければ None）"""
+    try:
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+    except OSError:
+        return None
+    digest = hashlib.sha256()
+    digest.update(json.dumps(template, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+
+@contextmanager
+def _bootstrap_lock():
+    """複数ワーカーの同時起動時に、同期処理を1プロセスずつ実行させる
+
+    後から来たワーカーは先行ワーカーの完了を待ち、その結果（ハッシュ一致）を見て何もしない。
+    DBに接続できない場合はロックなしで続行する。
+    """
+    ctx = raw_connection()
+    try:
+        conn = ctx.__enter__()
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (_BOOTSTRAP_LOCK_KEY,))
+        conn.commit()
+    except Exception as e:
+        print(f"[リッチメニュー] 起動ロックを取得できません（ロックなしで続行）: {e}")
+        conn = None
+    if conn is None:
+        yield
+        return
+    try:
+        yield
+    finally:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (_BOOTSTRAP_LOCK_KEY,))
+            conn.commit()
+        finally:
+            ctx.__exit__(None, None, None)
+
+
 def _line_api_headers() -> dict:
     return {
         "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}",
@@ -55,15 +194,13 @@ def ensure_rich_menu_alias(alias_id: str, rich_menu_id: str) -> bool:
         return False
 
     base = "https://api.line.me/v2/bot/richmenu/alias"
-    timeout_seconds = 8
 
     # まず作成を試行（存在する場合は更新へフォールバック）
     try:
-        resp = requests.post(
+        resp = http_client.post(
             base,
             headers=_line_api_headers(),
             json={"richMenuAliasId": alias_id, "richMenuId": rich_menu_id},
-            timeout=timeout_seconds,
         )
         if resp.status_code in (200, 201):
             print(f"[リッチメニュー] alias作成: {alias_id} -> {rich_menu_id}")
@@ -77,11 +214,11 @@ def ensure_rich_menu_alias(alias_id: str, rich_menu_id: str) -> bool:
 
     # 更新（aliasが既に存在する前提）
     try:
-        resp = requests.post(
+        resp = http_client.post(
             f"{base}/{alias_id}",
             headers=_line_api_headers(),
             json={"richMenuId": rich_menu_id},
-            timeout=timeout_seconds,
+            retry_unsafe=True,  # 同じIDへの更新は何度送っても同じ結果
         )
         if resp.status_code in (200, 201):
             print(f"[リッチメニュー] alias更新: {alias_id} -> {rich_menu_id}")
@@ -159,9 +296,44 @@ def create_rich_menu(template: dict, image_path: str) -> str:
     return rich_menu_id
 
 
-def create_rich_menus(image_dir: str = "apps/rich_menu/images") -> dict:
+def _publish_menu(page_key: str, template: dict, image_path: str, content_hash: str,
+                  old_menu_id: Optional[str]) -> Optional[str]:
+    """1ページ分のメニューを作成し、alias と ID対応表を更新する（古いメニューは削除）"""
+    try:
+        menu_id = create_rich_menu(template, image_path)
+    except Exception as e:
+        print(f"[リッチメニュー] 作成エラー: {page_key} {e}")
+        return None
+    if not menu_id:
+        return None
+
+    # richmenuswitch 用 alias を作成/更新
+    alias_id = RICHMENU_ALIASES.get(page_key)
+    if alias_id:
+        ensure_rich_menu_alias(alias_id=alias_id, rich_menu_id=menu_id)
+    registry.save(page_key, menu_id, content_hash)
+
+    if old_menu_id and old_menu_id != menu_id:
+        try:
+            line_bot_api.delete_rich_menu(old_menu_id)
+            print(f"[リッチメニュー] 旧メニューを削除: {page_key} (ID: {old_menu_id})")
+        except Exception as e:
+            print(f"[リッチメニュー] 旧メニューの削除に失敗: {page_key} {e}")
+    return menu_id
+
+
+def _publish_menus(targets) -> Dict[str, Optional[str]]:
+    """複数ページのメニューを並列に作成する"""
+    if not targets:
+        return {}
+    with ThreadPoolExecutor(max_workers=_UPLOAD_WORKERS, thread_name_prefix='richmenu-upload') as pool:
+        futures = {target[0]: pool.submit(_publish_menu, *target) for target in targets}
+        return {page_key: future.result() for page_key, future in futures.items()}
+
+
+def create_rich_menus(image_dir: str = DEFAULT_IMAGE_DIR) -> dict:
     """
-    全てのリッチメニューを作成
+    全てのリッチメニューを作成（内容に変更がなくても作り直す）
     
     Args:
         image_dir: 画像ディレクトリのパス
@@ -170,41 +342,82 @@ def create_rich_menus(image_dir: str = "apps/rich_menu/images") -> dict:
         各ページのリッチメニューID
     """
     templates = get_all_templates()
-    
-    # 画像命名規則: rich_menu_page_(ページ番号-左から数えて何番目か)_(カテゴリ名).png
-    menu_configs = [
-        ("page1-1", "rich_menu_page_1-1_account.png"),
-        ("page1-2", "rich_menu_page_1-2_shop.png"),
-        ("page1-3", "rich_menu_page_1-3_stock.png"),
-        ("page2-1", "rich_menu_page_2-1_game.png"),
-        ("page2-2", "rich_menu_page_2-2_utility.png"),
-        ("page2-3", "rich_menu_page_2-3_help.png")
-    ]
-    
-    created_count = 0
-    failed_pages = []
-    
-    for page_key, image_filename in menu_configs:
-        image_path = os.path.join(image_dir, image_filename)
-        menu_id = create_rich_menu(templates[page_key], image_path)
-        RICHMENU_IDS[page_key] = menu_id
-
-        # richmenuswitch 用 alias を作成/更新
-        if menu_id:
-            alias_id = RICHMENU_ALIASES.get(page_key)
-            if alias_id:
-                ensure_rich_menu_alias(alias_id=alias_id, rich_menu_id=menu_id)
-        
-        if menu_id:
-            created_count += 1
-        else:
-            failed_pages.append(page_key)
-    
+    targets = []
+    for page_key in PAGE_KEYS:
+        image_path = os.path.join(image_dir, MENU_IMAGES[page_key])
+        content_hash = _content_hash(templates[page_key], image_path)
+        if content_hash is None:
+            print(f"[リッチメニュー] エラー: 画像が見つかりません: {image_path}")
+            continue
+        targets.append((page_key, templates[page_key], image_path, content_hash, registry.get(page_key)))
+
+    created = _publish_menus(targets)
+    menu_ids = {page_key: created.get(page_key) for page_key in PAGE_KEYS}
+
+    created_count = sum(1 for v in menu_ids.values() if v)
+    failed_pages = [k for k, v in menu_ids.items() if not v]
     print(f"[リッチメニュー] 作成結果: {created_count}/6 個のメニューを作成")
     if failed_pages:
         print(f"[リッチメニュー] 作成失敗: {', '.join(failed_pages)}")
     
-    return RICHMENU_IDS
+    return menu_ids
+
+
+def sync_rich_menus(image_dir: str = DEFAULT_IMAGE_DIR) -> Dict[str, Optional[str]]:
+    """
+    登録済みのメニューと内容ハッシュを比較し、変更されたページだけ作り直す
+
+    Returns:
+        各ページのリッチメニューID
+    """
+    with _bootstrap_lock():
+        registry.reload()
+        templates = get_all_templates()
+
+        # ?メニュー削除 などで LINE 側から消えたメニューも作り直す
+        try:
+            existing = {menu.rich_menu_id for menu in line_bot_api.get_rich_menu_list()}
+        except Exception as e:
+            print(f"[リッチメニュー] 登録済みメニューの取得に失敗: {e}")
+            existing = None
+
+        targets = []
+        for page_key in PAGE_KEYS:
+            image_path = os.path.join(image_dir, MENU_IMAGES[page_key])
+            content_hash = _content_hash(templates[page_key], image_path)
+            if content_hash is None:
+                print(f"[リッチメニュー] エラー: 画像が見つかりません: {image_path}")
+                continue
+            entry = registry.entry(page_key)
+            if entry and entry[1] == content_hash and (existing is None or entry[0] in existing):
+                continue
+            targets.append((page_key, templates[page_key], image_path, content_hash, entry[0] if entry else None))
+
+        if not targets:
+            print("[リッチメニュー] 変更なし（作成済みのメニューを使用）")
+            return registry.all()
+
+        print(f"[リッチメニュー] 変更のあるメニューを作成: {', '.join(t[0] for t in targets)}")
+        created = _publish_menus(targets)
+        if created.get("page1-1"):
+            set_default_rich_menu("1-1")
+        return registry.all()
+
+
+def start_rich_menu_bootstrap(image_dir: str = DEFAULT_IMAGE_DIR) -> threading.Thread:
+    """リッチメニューの同期をバックグラウンドで開始（起動処理を待たせない）"""
+    def _run():
+        try:
+            print("[起動] リッチメニューを同期中...")
+            sync_rich_menus(image_dir)
+            print("[起動] リッチメニューの同期が完了しました")
+        except Exception as e:
+            print(f"[起動] リッチメニューの同期に失敗しました: {e}")
+            print("[起動] 手動で ?メニュー作成 コマンドを実行して作成してください")
+
+    thread = threading.Thread(target=_run, name='rich-menu-bootstrap', daemon=True)
+    thread.start()
+    return thread
 
 
 def delete_all_rich_menus():
@@ -215,9 +428,8 @@ def delete_all_rich_menus():
             line_bot_api.delete_rich_menu(menu.rich_menu_id)
             print(f"[リッチメニュー] 削除: {menu.name} (ID: {menu.rich_menu_id})")
         
-        # グローバル変数をリセット
-        for key in RICHMENU_IDS:
-            RICHMENU_IDS[key] = None
+        # ID対応表をリセット
+        registry.clear()
         
         print("[リッチメニュー] 全てのメニューを削除しました")
     except Exception as e:
@@ -232,7 +444,7 @@ def set_default_rich_menu(page: str = "1-1"):
         page: デフォルトで表示するページ（例: "1-1", "2-1"）
     """
     page_key = f"page{page}"
-    menu_id = RICHMENU_IDS.get(page_key)
+    menu_id = registry.get(page_key)
     if menu_id:
         try:
             line_bot_api.set_default_rich_menu(menu_id)
@@ -252,7 +464,7 @@ def switch_user_menu(user_id: str, page: str):
         page: 切り替え先のページ（例: "1-1", "1-2", "2-1"）
     """
     page_key = f"page{page}"
-    menu_id = RICHMENU_IDS.get(page_key)
+    menu_id = registry.get(page_key)
     if menu_id:
         try:
             line_bot_api.link_rich_menu_to_user(user_id, menu_id)
@@ -265,4 +477,4 @@ def switch_user_menu(user_id: str, page: str):
 
 def get_menu_ids():
     """現在のリッチメニューIDを取得"""
-    return RICHMENU_IDS.copy()
+    return registry.all()
@@ -1,14 +1,17 @@
 """
 ショップ機能専用セッション管理
 """
-from typing import Dict, Any, Optional
+from typing import Any, Optional
+
+import config
+from core.session_store import session_store
 
 
 class ShopSessionManager:
     """ショップ機能のセッション管理クラス"""
 
     def __init__(self):
-        self._sessions: Dict[str, Any] = {}
+        self._sessions = session_store.namespace('shop', config.SESSION_TTL_SHOP)
 
     def get_session(self, user_id: str) -> Optional[Any]:
         """セッション取得"""
@@ -14,7 +14,7 @@ except ImportError as e:
     MATPLOTLIB_AVAILABLE = False
 
 try:
-    import requests
+    from core.http_client import http_client
     REQUESTS_AVAILABLE = True
 except ImportError:
     print(f"[警告] requestsがインストールされていません")
@@ -65,10 +65,11 @@ class ChartService:
                     'expiration': 300
                 }
 
-                response = requests.post(
+                # レート制限の判定（本文のエラーコード）はこのループで行うため、クライアント側のリトライは無効
+                response = http_client.post(
                     'https://api.imgbb.com/1/upload',
                     data=data,
-                    timeout=10
+                    max_retries=0,
                 )
 
                 if response.status_code == 200:
@@ -146,11 +147,11 @@ class ChartService:
                 'type': 'base64'
             }
 
-            response = requests.post(
+            response = http_client.post(
                 'https://api.imgur.com/3/image',
                 headers=headers,
                 data=data,
-                timeout=10
+                retry_unsafe=True,
             )
 
             if response.status_code == 200:
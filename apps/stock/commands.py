@@ -3,6 +3,7 @@
 """
 from linebot.models import TextSendMessage, FlexSendMessage, ImageSendMessage
 from core.api import line_bot_api
+from core.responder import expect_delay
 from apps.stock.api import stock_api
 from apps.stock import stock_flex
 from apps.banking.api import banking_api
@@ -100,6 +101,8 @@ def handle_stock_detail(event, symbol_code: str, user_id: str):
     detail_flex = stock_flex.get_stock_detail_flex(stock, has_holding, has_short)
 
     # チャート画像生成（1週間分: 2016ポイント → 自動間引きで約400ポイントに削減）
+    # 生成とアップロードが長引いた場合は途中経過を先に返信し、詳細は push で送る
+    expect_delay("📈 チャートを作成しています。少々お待ちください…")
     chart_url = stock_api.generate_stock_chart(symbol_code, days=2016)
 
     messages = [detail_flex]
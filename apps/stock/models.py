@@ -12,20 +12,11 @@ from sqlalchemy import (
     Numeric,
     DateTime,
     Integer,
-    create_engine,
     text,
 )
-import config
-
-# データベースに接続するためのエンジンを作成
-# 接続プールの設定を追加してSSLエラーを回避
-engine = create_engine(
-    config.DATABASE_URL,
-    pool_pre_ping=True,  # 接続を使う前に有効性を確認
-    pool_recycle=3600,   # 1時間ごとに接続を再作成
-    pool_size=5,         # 接続プールサイズ
-    max_overflow=10      # 最大オーバーフロー接続数
-)
+
+# データベースエンジンはプロセス全体で共有する（接続プール設定は core/db.py）
+from core.db import engine
 
 Base = declarative_base()
 
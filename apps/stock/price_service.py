@@ -360,17 +360,44 @@ class PriceService:
 
     @staticmethod
     def pay_dividends():
-        """配当金を支払い（1日1回、午前8時前後）"""
+        """
+        配当金を支払い（1日1回、午前8時前後）
+
+        振込と支払い記録を1件ごとに同じトランザクションで確定し、支払日（JST）にすでに記録がある
+        保有株は飛ばすので、停止要求で途中で終えた場合も次回の実行で残りから再開できる。
+        """
+        from sqlalchemy import func, cast
+        from sqlalchemy.types import DateTime as SADateTime
+        from core.db import run_with_retry
+        from core.scheduler import job_scheduler, JobInterrupted
+        # 支払日は実行開始時点の JST の日付（DB のタイムゾーンや日付をまたぐ実行に左右されない）
+        pay_day = now_jst().date()
         db = SessionLocal()
         bank_db = BankingSessionLocal()
+        interrupted = None
         try:
             # 全保有株を取得
             holdings = db.query(UserStockHolding).all()
+            # 支払日に支払い済みの (株式口座, 銘柄)
+            # payment_date は DB のセッションのタイムゾーンの時刻なので、JST に直して日付を比べる
+            paid_date_jst = func.date(func.timezone('Asia/Tokyo', cast(DividendPayment.payment_date, SADateTime(timezone=True))))
+            paid_today = set(
+                db.query(DividendPayment.stock_account_id, DividendPayment.symbol_id)
+                .filter(paid_date_jst == pay_day)
+                .all()
+            )
             total_paid = 0
             success_count = 0
             fail_count = 0
-
-            for holding in holdings:
+            skipped_count = 0
+
+            for index, holding in enumerate(holdings):
+                if job_scheduler.stop_requested():
+                    interrupted = f"{index}/{len(holdings)}件で停止"
+                    break
+                if (holding.stock_account_id, holding.symbol_id) in paid_today:
+                    skipped_count += 1
+                    continue
                 try:
                     stock = db.query(StockSymbol).filter_by(symbol_id=holding.symbol_id).first()
                     if not stock or stock.dividend_yield <= 0:
@@ -411,34 +438,43 @@ class PriceService:
                         fail_count += 1
                         continue
 
-                    # 準備預金口座から振込（配当金）
+                    # 準備預金口座から振込（配当金）し、同じトランザクションで支払い記録を書く
+                    # （どちらかだけが確定することはないので、再実行しても二重に支払わない）
                     from apps.stock.stock_service import RESERVE_ACCOUNT_NUMBER
                     description = f"配当金 {stock.symbol_code} {holding.quantity}株"
+
+                    def pay_once():
+                        pay_db = SessionLocal()
+                        try:
+                            with pay_db.begin():
+                                tx = banking_api.post_transfer(
+                                    pay_db,
+                                    from_account_number=RESERVE_ACCOUNT_NUMBER,
+                                    to_account_number=bank_account.account_number,
+                                    amount=total_dividend,
+                                    currency='JPY',
+                                    description=description
+                                )
+                                pay_db.add(DividendPayment(
+                                    user_id=holding.user_id,
+                                    symbol_id=stock.symbol_id,
+                                    quantity=holding.quantity,
+                                    dividend_per_share=dividend_per_share,
+                                    total_dividend=total_dividend,
+                                    stock_account_id=holding.stock_account_id
+                                ))
+                            return tx
+                        finally:
+                            pay_db.close()
+
                     try:
-                        bank_tx = banking_api.transfer(
-                            from_account_number=RESERVE_ACCOUNT_NUMBER,
-                            to_account_number=bank_account.account_number,
-                            amount=float(total_dividend),
-                            currency='JPY',
-                            description=description
-                        )
+                        bank_tx = run_with_retry('pay_dividend', pay_once)
                         deposit_result = True
                     except Exception as e:
                         print(f"[配当金] 振込エラー (user_id={holding.user_id}): {e}")
                         deposit_result = False
 
                     if deposit_result:
-                        # 配当金支払い記録を作成
-                        dividend_payment = DividendPayment(
-                            user_id=holding.user_id,
-                            symbol_id=stock.symbol_id,
-                            quantity=holding.quantity,
-                            dividend_per_share=dividend_per_share,
-                            total_dividend=total_dividend,
-                            stock_account_id=holding.stock_account_id
-                        )
-                        db.add(dividend_payment)
-
                         # 税: 配当所得
                         try:
                             from apps.tax.tax_service import record_dividend_income
@@ -460,12 +496,14 @@ class PriceService:
                         fail_count += 1
 
                 except Exception as e:
+                    db.rollback()
                     print(f"[配当金] 個別処理エラー (user_id={holding.user_id}): {e}")
                     fail_count += 1
                     continue
 
             db.commit()
-            print(f"[配当金支払い] 完了 - 成功: {success_count}件, 失敗: {fail_count}件, 合計: ¥{total_paid:,.0f}")
+            status = f"中断（{interrupted}）" if interrupted else "完了"
+            print(f"[配当金支払い] {status} - 成功: {success_count}件, 失敗: {fail_count}件, 支払い済み: {skipped_count}件, 合計: ¥{total_paid:,.0f}")
 
         except Exception as e:
             import traceback
@@ -476,6 +514,9 @@ class PriceService:
             db.close()
             bank_db.close()
 
+        if interrupted:
+            raise JobInterrupted(interrupted)
+
     @staticmethod
     def accrue_short_interest():
         """空売りの貸株料を計算（1日1回）"""
@@ -3,14 +3,17 @@
 
 購入・売却フローの状態管理
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Optional
+
+import config
+from core.session_store import session_store
 
 
 class StockSessionManager:
     """株式トレード用セッション管理"""
 
     def __init__(self):
-        self._sessions: Dict[str, Any] = {}
+        self._sessions = session_store.namespace('stock', config.SESSION_TTL_STOCK)
 
     def start_trade_session(self, user_id: str, trade_type: str, symbol_code: str):
         """
@@ -45,8 +48,10 @@ class StockSessionManager:
 
     def update_session(self, user_id: str, data: Dict):
         """セッション更新"""
-        if user_id in self._sessions:
-            self._sessions[user_id].update(data)
+        session = self._sessions.get(user_id)
+        if session is not None:
+            session.update(data)
+            self._sessions.touch(user_id)
 
     def get_session(self, user_id: str) -> Optional[Dict]:
         """セッション取得"""
@@ -6,22 +6,25 @@ from core.api import line_bot_api
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 import random
-import psycopg2
-import config
+from core.db import raw_connection
 
 
-def check_message_today(conn, user_id, message):
-    """今日既に同じメッセージを送信したかチェック"""
+def check_message_today(conn, user_id, message, before: datetime):
+    """今日、before（今回の発言の送信時刻）より前に同じメッセージを送信したかチェック
+
+    今回の発言自体は数えないので、今回のログが書き込まれているかどうかに左右されない。
+    """
     with conn.cursor() as cur:
         cur.execute("""
             SELECT COUNT(*)
             FROM logs
             WHERE user_id = %s
             AND message LIKE %s
-            AND (sent_at AT TIME ZONE 'Asia/Tokyo')::date = (CURRENT_TIMESTAMP AT TIME ZONE 'Asia/Tokyo')::date
-        """, (user_id, message))
+            AND sent_at < %s
+            AND (sent_at AT TIME ZONE 'Asia/Tokyo')::date = (%s AT TIME ZONE 'Asia/Tokyo')::date
+        """, (user_id, message, before, before))
         count = cur.fetchone()[0]
-        return count > 1
+        return count >= 1
 
 
 def handle_userid(event, user_id):
@@ -68,9 +71,18 @@ def handle_timetable(event):
 
 def handle_omikuji(event, user_id, display_name, text):
     """おみくじコマンド"""
-    conn = psycopg2.connect(config.DATABASE_URL)
+    # 今回の発言より前（LINE の送信時刻）に引いたかを数える。
+    # 直前の発言がまだ書き込み待ちの場合に備えて先に書き込み、書き込めなければ引いたものとして扱う
+    from apps.recording_logs import flush_logs
+    sent_at = datetime.fromtimestamp(event.timestamp / 1000, ZoneInfo("Asia/Tokyo"))
+    if flush_logs():
+        with raw_connection() as conn:
+            already_drawn = check_message_today(conn, user_id, text, sent_at)
+    else:
+        print(f"[Omikuji] ログを書き込めないため引いたものとして扱う user={user_id}")
+        already_drawn = True
     messages = []
-    if not check_message_today(conn, user_id, text) or user_id == "Ubada9dde68b83179125cba4bc0b5633c":
+    if not already_drawn or user_id == "Ubada9dde68b83179125cba4bc0b5633c":
         messages.append(TextSendMessage(text=display_name+"さんの運勢は……"))
         num = random.randint(1, 8)
         if num == 1:
@@ -103,8 +115,6 @@ def handle_omikuji(event, user_id, display_name, text):
         messages.append(TextSendMessage(text="御神籤は一日に一度迄です。\n許されるのは塩路様だけです。"))
 
     line_bot_api.reply_message(event.reply_token, messages)
-    if conn:
-        conn.close()
 
 
 def handle_rpn(event, text):
@@ -159,15 +169,15 @@ def handle_setname(event, user_id, text):
         return
 
     try:
-        conn = psycopg2.connect(config.DATABASE_URL)
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO users (line_id, my_name)
-            VALUES (%s, %s)
-            ON CONFLICT (line_id)
-            DO UPDATE SET my_name = EXCLUDED.my_name
-        """, (user_id, my_name))
-        conn.commit()
+        with raw_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO users (line_id, my_name)
+                    VALUES (%s, %s)
+                    ON CONFLICT (line_id)
+                    DO UPDATE SET my_name = EXCLUDED.my_name
+                """, (user_id, my_name))
+            conn.commit()
         line_bot_api.reply_message(
             event.reply_token,
             TextSendMessage(text="名前を保存しました。")
@@ -178,11 +188,15 @@ def handle_setname(event, user_id, text):
             event.reply_token,
             TextSendMessage(text="名前の保存中にエラーが発生しました。")
         )
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
+
+
+# お遊びコマンド一覧（ルーター登録用）
+FUN_COMMAND_TEXTS = (
+    "?塩爺の好きな食べ物は？",
+    "?ほんちゃんはゲイ？",
+    "?おみくじを何回も引くのは犯罪ですか？",
+    "?ほんちゃんは童貞？",
+)
 
 
 def handle_fun_commands(event, text):
@@ -225,3 +239,29 @@ def handle_default_user_message(event):
         event.reply_token,
         TextSendMessage(text="塩爺です。?ヘルプ と入力すると利用可能なコマンド一覧が表示されます。")
     )
+
+
+def handle_job_status(event):
+    """定期ジョブの次回実行予定と前回の結果を表示（管理者用）"""
+    from core.scheduler import job_scheduler
+    from core.leader import scheduler_leader
+
+    lines = ["⏱ 定期ジョブ"]
+    if job_scheduler.running:
+        lines.append("（このプロセスで実行中）")
+    else:
+        leader = scheduler_leader.status().get('current_leader')
+        holder = leader['holder'] if leader else "不明"
+        lines.append(f"（実行中のプロセス: {holder}）")
+
+    for job in job_scheduler.job_summaries():
+        next_run = job['next_run_time']
+        next_text = datetime.fromisoformat(next_run).strftime('%m/%d %H:%M') if next_run else "-"
+        if job['last_success'] is None:
+            last_text = "未実行"
+        else:
+            mark = "✅" if job['last_success'] else "❌"
+            last_text = f"{mark} {job['last_duration']:.1f}秒"
+        lines.append(f"\n・{job['name']}\n  次回: {next_text} / 前回: {last_text}")
+
+    line_bot_api.reply_message(event.reply_token, TextSendMessage(text="\n".join(lines)))
@@ -5,6 +5,10 @@ from linebot.models import TextSendMessage
 from core.api import line_bot_api
 from apps.work import work_service, work_flex
 from apps.banking.api import banking_api
+from core.responder import expect_delay
+
+# 労働処理（給与振込）が長引いた場合に先に返す途中経過
+WORK_INTERIM_TEXT = "💼 労働中です…"
 
 
 def handle_work_command(event, user_id):
@@ -50,6 +54,7 @@ def handle_work_command(event, user_id):
 
             if result['success']:
                 # 登録成功後、すぐに労働を実行
+                expect_delay(WORK_INTERIM_TEXT)
                 work_result = work_service.do_work(user_id)
                 line_bot_api.reply_message(
                     event.reply_token,
@@ -68,6 +73,7 @@ def handle_work_command(event, user_id):
         return
 
     # 登録済みの場合、労働を実行
+    expect_delay(WORK_INTERIM_TEXT)
     work_result = work_service.do_work(user_id)
 
     if work_result['success']:
@@ -93,6 +99,7 @@ def handle_work_postback(event, data: dict, user_id: str):
 
         if result['success']:
             # 登録成功後、すぐに労働を実行
+            expect_delay(WORK_INTERIM_TEXT)
             work_result = work_service.do_work(user_id)
             line_bot_api.reply_message(
                 event.reply_token,
@@ -112,6 +119,7 @@ def handle_work_postback(event, data: dict, user_id: str):
 
         if result['success']:
             # 登録成功後、すぐに労働を実行
+            expect_delay(WORK_INTERIM_TEXT)
             work_result = work_service.do_work(user_id)
             line_bot_api.reply_message(
                 event.reply_token,
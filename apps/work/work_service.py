@@ -9,6 +9,8 @@ from sqlalchemy import text
 from apps.banking.main_bank_system import get_db
 from apps.banking.api import banking_api
 
+# 給与の支払元口座（ｶﾌﾞｼｷｶﾞｲｼｬ ﾌﾞﾗｯｸ 001-8450464）
+WORK_PAYER_ACCOUNT_NUMBER = '8450464'
 
 def get_salary_account_info(user_id: str) -> Optional[Dict]:
     """
@@ -181,7 +183,7 @@ def do_work(user_id: str) -> Dict:
         
         try:
             result = transfer_funds(
-                from_account_number='8450464',  # 運営元口座番号
+                from_account_number=WORK_PAYER_ACCOUNT_NUMBER,  # 運営元口座番号
                 to_account_number=account_number,
                 amount=salary,
                 currency='JPY',
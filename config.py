@@ -56,3 +56,173 @@ LOAN_MAX_MULTIPLIER = Decimal('5')
 LOAN_INTEREST_FACTOR = Decimal('0.016')
 LOAN_INTEREST_RATE_CAP = Decimal('0.08')
 LOAN_LATE_WEEKLY_RATE = Decimal('0.20')
+
+# =========================================
+# Webhook 非同期処理
+# =========================================
+
+# イベント処理ワーカースレッド数
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '8'))
+# 受付済み・未完了イベントの上限（超えた分は503で返しLINEの再送に任せる）
+WEBHOOK_MAX_IN_FLIGHT = int(os.environ.get('WEBHOOK_MAX_IN_FLIGHT', '64'))
+# 上限到達時に空きを待つ秒数
+WEBHOOK_SUBMIT_TIMEOUT = float(os.environ.get('WEBHOOK_SUBMIT_TIMEOUT', '2'))
+
+# =========================================
+# LINE プロフィールキャッシュ
+# =========================================
+
+# 表示名をそのまま使う秒数（経過後は古い値を返しつつバックグラウンドで再取得）
+PROFILE_CACHE_TTL = int(os.environ.get('PROFILE_CACHE_TTL', '600'))
+# 再取得できなかった場合に古い値を使い続けてよい秒数（TTL経過後から数える）
+PROFILE_CACHE_STALE_TTL = int(os.environ.get('PROFILE_CACHE_STALE_TTL', '3600'))
+# キャッシュする最大件数（超えたら最も古く使われたものから破棄）
+PROFILE_CACHE_MAX_SIZE = int(os.environ.get('PROFILE_CACHE_MAX_SIZE', '5000'))
+
+# =========================================
+# メッセージログのバッチ書き込み
+# =========================================
+
+# 1回の INSERT でまとめて書き込む最大行数
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', '100'))
+# 行数が溜まらなくても書き込むまでの最大待ち時間（ミリ秒）
+LOG_FLUSH_INTERVAL_MS = int(os.environ.get('LOG_FLUSH_INTERVAL_MS', '500'))
+# 書き込み待ちキューの上限（超えた分は破棄して件数を記録）
+LOG_QUEUE_MAX = int(os.environ.get('LOG_QUEUE_MAX', '10000'))
+
+# =========================================
+# データベース接続プール（プロセス全体で共有）
+# =========================================
+
+# gunicorn のワーカープロセス数 / ワーカーあたりのスレッド数
+GUNICORN_WORKERS = int(os.environ.get('WEB_CONCURRENCY', '1'))
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', '1'))
+# 全プロセス合計で使ってよい接続数の上限（任意。Postgres の max_connections に合わせる）
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', '0')) or None
+# プールサイズ: 明示指定がなければ リクエストスレッド + Webhookワーカー + バックグラウンド処理分
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '0')) or (GUNICORN_THREADS + WEBHOOK_WORKERS + 2)
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '5'))
+# 接続の空き待ちのタイムアウト（秒）
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '30'))
+# デッドロック/直列化失敗したトランザクションの最大試行回数
+DB_RETRY_ATTEMPTS = int(os.environ.get('DB_RETRY_ATTEMPTS', '5'))
+# 再実行までの待ち時間（秒）: 0〜min(最大, 基準 × 2^(回数-1)) のランダム
+DB_RETRY_BASE_DELAY = float(os.environ.get('DB_RETRY_BASE_DELAY', '0.02'))
+DB_RETRY_MAX_DELAY = float(os.environ.get('DB_RETRY_MAX_DELAY', '0.5'))
+
+# =========================================
+# 外部 HTTP 呼び出し（LINE API / 画像アップロード）
+# =========================================
+
+# ホストごとに保持する keep-alive 接続数（Webhookワーカー数に合わせる）
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '0')) or max(10, WEBHOOK_WORKERS + GUNICORN_THREADS)
+# 429/5xx/接続失敗時の最大リトライ回数
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', '2'))
+# リトライ間隔の基準秒数（指数バックオフ + ジッター）
+HTTP_BACKOFF_BASE = float(os.environ.get('HTTP_BACKOFF_BASE', '0.5'))
+
+# =========================================
+# Webhook 再送の重複排除
+# =========================================
+
+# 処理済み webhookEventId を覚えておく秒数（LINEの再送はこの時間内に届く前提）
+WEBHOOK_DEDUP_TTL = int(os.environ.get('WEBHOOK_DEDUP_TTL', '86400'))
+# メモリ上に保持する最大件数
+WEBHOOK_DEDUP_MAX_SIZE = int(os.environ.get('WEBHOOK_DEDUP_MAX_SIZE', '50000'))
+# 'memory'（プロセス内のみ）または 'postgres'（複数ワーカーで共有。webhook_event_dedup テーブルが必要）
+WEBHOOK_DEDUP_BACKEND = os.environ.get('WEBHOOK_DEDUP_BACKEND', 'memory')
+
+# =========================================
+# バックグラウンドジョブのリーダー選出
+# =========================================
+
+# 有効な場合、Postgres の advisory lock を取得した1プロセスだけがスケジューラーを動かす
+LEADER_ELECTION_ENABLED = os.environ.get('LEADER_ELECTION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# リース更新（生存確認）/ 非リーダーのロック取得試行の間隔（秒）
+LEADER_RENEW_INTERVAL = int(os.environ.get('LEADER_RENEW_INTERVAL', '15'))
+
+# =========================================
+# 会話セッション（銀行・株式・ショップ・ゲーム）
+# =========================================
+
+# 最後の操作からセッションを破棄するまでの秒数（種類ごと）
+SESSION_TTL_BANKING = int(os.environ.get('SESSION_TTL_BANKING', '900'))
+SESSION_TTL_STOCK = int(os.environ.get('SESSION_TTL_STOCK', '900'))
+SESSION_TTL_SHOP = int(os.environ.get('SESSION_TTL_SHOP', '900'))
+# プレイ中のブラックジャックは期限切れでロック中のチップを返却する
+SESSION_TTL_GAME = int(os.environ.get('SESSION_TTL_GAME', '1800'))
+# 'memory'（プロセス内のみ）または 'postgres'（ワーカー間で共有・再起動後も保持。conversation_sessions テーブルが必要）
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'memory')
+# 'memory' の場合: 全セッション合計の概算メモリ量の上限（バイト。超えたら最も古く使われたものから破棄）
+SESSION_MEMORY_CAP_BYTES = int(os.environ.get('SESSION_MEMORY_CAP_BYTES', str(32 * 1024 * 1024)))
+# 期限切れセッションを掃除する間隔（秒）
+SESSION_SWEEP_INTERVAL = int(os.environ.get('SESSION_SWEEP_INTERVAL', '60'))
+# 'postgres' の場合: 読み込んだセッションをプロセス内で使い回す秒数（0 で無効）
+# 他ワーカーの更新はこの秒数だけ遅れて見える（古い値からの書き込みはバージョン比較で破棄される）
+SESSION_READ_CACHE_TTL = float(os.environ.get('SESSION_READ_CACHE_TTL', '1'))
+# 'postgres' の場合: 読み込みキャッシュに保持する最大ユーザー数
+SESSION_READ_CACHE_SIZE = int(os.environ.get('SESSION_READ_CACHE_SIZE', '2048'))
+
+# =========================================
+# 懲役
+# =========================================
+
+# 懲役中ユーザーの索引を DB から再読み込みする間隔（秒。他ワーカーでの懲役/釈放の反映用）
+PRISON_INDEX_REFRESH_INTERVAL = int(os.environ.get('PRISON_INDEX_REFRESH_INTERVAL', '60'))
+
+# =========================================
+# 回収（督促通知）
+# =========================================
+
+# 督促通知の索引を DB から再読み込みする間隔（秒。他ワーカーでの変更の反映用）
+COLLECTIONS_NOTICE_REFRESH_INTERVAL = int(os.environ.get('COLLECTIONS_NOTICE_REFRESH_INTERVAL', '300'))
+# 同じユーザーに督促を push する最小間隔（秒）
+COLLECTIONS_NOTICE_PUSH_INTERVAL = int(os.environ.get('COLLECTIONS_NOTICE_PUSH_INTERVAL', '3600'))
+
+# =========================================
+# レート制限
+# =========================================
+
+# コマンドのレート制限を有効にするか
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# 各バケットの '容量:毎秒の補充数'（cheap: DB をほぼ使わない / db: 複数クエリ / render: 画像生成）
+RATE_LIMIT_USER_CHEAP = os.environ.get('RATE_LIMIT_USER_CHEAP', '20:1')
+RATE_LIMIT_USER_DB = os.environ.get('RATE_LIMIT_USER_DB', '8:0.25')
+RATE_LIMIT_USER_RENDER = os.environ.get('RATE_LIMIT_USER_RENDER', '2:0.05')
+RATE_LIMIT_GROUP_CHEAP = os.environ.get('RATE_LIMIT_GROUP_CHEAP', '60:3')
+RATE_LIMIT_GROUP_DB = os.environ.get('RATE_LIMIT_GROUP_DB', '20:0.5')
+RATE_LIMIT_GROUP_RENDER = os.environ.get('RATE_LIMIT_GROUP_RENDER', '4:0.1')
+# 保持するバケット数の上限（超えたら最も古く使われたものから破棄する）
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', '10000'))
+
+# =========================================
+# 返信（返信トークンの期限）
+# =========================================
+
+# イベント発生からこの秒数を過ぎたら返信トークンを使わず push で送る
+REPLY_DEADLINE_SECONDS = float(os.environ.get('REPLY_DEADLINE_SECONDS', '50'))
+# 時間のかかる処理（チャート生成など）でこの秒数経っても未返信なら、途中経過を先に返信して結果は push で送る
+REPLY_INTERIM_AFTER = float(os.environ.get('REPLY_INTERIM_AFTER', '5'))
+
+# =========================================
+# 停止処理（SIGTERM）
+# =========================================
+
+# 停止処理全体の持ち時間（秒。gunicorn の graceful_timeout より短くする）
+SHUTDOWN_DEADLINE = float(os.environ.get('SHUTDOWN_DEADLINE', '25'))
+# 受付済みの Webhook イベントを処理し切るのを待つ最大秒数
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get('SHUTDOWN_DRAIN_TIMEOUT', '10'))
+# 実行中のジョブが途中までを確定して終わるのを待つ最大秒数
+SHUTDOWN_JOB_TIMEOUT = float(os.environ.get('SHUTDOWN_JOB_TIMEOUT', '10'))
+
+# =========================================
+# システム口座の残高の分散（サブ元帳）
+# =========================================
+
+# 入金をバケットに分散する口座（カンマ区切り）。空なら各機能の口座の定数から決める
+# （準備預金・ショップ運営・給与支払元・税金の納付先・ミニゲーム運営。apps/banking/hot_accounts.py）
+HOT_ACCOUNT_NUMBERS = os.environ.get('HOT_ACCOUNT_NUMBERS', '')
+# 1口座あたりのバケット数（1 で分散しない）
+HOT_ACCOUNT_BUCKETS = int(os.environ.get('HOT_ACCOUNT_BUCKETS', '8'))
+# バケットを口座の残高に寄せる間隔（秒）
+HOT_ACCOUNT_SWEEP_INTERVAL = int(os.environ.get('HOT_ACCOUNT_SWEEP_INTERVAL', '300'))
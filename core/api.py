@@ -1,10 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
 from linebot import LineBotApi, WebhookHandler
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
 import config
-import requests
+from core.http_client import http_client
+from core.responder import responder
 
-line_bot_api = LineBotApi(config.LINE_CHANNEL_ACCESS_TOKEN)
+
+class _PooledHttpClient(RequestsHttpClient):
+    """line-bot-sdk の通信を共有 HTTP クライアント（keep-alive/リトライ）経由にする HttpClient"""
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return RequestsHttpResponse(http_client.get(url, headers=headers, params=params, stream=stream, timeout=timeout))
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return RequestsHttpResponse(http_client.post(url, headers=headers, data=data, timeout=timeout))
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return RequestsHttpResponse(http_client.put(url, headers=headers, data=data, timeout=timeout))
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return RequestsHttpResponse(http_client.delete(url, headers=headers, data=data, timeout=timeout))
+
+
+class _ResponderLineBotApi(LineBotApi):
+    """イベント処理中の reply を core.responder に溜めて、まとめて送る LineBotApi"""
+
+    def reply_message(self, reply_token, messages, notification_disabled=False, timeout=None):
+        if responder.buffer(reply_token, messages, notification_disabled):
+            return
+        super().reply_message(reply_token, messages, notification_disabled=notification_disabled, timeout=timeout)
+
+    def push_message(self, to, messages, *args, **kwargs):
+        # 溜まっている reply を先に送って、送信順を保つ
+        responder.flush_pending()
+        super().push_message(to, messages, *args, **kwargs)
+
+    def send_reply(self, reply_token, messages, notification_disabled=False):
+        """溜めずにそのまま reply する（core.responder から使う）"""
+        super().reply_message(reply_token, messages, notification_disabled=notification_disabled)
+
+    def send_push(self, to, messages, notification_disabled=False):
+        """溜めずにそのまま push する（core.responder から使う）"""
+        super().push_message(to, messages, notification_disabled=notification_disabled)
+
+
+# timeout=None: 各呼び出しのタイムアウトは core.http_client のエンドポイント設定に従う
+line_bot_api = _ResponderLineBotApi(config.LINE_CHANNEL_ACCESS_TOKEN, timeout=None, http_client=_PooledHttpClient)
 handler = WebhookHandler(config.LINE_CHANNEL_SECRET)
 
+# ローディング表示の送信用（返信処理を待たせない）
+_loading_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='line-loading')
+
 
 def show_loading_animation(chat_id: str, loading_seconds: int = 5):
     """
@@ -17,6 +63,7 @@ def show_loading_animation(chat_id: str, loading_seconds: int = 5):
     Note:
         - グループチャットや複数人トークでは使用不可
         - 個人チャット (1:1) のみで有効
+        - 送信はバックグラウンドで行い、呼び出し元（返信処理）を待たせない
     """
     # 有効な秒数のみ許可
     valid_seconds = [5, 10, 20, 30, 40, 50, 60]
@@ -33,9 +80,13 @@ def show_loading_animation(chat_id: str, loading_seconds: int = 5):
         "loadingSeconds": loading_seconds
     }
 
+    _loading_executor.submit(_start_loading, url, headers, payload)
+
+
+def _start_loading(url: str, headers: dict, payload: dict):
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=5)
+        response = http_client.post(url, headers=headers, json=payload, retry_unsafe=True)
         if response.status_code != 202:
             print(f"[Loading Animation] Failed: {response.status_code} - {response.text}")
     except Exception as e:
-        print(f"[Loading Animation] Exception: {e}")
\ No newline at end of file
+        print(f"[Loading Animation] Exception: {e}")
@@ -0,0 +1,244 @@
+"""
+プロセス共通のデータベース接続プロバイダー
+
+銀行・株式などの ORM セッションと、psycopg2 を直接使う処理のすべてが
+この1つのエンジン（接続プール）を共有する。
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Optional, TypeVar
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+import config
+
+
+def _resolve_pool_size() -> int:
+    """プールサイズを決定（全体上限がある場合はワーカー数で割った値に収める）"""
+    size = config.DB_POOL_SIZE
+    if config.DB_MAX_CONNECTIONS:
+        per_worker = max(1, config.DB_MAX_CONNECTIONS // max(1, config.GUNICORN_WORKERS) - config.DB_MAX_OVERFLOW)
+        size = min(size, per_worker)
+    return max(1, size)
+
+
+class _PoolStats:
+    """接続プールの統計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.waits_over_10ms = 0
+        self.overflow_peak = 0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_seconds_total += seconds
+            if seconds > self.wait_seconds_max:
+                self.wait_seconds_max = seconds
+            if seconds > 0.01:
+                self.waits_over_10ms += 1
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_overflow(self, overflow: int):
+        with self._lock:
+            if overflow > self.overflow_peak:
+                self.overflow_peak = overflow
+
+
+_stats = _PoolStats()
+
+
+class _InstrumentedQueuePool(QueuePool):
+    """接続の取得待ち時間を計測する QueuePool"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _stats.record_wait(time.perf_counter() - start)
+            _stats.record_overflow(max(0, self.overflow()))
+
+
+# プロセス全体で共有するエンジン
+engine = create_engine(
+    config.DATABASE_URL,
+    poolclass=_InstrumentedQueuePool,
+    pool_pre_ping=True,  # 接続を使う前に有効性を確認
+    pool_recycle=3600,   # 1時間ごとに接続を再作成
+    pool_size=_resolve_pool_size(),
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+)
+
+
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    _stats.incr('connects')
+
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    _stats.incr('checkouts')
+
+
+@event.listens_for(engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    _stats.incr('checkins')
+
+
+@event.listens_for(engine, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    _stats.incr('invalidations')
+
+
+@contextmanager
+def raw_connection():
+    """
+    プールから psycopg2 接続を借りるコンテキストマネージャー
+
+    psycopg2.connect() の代わりに使う。抜けるときに物理接続は閉じずにプールへ返却される
+    （未コミットの変更はロールバックされる）。
+    """
+    conn = engine.raw_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def pool_stats() -> Dict[str, Any]:
+    """接続プールの利用状況を取得"""
+    pool = engine.pool
+    with _stats._lock:
+        return {
+            'pool_size': pool.size(),
+            'max_overflow': config.DB_MAX_OVERFLOW,
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(0, pool.overflow()),
+            'overflow_peak': _stats.overflow_peak,
+            'checkouts': _stats.checkouts,
+            'checkins': _stats.checkins,
+            'connects': _stats.connects,
+            'invalidations': _stats.invalidations,
+            'wait_seconds_total': round(_stats.wait_seconds_total, 6),
+            'wait_seconds_max': round(_stats.wait_seconds_max, 6),
+            'waits_over_10ms': _stats.waits_over_10ms,
+        }
+
+
+# ---- 競合（デッドロック/直列化失敗）のリトライ ----
+
+T = TypeVar('T')
+
+# 再実行すれば成功しうるエラー（SQLSTATE）
+_RETRYABLE_SQLSTATES = {
+    '40P01': 'deadlock',               # deadlock_detected
+    '40001': 'serialization_failure',  # serialization_failure
+    '55P03': 'lock_not_available',     # lock_not_available（lock_timeout / NOWAIT）
+}
+
+
+def retryable_reason(exc: BaseException) -> Optional[str]:
+    """再実行すれば成功しうる DB エラーならその種類を返す（それ以外は None）"""
+    orig = getattr(exc, 'orig', exc)
+    return _RETRYABLE_SQLSTATES.get(getattr(orig, 'pgcode', None))
+
+
+class _ContentionStats:
+    """行ロックの待ち時間とリトライの統計（処理名ごと）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lock_waits: Dict[str, list] = {}  # name -> [回数, 合計秒, 最大秒, 10ms超の回数]
+        self.retries: Dict[tuple, int] = {}    # (name, reason) -> 回数
+        self.exhausted: Dict[str, int] = {}
+
+    def record_lock_wait(self, name: str, seconds: float):
+        with self._lock:
+            row = self.lock_waits.setdefault(name, [0, 0.0, 0.0, 0])
+            row[0] += 1
+            row[1] += seconds
+            row[2] = max(row[2], seconds)
+            if seconds > 0.01:
+                row[3] += 1
+
+    def record_retry(self, name: str, reason: str):
+        with self._lock:
+            self.retries[(name, reason)] = self.retries.get((name, reason), 0) + 1
+
+    def record_exhausted(self, name: str):
+        with self._lock:
+            self.exhausted[name] = self.exhausted.get(name, 0) + 1
+
+
+_contention = _ContentionStats()
+
+
+def record_lock_wait(name: str, seconds: float):
+    """FOR UPDATE で行ロックを取るのにかかった時間を記録する"""
+    _contention.record_lock_wait(name, seconds)
+    from core.metrics import metrics
+    metrics.incr('linebot_db_lock_wait_seconds_total', 'Time spent acquiring row locks', seconds, op=name)
+
+
+def run_with_retry(name: str, func: Callable[[], T], attempts: Optional[int] = None) -> T:
+    """
+    デッドロック/直列化失敗で失敗したトランザクションを再実行する
+
+    func は1回分のトランザクション全体（セッションの作成から commit まで）を行う関数。
+    再実行の前に、上限付きの指数バックオフ + ジッターで待つ。
+
+    Args:
+        name: 処理名（統計・メトリクスのキー）
+        func: 1回分の処理
+        attempts: 最大試行回数（省略時は DB_RETRY_ATTEMPTS）
+    """
+    from core.metrics import metrics
+    attempts = attempts or config.DB_RETRY_ATTEMPTS
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except Exception as e:
+            reason = retryable_reason(e)
+            if reason is None:
+                raise
+            if attempt >= attempts:
+                _contention.record_exhausted(name)
+                metrics.incr('linebot_db_retry_exhausted_total', 'Transactions that failed after all retries', op=name)
+                raise
+            _contention.record_retry(name, reason)
+            metrics.incr('linebot_db_retries_total', 'Transactions retried after a deadlock or serialization failure',
+                         op=name, reason=reason)
+            delay = random.uniform(0, min(config.DB_RETRY_MAX_DELAY, config.DB_RETRY_BASE_DELAY * (2 ** (attempt - 1))))
+            print(f"[DB] {name}: {reason} のため再実行します（{attempt}/{attempts}回目, {delay * 1000:.0f}ms後）")
+            time.sleep(delay)
+
+
+def contention_stats() -> Dict[str, Any]:
+    """行ロックの待ち時間とリトライの統計を取得"""
+    with _contention._lock:
+        result: Dict[str, Any] = {}
+        for name, (count, total, peak, over_10ms) in _contention.lock_waits.items():
+            result[f'{name}.lock_waits'] = count
+            result[f'{name}.lock_wait_seconds_total'] = round(total, 6)
+            result[f'{name}.lock_wait_seconds_max'] = round(peak, 6)
+            result[f'{name}.lock_waits_over_10ms'] = over_10ms
+        for (name, reason), count in _contention.retries.items():
+            result[f'{name}.retries_{reason}'] = count
+        for name, count in _contention.exhausted.items():
+            result[f'{name}.retry_exhausted'] = count
+        return result
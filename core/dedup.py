@@ -0,0 +1,158 @@
+"""
+Webhook 再送イベントの重複排除
+
+処理が遅れて LINE が再送したイベント（deliveryContext.isRedelivery）を
+webhookEventId で判定し、ルーティング前に破棄する。
+受信済みIDはメモリ上の有界な辞書に TTL 付きで保持し、
+複数ワーカー構成では Postgres のテーブルも併用する。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import config
+
+_INSERT_SQL = """
+    INSERT INTO webhook_event_dedup (event_id, expires_at)
+    VALUES (%s, now() + %s * interval '1 second')
+    ON CONFLICT (event_id) DO UPDATE SET expires_at = EXCLUDED.expires_at
+        WHERE webhook_event_dedup.expires_at < now()
+    RETURNING 1
+"""
+_DELETE_SQL = "DELETE FROM webhook_event_dedup WHERE event_id = %s"
+_PURGE_SQL = "DELETE FROM webhook_event_dedup WHERE expires_at < now()"
+
+# 期限切れ行を掃除する間隔（秒）
+_PURGE_INTERVAL = 600
+
+
+class EventDeduplicator:
+    """webhookEventId による重複排除"""
+
+    def __init__(self, ttl: int, max_size: int, backend: str = 'memory'):
+        """
+        Args:
+            ttl: 受信済みIDを覚えておく秒数
+            max_size: メモリ上に保持する最大件数（超えたら古いものから破棄）
+            backend: 'memory' または 'postgres'
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.use_postgres = backend == 'postgres'
+        self._lock = threading.Lock()
+        # event_id -> 期限（monotonic）。挿入順 = 期限順
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._last_purge = time.monotonic()
+        self._checked = 0
+        self._redeliveries = 0
+        self._duplicates = 0
+        self._backend_errors = 0
+
+    def check_and_mark(self, event) -> bool:
+        """
+        イベントを受信済みとして記録し、初めてのイベントかどうかを返す
+
+        Returns:
+            bool: 初めて受信したイベントなら True（重複なら False）
+        """
+        event_id = getattr(event, 'webhook_event_id', None)
+        if not event_id:
+            return True
+        delivery_context = getattr(event, 'delivery_context', None)
+        is_redelivery = bool(getattr(delivery_context, 'is_redelivery', False))
+
+        now = time.monotonic()
+        with self._lock:
+            self._checked += 1
+            if is_redelivery:
+                self._redeliveries += 1
+            self._expire(now)
+            expires_at = self._seen.get(event_id)
+            if expires_at is not None and expires_at > now:
+                self._duplicates += 1
+                return False
+            self._seen[event_id] = now + self.ttl
+            self._seen.move_to_end(event_id)
+            while len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+
+        if self.use_postgres and not self._mark_shared(event_id):
+            with self._lock:
+                self._duplicates += 1
+            return False
+        return True
+
+    def forget(self, event):
+        """受付に失敗したイベントの記録を取り消す（再送時に処理させるため）"""
+        event_id = getattr(event, 'webhook_event_id', None)
+        if not event_id:
+            return
+        with self._lock:
+            self._seen.pop(event_id, None)
+        if self.use_postgres:
+            try:
+                self._execute(_DELETE_SQL, (event_id,))
+            except Exception as e:
+                print(f"[Dedup] 記録の取り消しに失敗: {e}")
+                with self._lock:
+                    self._backend_errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """重複件数などの統計を取得"""
+        with self._lock:
+            return {
+                'backend': 'postgres' if self.use_postgres else 'memory',
+                'size': len(self._seen),
+                'max_size': self.max_size,
+                'checked': self._checked,
+                'redeliveries': self._redeliveries,
+                'duplicates': self._duplicates,
+                'backend_errors': self._backend_errors,
+            }
+
+    def _expire(self, now: float):
+        # 期限は挿入順に並ぶので先頭から切れたものを捨てる
+        while self._seen:
+            event_id, expires_at = next(iter(self._seen.items()))
+            if expires_at > now:
+                break
+            self._seen.popitem(last=False)
+
+    def _mark_shared(self, event_id: str) -> bool:
+        """Postgres に記録（他ワーカーが記録済みなら False）。DB障害時は処理を優先して True"""
+        try:
+            inserted = self._execute(_INSERT_SQL, (event_id, self.ttl), fetch=True)
+            self._purge_if_due()
+            return inserted
+        except Exception as e:
+            print(f"[Dedup] 共有テーブルへの記録に失敗: {e}")
+            with self._lock:
+                self._backend_errors += 1
+            return True
+
+    def _purge_if_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_purge < _PURGE_INTERVAL:
+                return
+            self._last_purge = now
+        self._execute(_PURGE_SQL, ())
+
+    @staticmethod
+    def _execute(sql: str, params: tuple, fetch: bool = False) -> Optional[bool]:
+        from core.db import raw_connection
+        with raw_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                result = cur.fetchone() is not None if fetch else None
+            conn.commit()
+        return result
+
+
+# グローバルインスタンス
+deduplicator = EventDeduplicator(
+    ttl=config.WEBHOOK_DEDUP_TTL,
+    max_size=config.WEBHOOK_DEDUP_MAX_SIZE,
+    backend=config.WEBHOOK_DEDUP_BACKEND,
+)
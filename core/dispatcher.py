@@ -0,0 +1,270 @@
+"""
+Webhookイベントの非同期ディスパッチャー
+
+/callback では署名検証とパースだけを同期で行い、
+各イベントのハンドラー実行はワーカースレッドに委譲する。
+
+イベントはレーン（ユーザー単位、じゃんけんはグループ単位）に振り分けられ、
+同じレーンのイベントは到着順に1件ずつ処理される。
+異なるレーン同士は並列に処理される。
+"""
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+from linebot.models import MessageEvent, PostbackEvent
+
+import config
+from core.api import handler
+from core.dedup import deduplicator
+
+
+# グループ全体で状態を共有するじゃんけん関連の入力（グループ単位で直列化する）
+JANKEN_GROUP_TEXTS = frozenset(["?じゃんけん", "?参加", "?開始", "?キャンセル"])
+JANKEN_GROUP_POSTBACKS = frozenset(["action=join_janken", "action=start_janken", "action=cancel_janken"])
+
+
+class DispatcherBusy(Exception):
+    """処理中イベントが上限に達し、受付できなかった"""
+
+
+def lane_key(event) -> Optional[str]:
+    """
+    イベントの処理レーンを決定する
+
+    Args:
+        event: LINE Webhookイベント
+
+    Returns:
+        Optional[str]: レーンキー（送信元が特定できない場合はNone）
+    """
+    source = getattr(event, 'source', None)
+    if source is None:
+        return None
+
+    group_id = getattr(source, 'group_id', None)
+    if group_id:
+        if isinstance(event, MessageEvent) and getattr(event.message, 'text', None) is not None:
+            if event.message.text.strip() in JANKEN_GROUP_TEXTS:
+                return f"group:{group_id}"
+        elif isinstance(event, PostbackEvent) and event.postback.data in JANKEN_GROUP_POSTBACKS:
+            return f"group:{group_id}"
+
+    user_id = getattr(source, 'user_id', None)
+    if user_id:
+        return f"user:{user_id}"
+    if group_id:
+        return f"group:{group_id}"
+    return None
+
+
+class EventDispatcher:
+    """署名検証済みイベントを有界ワーカープールで処理するディスパッチャー
+
+    レーンごとに待ち行列を持ち、レーンが実行中でなければワーカーに投入する。
+    1回の実行では1件だけ処理し、残りがあれば再投入することで
+    特定ユーザーの連投がワーカーを占有しないようにする。
+    """
+
+    def __init__(self, max_workers: int, max_in_flight: int, submit_timeout: float):
+        """
+        Args:
+            max_workers: ワーカースレッド数
+            max_in_flight: 受付済み・未完了イベントの上限
+            submit_timeout: 上限到達時に空きを待つ秒数
+        """
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self.submit_timeout = submit_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='webhook')
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        # 処理中イベントがなくなったときの通知（停止時の待ち合わせ用）
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        self._queued = 0
+        self._running = 0
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+        # レーンキー -> 未処理の (func, event)。キーが存在する間はそのレーンが実行中
+        self._lanes: Dict[str, deque] = {}
+
+    def dispatch(self, body: str, signature: str) -> int:
+        """
+        署名を検証してイベントをワーカーに投入する
+
+        Args:
+            body: リクエストボディ
+            signature: X-Line-Signature ヘッダー値
+
+        Returns:
+            int: 投入したイベント数
+
+        Raises:
+            InvalidSignatureError: 署名が不正な場合
+            DispatcherBusy: 処理中イベントが上限に達した場合
+        """
+        payload = handler.parser.parse(body, signature, as_payload=True)
+        submitted = 0
+        for event in payload.events:
+            func = self._resolve_handler(event)
+            if func is None:
+                continue
+            # 処理済みイベントの再送はルーティング前に破棄
+            if not deduplicator.check_and_mark(event):
+                continue
+            try:
+                self._submit(func, event)
+            except DispatcherBusy:
+                # 受け付けられなかったイベントは再送時に処理させる
+                deduplicator.forget(event)
+                raise
+            submitted += 1
+        return submitted
+
+    def stats(self) -> Dict[str, Any]:
+        """キュー深さなどの統計を取得"""
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_in_flight': self.max_in_flight,
+                'queue_depth': self._queued,
+                'running': self._running,
+                'in_flight': self._queued + self._running,
+                'processed': self._processed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'active_lanes': len(self._lanes),
+                'closed': self._closed,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """ワーカープールを停止"""
+        self._executor.shutdown(wait=wait)
+
+    def drain(self, timeout: float) -> bool:
+        """
+        新しいイベントの受付を止め、受付済みのイベントを処理し終えるまで待つ
+
+        以降の dispatch は DispatcherBusy になる（/callback は 503 を返し、LINE の再送に任せる）。
+
+        Args:
+            timeout: 待つ最大秒数
+
+        Returns:
+            bool: 受付済みのイベントをすべて処理し終えたか
+        """
+        with self._idle:
+            self._closed = True
+            drained = self._idle.wait_for(lambda: self._queued + self._running == 0, timeout)
+            remaining = self._queued + self._running
+        if drained:
+            self._executor.shutdown(wait=True)
+        else:
+            print(f"[Dispatcher] 停止までに処理しきれなかったイベント: {remaining}件")
+        return drained
+
+    @staticmethod
+    def _resolve_handler(event):
+        """WebhookHandler に登録されたハンドラーを取得（handler.handle と同じ優先順）"""
+        func = None
+        if isinstance(event, MessageEvent):
+            func = handler._handlers.get(f"{event.__class__.__name__}_{event.message.__class__.__name__}")
+        if func is None:
+            func = handler._handlers.get(event.__class__.__name__)
+        if func is None:
+            func = handler._default
+        return func
+
+    def _submit(self, func, event):
+        if not self._slots.acquire(timeout=self.submit_timeout):
+            with self._lock:
+                self._rejected += 1
+            raise DispatcherBusy(f"in-flight limit reached ({self.max_in_flight})")
+
+        key = lane_key(event)
+        with self._lock:
+            if self._closed:
+                self._rejected += 1
+                self._slots.release()
+                raise DispatcherBusy("dispatcher is shutting down")
+            self._queued += 1
+            if key is not None:
+                lane = self._lanes.get(key)
+                if lane is not None:
+                    # レーン実行中: 後続として積むだけ（実行中のワーカーが拾う）
+                    lane.append((func, event))
+                    return
+                self._lanes[key] = deque()
+        try:
+            self._executor.submit(self._run, key, func, event)
+        except RuntimeError:
+            # シャットダウン後の投入
+            with self._lock:
+                self._queued -= 1
+                self._rejected += 1
+                if key is not None:
+                    self._lanes.pop(key, None)
+            self._slots.release()
+            raise DispatcherBusy("dispatcher is shut down")
+
+    def _run(self, key, func, event):
+        """イベントを処理し、同じレーンに続きがあれば投入する"""
+        item = (func, event)
+        while item is not None:
+            next_item = self._run_one(key, *item)
+            if next_item is None:
+                return
+            try:
+                # 同じレーンの次のイベントを投入（レーンは実行中のまま）
+                self._executor.submit(self._run, key, *next_item)
+                return
+            except RuntimeError:
+                # シャットダウン中: 残りはこのスレッドで順に処理して取りこぼさない（再帰せずにループで回す）
+                item = next_item
+
+    def _run_one(self, key, func, event):
+        """
+        イベントを1件処理する
+
+        Returns:
+            同じレーンの次のイベント (func, event)。なければ None
+        """
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        failed = False
+        try:
+            func(event)
+        except Exception as e:
+            failed = True
+            print(f"[Dispatcher] handler error type={type(event).__name__} err={e}")
+            print(f"エラー詳細:\n{traceback.format_exc()}")
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._processed += 1
+                if failed:
+                    self._failed += 1
+                next_item = None
+                if key is not None:
+                    lane = self._lanes.get(key)
+                    if lane:
+                        next_item = lane.popleft()
+                    else:
+                        self._lanes.pop(key, None)
+                if self._queued + self._running == 0:
+                    self._idle.notify_all()
+            self._slots.release()
+        return next_item
+
+
+# グローバルインスタンス
+dispatcher = EventDispatcher(
+    max_workers=config.WEBHOOK_WORKERS,
+    max_in_flight=config.WEBHOOK_MAX_IN_FLIGHT,
+    submit_timeout=config.WEBHOOK_SUBMIT_TIMEOUT,
+)
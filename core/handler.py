@@ -1,9 +1,19 @@
 from linebot.models import MessageEvent, TextMessage, PostbackEvent
-from .api import handler, line_bot_api
+from .api import handler
+from .profile_cache import profile_cache
 from apps.auto_reply import auto_reply
 from apps.recording_logs import recording_logs
 from core.sessions import sessions
 
+def is_group_chatter(event, text: str) -> bool:
+    """グループ内の、どのコマンドにも該当しない雑談かを判定する
+
+    グループで反応するのは「?」で始まるコマンドだけ（じゃんけんの手は個別チャットで受け付ける）なので、
+    それ以外はプロフィール取得やルーティングを行わずログ記録のみで済ませる。
+    """
+    return event.source.type == 'group' and not text.startswith("?")
+
+
 @handler.add(MessageEvent, message=TextMessage)
 def on_message(event):
     text = event.message.text.strip()
@@ -12,10 +22,13 @@ def on_message(event):
 
     if event.source.type == 'group':
         group_id = event.source.group_id
-        profile = line_bot_api.get_group_member_profile(group_id, user_id)
-    elif event.source.type == 'user':
-        profile = line_bot_api.get_profile(user_id)
-    display_name = profile.display_name
+
+    # 雑談はログ記録のみ（表示名はキャッシュにあれば使い、なければログシンクのスレッドが書き込み前に取得する）
+    if is_group_chatter(event, text):
+        recording_logs(event, user_id, text, profile_cache.peek(user_id, group_id))
+        return
+
+    display_name = profile_cache.get_display_name(user_id, group_id)
 
     recording_logs(event, user_id, text, display_name)
     auto_reply(event, text, user_id, group_id, display_name, sessions)
@@ -27,10 +40,7 @@ def on_postback(event):
     group_id = None
     if event.source.type == 'group':
         group_id = event.source.group_id
-        profile = line_bot_api.get_group_member_profile(group_id, user_id)
-    elif event.source.type == 'user':
-        profile = line_bot_api.get_profile(user_id)
-    display_name = profile.display_name
+    display_name = profile_cache.get_display_name(user_id, group_id)
 
     # postbackイベントはtextがないので空文字を渡す
     recording_logs(event, user_id, event.postback.data, display_name)
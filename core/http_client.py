@@ -0,0 +1,211 @@
+"""
+外部 HTTP 呼び出しの共通クライアント
+
+requests.Session を1つ共有して接続を keep-alive で再利用し、
+429/5xx に対して上限付きのリトライ（指数バックオフ、Retry-After を尊重）を行う。
+タイムアウトとリトライ全体の持ち時間はエンドポイントごとに決める。
+"""
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+
+# 同じリクエストを再送しても結果が変わらないメソッド
+_IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'})
+
+_LINE_API_HOSTS = frozenset({'api.line.me', 'api-data.line.me'})
+
+# URL中のID（ユーザー/グループ/ルームID、リッチメニューIDなど）を集計用に伏せる
+_ID_SEGMENT_RE = re.compile(r'^([UCR][0-9a-f]{32}|richmenu-[0-9a-f]+|rm_[\w-]+|\d+)$')
+
+
+@dataclass(frozen=True)
+class EndpointPolicy:
+    """エンドポイントごとのタイムアウト設定"""
+    connect_timeout: float
+    read_timeout: float
+    budget: float  # リトライ待ちを含めた持ち時間（秒）
+
+
+# URLの前方一致で選ぶ（上から順に評価）
+_ENDPOINT_POLICIES: Tuple[Tuple[str, EndpointPolicy], ...] = (
+    # ローディング表示は返信より遅れては意味がないので短く
+    ('https://api.line.me/v2/bot/chat/loading/', EndpointPolicy(2, 3, 5)),
+    # 返信トークンは短時間で失効する
+    ('https://api.line.me/v2/bot/message/reply', EndpointPolicy(3, 5, 10)),
+    # 画像アップロード/コンテンツ取得
+    ('https://api-data.line.me/', EndpointPolicy(3, 20, 45)),
+    ('https://api.imgbb.com/', EndpointPolicy(3, 10, 30)),
+    ('https://api.imgur.com/', EndpointPolicy(3, 10, 30)),
+)
+_DEFAULT_POLICY = EndpointPolicy(3, 8, 20)
+
+# Retry-After が長すぎる場合の上限（秒）
+_MAX_RETRY_WAIT = 10.0
+
+
+def policy_for(url: str) -> EndpointPolicy:
+    for prefix, policy in _ENDPOINT_POLICIES:
+        if url.startswith(prefix):
+            return policy
+    return _DEFAULT_POLICY
+
+
+def line_api_endpoint(url: str) -> str:
+    """集計用にIDを伏せたエンドポイント名を返す（例: /v2/bot/profile/:id）"""
+    segments = urlparse(url).path.split('/')
+    return '/'.join(':id' if _ID_SEGMENT_RE.match(seg) else seg for seg in segments)
+
+
+def record_line_api_call(method: str, url: str):
+    from core.metrics import metrics
+    metrics.record_line_api_call(method, line_api_endpoint(url))
+
+
+class HttpClient:
+    """keep-alive とリトライを備えた共有 HTTP クライアント"""
+
+    def __init__(self, pool_size: int, max_retries: int, backoff_base: float):
+        """
+        Args:
+            pool_size: ホストごとに保持する接続数
+            max_retries: 429/5xx/接続失敗時の最大リトライ回数
+            backoff_base: リトライ間隔の基準秒数
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._session = requests.Session()
+        # リトライは自前で行う（メソッドやエンドポイントの持ち時間を見て判断するため）
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self._errors = 0
+        self._status_counts: Dict[str, int] = {}
+
+    def request(self, method: str, url: str, *, retry_unsafe: bool = False,
+                max_retries: Optional[int] = None, timeout=None, **kwargs) -> requests.Response:
+        """
+        リクエストを送信する（429/5xx/接続失敗は持ち時間内でリトライ）
+
+        Args:
+            method: HTTPメソッド
+            url: URL
+            retry_unsafe: POST など冪等でないリクエストも 5xx/タイムアウトでリトライするか
+                          （429 と接続確立前の失敗は未処理が確実なので常にリトライする）
+            max_retries: このリクエストだけリトライ回数を変える場合に指定
+            timeout: 明示指定がなければエンドポイントごとの設定を使う
+            **kwargs: requests.Session.request に渡す引数
+
+        Returns:
+            requests.Response: 最後に受け取ったレスポンス
+
+        Raises:
+            requests.RequestException: リトライしても接続できなかった場合
+        """
+        method = method.upper()
+        policy = policy_for(url)
+        if timeout is None:
+            timeout = (policy.connect_timeout, policy.read_timeout)
+        retries = self.max_retries if max_retries is None else max_retries
+        retryable = retry_unsafe or method in _IDEMPOTENT_METHODS
+        is_line_api = urlparse(url).hostname in _LINE_API_HOSTS
+        deadline = time.monotonic() + policy.budget
+
+        attempt = 0
+        while True:
+            if is_line_api:
+                record_line_api_call(method, url)
+            with self._lock:
+                self._requests += 1
+            try:
+                response = self._session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                with self._lock:
+                    self._errors += 1
+                # 接続確立前の失敗はサーバーに届いていないので常に再送してよい
+                safe = retryable or isinstance(e, requests.ConnectTimeout)
+                wait = self._backoff(attempt)
+                if not safe or attempt >= retries or time.monotonic() + wait > deadline:
+                    raise
+                print(f"[HTTP] {method} {line_api_endpoint(url)} 失敗: {e}。{wait:.1f}s後にリトライ ({attempt + 1}/{retries})")
+                self._sleep_before_retry(wait)
+                attempt += 1
+                continue
+
+            self._record_status(response.status_code)
+            status = response.status_code
+            if status == 429 or (status >= 500 and retryable):
+                wait = self._retry_after(response) or self._backoff(attempt)
+                if attempt < retries and time.monotonic() + wait <= deadline:
+                    print(f"[HTTP] {method} {line_api_endpoint(url)} -> {status}。{wait:.1f}s後にリトライ ({attempt + 1}/{retries})")
+                    response.close()
+                    self._sleep_before_retry(wait)
+                    attempt += 1
+                    continue
+            return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """リクエスト数などの統計を取得"""
+        with self._lock:
+            result = {
+                'requests': self._requests,
+                'retries': self._retries,
+                'errors': self._errors,
+            }
+            for status_class, count in sorted(self._status_counts.items()):
+                result[f'status_{status_class}'] = count
+            return result
+
+    def _backoff(self, attempt: int) -> float:
+        return min(_MAX_RETRY_WAIT, self.backoff_base * (2 ** attempt)) + random.uniform(0, self.backoff_base / 2)
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return min(_MAX_RETRY_WAIT, max(0.0, float(value)))
+        except ValueError:
+            return None
+
+    def _sleep_before_retry(self, wait: float):
+        with self._lock:
+            self._retries += 1
+        time.sleep(wait)
+
+    def _record_status(self, status: int):
+        status_class = f"{status // 100}xx"
+        with self._lock:
+            self._status_counts[status_class] = self._status_counts.get(status_class, 0) + 1
+
+
+# グローバルインスタンス
+http_client = HttpClient(
+    pool_size=config.HTTP_POOL_SIZE,
+    max_retries=config.HTTP_MAX_RETRIES,
+    backoff_base=config.HTTP_BACKOFF_BASE,
+)
@@ -0,0 +1,150 @@
+"""
+DB から読み込んでメモリ上に保持する索引の共通部分
+
+全メッセージで行う判定（懲役中か・督促通知があるか など）を DB に問い合わせずに済ませるための索引。
+- 起動時などに load() で全件を読み込む
+- このプロセスでの変更は update() で索引に反映する（読み込み中の変更があれば、その読み込み結果は捨てる）
+- 他のワーカーでの変更は refresh_interval ごとのバックグラウンド再読み込みで反映する
+- 読み込めていない間は retry_interval ごとに再試行する
+
+各機能はサブクラスで読み込みのクエリ（_fetch）と索引の組み立て（_build）、参照のメソッドだけを書く。
+"""
+import threading
+import time
+from typing import Dict, Any, Callable, Optional
+
+# 読み込みに失敗した場合に再試行するまでの秒数
+DEFAULT_RETRY_INTERVAL = 30
+
+
+class ReloadableIndex:
+    """定期的に DB から読み直すメモリ上の索引（サブクラスで _fetch / _build を実装する）"""
+
+    def __init__(self, name: str, refresh_interval: int, retry_interval: int = DEFAULT_RETRY_INTERVAL):
+        """
+        Args:
+            name: ログとスレッド名に使う名前
+            refresh_interval: DB から全件を再読み込みする間隔（秒）
+            retry_interval: 読み込めていない間に再試行する間隔（秒）
+        """
+        self.name = name
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self._data: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._last_attempt = 0.0
+        self._refreshing = False
+        # 読み込み中にこのプロセスで変更があったかの判定用
+        self._generation = 0
+        self._loads = 0
+        self._load_errors = 0
+
+    # ---- サブクラスで実装する ----
+
+    def _fetch(self):
+        """DB から全件の行を取得する"""
+        raise NotImplementedError
+
+    def _build(self, rows) -> Dict[str, Any]:
+        """_fetch の行から索引（キー → 値）を作る"""
+        raise NotImplementedError
+
+    def _on_loaded(self, data: Dict[str, Any]):
+        """全件を読み込んで差し替えた直後に呼ぶ（ロック中）"""
+
+    def _stats(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """stats() に加える項目（ロック中）"""
+        return {}
+
+    # ---- 読み込み ----
+
+    def load(self) -> bool:
+        """
+        全件を読み込む
+
+        Returns:
+            bool: 読み込めたか
+        """
+        with self._lock:
+            generation = self._generation
+            self._last_attempt = time.monotonic()
+        try:
+            data = self._build(self._fetch())
+        except Exception as e:
+            print(f"[{self.name}] 索引の読み込みに失敗: {e}")
+            with self._lock:
+                self._load_errors += 1
+            return False
+
+        with self._lock:
+            # 読み込み中に変更があった場合は古い結果なので捨てる（次回の再読み込みで反映）
+            if generation != self._generation and self._data is not None:
+                return False
+            self._data = data
+            self._on_loaded(data)
+            self._loaded_at = time.monotonic()
+            self._loads += 1
+        return True
+
+    def update(self, apply: Callable[[Dict[str, Any]], None]):
+        """このプロセスでの変更を索引に反映する（読み込めていなければ次の読み込みに任せる）"""
+        with self._lock:
+            self._generation += 1
+            if self._data is not None:
+                apply(self._data)
+
+    def invalidate(self):
+        """次の参照で全件を読み直させる（部分的な更新に失敗したときなど）"""
+        with self._lock:
+            self._load_errors += 1
+            self._loaded_at = 0.0
+
+    # ---- 参照 ----
+
+    def lookup(self, key: str, default: Any = None):
+        """
+        キーの値を取得（必要ならバックグラウンドで再読み込みを始める）
+
+        Returns:
+            (読み込めているか, 値)
+        """
+        self._refresh_if_due()
+        with self._lock:
+            if self._data is None:
+                return False, default
+            return True, self._data.get(key, default)
+
+    def stats(self) -> Dict[str, Any]:
+        """件数などの統計を取得"""
+        with self._lock:
+            result = {
+                'loaded': self._data is not None,
+                'age_seconds': round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+                'loads': self._loads,
+                'load_errors': self._load_errors,
+            }
+            result.update(self._stats(self._data or {}))
+            return result
+
+    def _refresh_if_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._refreshing:
+                return
+            if self._data is None:
+                due = now - self._last_attempt >= self.retry_interval
+            else:
+                due = now - self._loaded_at >= self.refresh_interval
+            if not due:
+                return
+            self._refreshing = True
+            self._last_attempt = now
+        threading.Thread(target=self._refresh, name=f'{self.name.lower()}-index-refresh', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.load()
+        finally:
+            with self._lock:
+                self._refreshing = False
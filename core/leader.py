@@ -0,0 +1,219 @@
+"""
+バックグラウンドジョブのリーダー選出
+
+gunicorn の複数ワーカーがそれぞれスケジューラーを起動すると、
+AI取引・株価更新・配当・課税・回収がワーカー数だけ重複して実行される。
+Postgres のセッション単位 advisory lock を取得した1プロセスだけをリーダーとし、
+リーダーになったときにスケジューラーを開始、リーダーでなくなったときに停止する。
+
+- リース更新: リーダーは一定間隔でロック用の接続が生きていることを確認し、
+  background_leader テーブルの renewed_at を更新する。
+- フェイルオーバー: リーダーのプロセス/接続が落ちるとロックは Postgres が解放し、
+  次に取得を試みた非リーダーがリーダーになる。
+"""
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional
+
+import config
+
+# advisory lock のキー（'SCHD'）
+_LOCK_KEY = 0x53434844
+
+_UPSERT_SQL = """
+    INSERT INTO background_leader (name, holder, acquired_at, renewed_at)
+    VALUES (%s, %s, now(), now())
+    ON CONFLICT (name) DO UPDATE
+        SET holder = EXCLUDED.holder, acquired_at = EXCLUDED.acquired_at, renewed_at = EXCLUDED.renewed_at
+"""
+_RENEW_SQL = "UPDATE background_leader SET renewed_at = now() WHERE name = %s AND holder = %s"
+_SELECT_SQL = """
+    SELECT holder, acquired_at, renewed_at, now() - renewed_at
+    FROM background_leader WHERE name = %s
+"""
+
+
+class LeaderElector:
+    """advisory lock によるリーダー選出"""
+
+    def __init__(self, name: str, lock_key: int, renew_interval: int):
+        """
+        Args:
+            name: 選出対象の名前（状態表示用）
+            lock_key: advisory lock のキー
+            renew_interval: リース更新/取得試行の間隔（秒）
+        """
+        self.name = name
+        self.lock_key = lock_key
+        self.renew_interval = renew_interval
+        self.identity = f"{socket.gethostname()}:{os.getpid()}"
+        self._on_elected: List[Callable[[], None]] = []
+        self._on_demoted: List[Callable[[], None]] = []
+        self._conn = None
+        self._is_leader = False
+        self._leader_since: Optional[float] = None
+        self._last_renewed: Optional[float] = None
+        self._elections = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def on_elected(self, func: Callable[[], None]):
+        """リーダーになったときに呼ぶ処理を登録"""
+        self._on_elected.append(func)
+        return func
+
+    def on_demoted(self, func: Callable[[], None]):
+        """リーダーでなくなったときに呼ぶ処理を登録"""
+        self._on_demoted.append(func)
+        return func
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def start(self):
+        """選出ループを開始"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name=f'leader-{self.name}', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """選出ループを停止し、リーダーであれば役割を降りてロックを解放する"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        """このプロセスの状態と、共有テーブル上の現在のリーダー"""
+        now = time.monotonic()
+        result = {
+            'name': self.name,
+            'identity': self.identity,
+            'is_leader': self._is_leader,
+            'leader_for_seconds': round(now - self._leader_since, 1) if self._leader_since else None,
+            'last_renewed_seconds_ago': round(now - self._last_renewed, 1) if self._last_renewed else None,
+            'elections': self._elections,
+            'current_leader': None,
+        }
+        try:
+            from core.db import raw_connection
+            with raw_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(_SELECT_SQL, (self.name,))
+                    row = cur.fetchone()
+            if row:
+                holder, acquired_at, renewed_at, age = row
+                result['current_leader'] = {
+                    'holder': holder,
+                    'acquired_at': acquired_at.isoformat(),
+                    'renewed_at': renewed_at.isoformat(),
+                    # リース切れ: 更新間隔の3倍以上更新がない（リーダー不在の可能性）
+                    'lease_expired': age.total_seconds() > self.renew_interval * 3,
+                }
+        except Exception as e:
+            result['error'] = str(e)
+        return result
+
+    # ---- 内部処理 ----
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if self._is_leader:
+                    self._renew()
+                else:
+                    self._try_acquire()
+            except Exception as e:
+                print(f"[Leader] {self.name} 選出処理エラー: {e}")
+                if self._is_leader:
+                    self._demote()
+                self._close_connection()
+            self._stop.wait(self.renew_interval)
+        if self._is_leader:
+            self._demote()
+            self._release()
+        self._close_connection()
+
+    def _connection(self):
+        if self._conn is None:
+            from core.db import engine
+            # ロックは接続（セッション）に紐づくため、プールから切り離した専用接続を使う
+            conn = engine.raw_connection()
+            conn.detach()
+            conn.autocommit = True
+            self._conn = conn
+        return self._conn
+
+    def _try_acquire(self):
+        conn = self._connection()
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_key,))
+            acquired = cur.fetchone()[0]
+        if not acquired:
+            return
+        self._write_lease(_UPSERT_SQL, (self.name, self.identity))
+        self._is_leader = True
+        self._leader_since = self._last_renewed = time.monotonic()
+        self._elections += 1
+        print(f"[Leader] {self.name} のリーダーになりました ({self.identity})")
+        for func in self._on_elected:
+            try:
+                func()
+            except Exception as e:
+                print(f"[Leader] 開始処理エラー: {getattr(func, '__name__', func)} {e}")
+
+    def _renew(self):
+        # 接続が切れていればロックは失われている（例外で降格）
+        conn = self._connection()
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        self._write_lease(_RENEW_SQL, (self.name, self.identity))
+        self._last_renewed = time.monotonic()
+
+    def _write_lease(self, sql: str, params: tuple):
+        # 状態表示用なのでテーブルがなくても選出は続ける
+        try:
+            with self._conn.cursor() as cur:
+                cur.execute(sql, params)
+        except Exception as e:
+            print(f"[Leader] リース情報の更新に失敗: {e}")
+
+    def _demote(self):
+        self._is_leader = False
+        self._leader_since = None
+        print(f"[Leader] {self.name} のリーダーを降ります ({self.identity})")
+        for func in self._on_demoted:
+            try:
+                func()
+            except Exception as e:
+                print(f"[Leader] 停止処理エラー: {getattr(func, '__name__', func)} {e}")
+
+    def _release(self):
+        try:
+            with self._conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (self.lock_key,))
+        except Exception as e:
+            print(f"[Leader] ロック解放に失敗: {e}")
+
+    def _close_connection(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+# グローバルインスタンス
+scheduler_leader = LeaderElector(
+    name='schedulers',
+    lock_key=_LOCK_KEY,
+    renew_interval=config.LEADER_RENEW_INTERVAL,
+)
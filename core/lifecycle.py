@@ -0,0 +1,121 @@
+"""
+プロセスの停止処理（SIGTERM）
+
+再デプロイ時の SIGTERM で、登録された停止処理を登録順に実行する。
+- Webhook の受付を止めて受付済みのイベントを処理し切る
+- スケジューラーのジョブに停止を要求し、途中までを確定させる
+- じゃんけんのタイマー・プロセス内のセッション・ログのバッファを退避/書き込む
+
+全体の持ち時間は SHUTDOWN_DEADLINE 秒。各処理には残り時間が渡され、
+待ち合わせを伴う処理はそれ以上待たない（gunicorn の graceful_timeout より短くする）。
+停止処理の後は元のシグナルハンドラー（gunicorn のワーカー終了処理など）に引き継ぐ。
+"""
+import signal
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import config
+
+
+class Lifecycle:
+    """停止処理の登録と実行"""
+
+    def __init__(self, deadline: float):
+        """
+        Args:
+            deadline: 停止処理全体の持ち時間（秒）
+        """
+        self.deadline = deadline
+        self._steps: List[Tuple[str, Callable[[float], Any]]] = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._done = threading.Event()
+        self._reason: Optional[str] = None
+        self._results: List[Dict[str, Any]] = []
+        self._previous_handlers: Dict[int, Any] = {}
+
+    def on_shutdown(self, name: str, func: Callable[[float], Any]):
+        """
+        停止処理を登録する（登録順に実行）
+
+        Args:
+            name: 表示名
+            func: 残り秒数を受け取る関数（戻り値は status に表示する）
+        """
+        with self._lock:
+            self._steps.append((name, func))
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def install_signal_handlers(self):
+        """SIGTERM/SIGINT で停止処理を行う（メインスレッドからのみ設定できる）"""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                self._previous_handlers[signum] = signal.signal(signum, self._handle_signal)
+            except ValueError:
+                print(f"[Lifecycle] メインスレッド以外のためシグナルハンドラーを設定できません: {signal.Signals(signum).name}")
+                return
+
+    def shutdown(self, reason: str = 'manual'):
+        """停止処理を実行する（2回目以降は最初の実行の終了を待つだけ）"""
+        with self._lock:
+            if self._stopping.is_set():
+                first = False
+            else:
+                first = True
+                self._stopping.set()
+                self._reason = reason
+                steps = list(self._steps)
+        if not first:
+            self._done.wait(self.deadline)
+            return
+
+        print(f"[Lifecycle] 停止処理を開始します reason={reason} deadline={self.deadline}s")
+        started = time.monotonic()
+        end = started + self.deadline
+        for name, func in steps:
+            remaining = max(0.0, end - time.monotonic())
+            step_started = time.monotonic()
+            result: Dict[str, Any] = {'step': name}
+            try:
+                result['result'] = func(remaining)
+                result['ok'] = True
+            except Exception as e:
+                result['ok'] = False
+                result['error'] = f"{type(e).__name__}: {e}"
+                print(f"[Lifecycle] 停止処理に失敗 step={name} err={e}\n{traceback.format_exc()}")
+            result['seconds'] = round(time.monotonic() - step_started, 3)
+            with self._lock:
+                self._results.append(result)
+        print(f"[Lifecycle] 停止処理が完了しました ({time.monotonic() - started:.1f}s)")
+        self._done.set()
+
+    def status(self) -> Dict[str, Any]:
+        """停止処理の状態（各処理の結果と所要時間）"""
+        with self._lock:
+            return {
+                'stopping': self._stopping.is_set(),
+                'done': self._done.is_set(),
+                'reason': self._reason,
+                'deadline_seconds': self.deadline,
+                'steps': [name for name, _ in self._steps],
+                'results': list(self._results),
+            }
+
+    def _handle_signal(self, signum, frame):
+        self.shutdown(reason=signal.Signals(signum).name)
+        previous = self._previous_handlers.get(signum)
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_IGN:
+            return
+        else:
+            raise SystemExit(0)
+
+
+# グローバルインスタンス
+lifecycle = Lifecycle(deadline=config.SHUTDOWN_DEADLINE)
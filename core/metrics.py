@@ -0,0 +1,254 @@
+"""
+処理時間・DBクエリ・LINE API呼び出しの計測
+
+コマンド/バックグラウンドジョブの実行を計測スコープで囲み、
+スコープ内で発行されたSQLの件数と時間をスコープ名ごとに集計する。
+集計結果は /metrics で Prometheus テキスト形式として公開する。
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Optional, Callable
+
+from sqlalchemy import event
+
+from core.db import engine
+
+# 分位点の計算に使う直近サンプル数（ラベルごと）
+_SAMPLE_WINDOW = 1024
+_QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _Summary:
+    """直近サンプルから分位点を計算するサマリー"""
+
+    def __init__(self):
+        self.samples = deque(maxlen=_SAMPLE_WINDOW)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self) -> List[Tuple[float, float]]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [(q, 0.0) for q in _QUANTILES]
+        last = len(ordered) - 1
+        return [(q, ordered[min(last, int(round(q * last)))]) for q in _QUANTILES]
+
+
+class _Scope:
+    """計測スコープ（1コマンド/1ジョブ実行分）"""
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+class MetricsRegistry:
+    """メトリクスの集計と Prometheus 形式の出力"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (kind, name) -> _Summary
+        self._durations: Dict[Tuple[str, str], _Summary] = {}
+        self._failures: Dict[Tuple[str, str], int] = {}
+        self._queries: Dict[Tuple[str, str], int] = {}
+        self._db_seconds: Dict[Tuple[str, str], float] = {}
+        self._line_api_calls: Dict[Tuple[str, str], int] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._counter_help: Dict[str, str] = {}
+        # 名前 -> (ヘルプ, 値を返す関数)。値は {ラベル辞書のタプル: 値} または数値
+        self._gauges: Dict[str, Tuple[str, Callable]] = {}
+
+    # ---- 計測スコープ ----
+
+    @contextmanager
+    def command_timer(self, name: str = 'unmatched'):
+        """コマンド処理を計測する（yield されたスコープの name は途中で変更可）"""
+        with self._timer('command', name) as scope:
+            yield scope
+
+    @contextmanager
+    def job_timer(self, name: str):
+        """バックグラウンドジョブを計測する"""
+        with self._timer('job', name) as scope:
+            yield scope
+
+    @contextmanager
+    def _timer(self, kind: str, name: str):
+        scope = _Scope(kind, name)
+        parent = getattr(self._local, 'scope', None)
+        self._local.scope = scope
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield scope
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self._local.scope = parent
+            key = (scope.kind, scope.name)
+            with self._lock:
+                summary = self._durations.get(key)
+                if summary is None:
+                    summary = self._durations[key] = _Summary()
+                summary.observe(elapsed)
+                self._queries[key] = self._queries.get(key, 0) + scope.queries
+                self._db_seconds[key] = self._db_seconds.get(key, 0.0) + scope.db_seconds
+                if failed:
+                    self._failures[key] = self._failures.get(key, 0) + 1
+
+    def current_scope(self) -> Optional[_Scope]:
+        return getattr(self._local, 'scope', None)
+
+    # ---- 記録 ----
+
+    def record_query(self, seconds: float):
+        scope = self.current_scope()
+        if scope is not None:
+            scope.queries += 1
+            scope.db_seconds += seconds
+            return
+        # スコープ外（起動処理など）
+        key = ('other', 'other')
+        with self._lock:
+            self._queries[key] = self._queries.get(key, 0) + 1
+            self._db_seconds[key] = self._db_seconds.get(key, 0.0) + seconds
+
+    def record_line_api_call(self, method: str, endpoint: str):
+        key = (method, endpoint)
+        with self._lock:
+            self._line_api_calls[key] = self._line_api_calls.get(key, 0) + 1
+
+    def incr(self, name: str, help_text: str, amount: float = 1, **labels):
+        """任意のカウンターを加算"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counter_help[name] = help_text
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_gauge(self, name: str, help_text: str, func: Callable):
+        """スクレイプ時に値を取得するゲージを登録"""
+        self._gauges[name] = (help_text, func)
+
+    # ---- 出力 ----
+
+    def render(self) -> str:
+        """Prometheus テキスト形式で出力"""
+        lines: List[str] = []
+        with self._lock:
+            durations = {k: (v.quantiles(), v.total, v.count) for k, v in self._durations.items()}
+            failures = dict(self._failures)
+            queries = dict(self._queries)
+            db_seconds = dict(self._db_seconds)
+            line_api_calls = dict(self._line_api_calls)
+            counters = dict(self._counters)
+            counter_help = dict(self._counter_help)
+
+        for kind, metric, label in (('command', 'linebot_command_duration_seconds', 'command'),
+                                    ('job', 'linebot_job_duration_seconds', 'job')):
+            lines.append(f"# HELP {metric} Processing time per {kind}")
+            lines.append(f"# TYPE {metric} summary")
+            for (k, name), (quantiles, total, count) in sorted(durations.items()):
+                if k != kind:
+                    continue
+                for q, value in quantiles:
+                    lines.append(f'{metric}{{{label}="{_escape(name)}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'{metric}_sum{{{label}="{_escape(name)}"}} {total:.6f}')
+                lines.append(f'{metric}_count{{{label}="{_escape(name)}"}} {count}')
+
+        lines.append("# HELP linebot_failures_total Commands/jobs that raised an exception")
+        lines.append("# TYPE linebot_failures_total counter")
+        for (kind, name), value in sorted(failures.items()):
+            lines.append(f'linebot_failures_total{{kind="{kind}",name="{_escape(name)}"}} {value}')
+
+        lines.append("# HELP linebot_db_queries_total SQL statements executed")
+        lines.append("# TYPE linebot_db_queries_total counter")
+        for (kind, name), value in sorted(queries.items()):
+            lines.append(f'linebot_db_queries_total{{kind="{kind}",name="{_escape(name)}"}} {value}')
+
+        lines.append("# HELP linebot_db_seconds_total Time spent executing SQL")
+        lines.append("# TYPE linebot_db_seconds_total counter")
+        for (kind, name), value in sorted(db_seconds.items()):
+            lines.append(f'linebot_db_seconds_total{{kind="{kind}",name="{_escape(name)}"}} {value:.6f}')
+
+        lines.append("# HELP linebot_line_api_calls_total LINE API calls")
+        lines.append("# TYPE linebot_line_api_calls_total counter")
+        for (method, endpoint), value in sorted(line_api_calls.items()):
+            lines.append(f'linebot_line_api_calls_total{{method="{method}",endpoint="{_escape(endpoint)}"}} {value}')
+
+        for name in sorted({n for n, _ in counters}):
+            lines.append(f"# HELP {name} {counter_help.get(name, '')}")
+            lines.append(f"# TYPE {name} counter")
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{_format_labels(dict(labels))} {_format_number(value)}")
+
+        for name, (help_text, func) in sorted(self._gauges.items()):
+            try:
+                value = func()
+            except Exception as e:
+                print(f"[Metrics] gauge {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for labels, v in value.items():
+                    lines.append(f"{name}{_format_labels(dict(labels))} {_format_number(v)}")
+            else:
+                lines.append(f"{name} {_format_number(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + '}'
+
+
+def _format_number(value) -> str:
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return f"{value:.6f}"
+    return str(value)
+
+
+def stats_gauge(func: Callable[[], Dict], stat_label: str = 'stat') -> Callable:
+    """stats() 形式の辞書（数値のみ）をゲージ値に変換する関数を作る"""
+    def _collect():
+        return {((stat_label, k),): v for k, v in func().items() if isinstance(v, (int, float))}
+    return _collect
+
+
+# グローバルインスタンス
+metrics = MetricsRegistry()
+
+
+# 開始時刻は文ごとの実行コンテキストに持たせる（文が例外で終わっても接続側に残らない）
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_query_start = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_metrics_query_start', None)
+    if start is not None:
+        metrics.record_query(time.perf_counter() - start)
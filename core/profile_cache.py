@@ -0,0 +1,147 @@
+"""
+LINEプロフィール（表示名）キャッシュ
+
+get_profile / get_group_member_profile の結果を (group_id, user_id) 単位で保持し、
+メッセージごとのLINE API呼び出しを省く。
+TTLを過ぎた値は古い値を返しつつバックグラウンドで再取得する。
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+
+import config
+from core.api import line_bot_api
+
+
+class ProfileCache:
+    """サイズ上限付きTTL/LRUキャッシュ"""
+
+    def __init__(self, ttl: int, stale_ttl: int, max_size: int):
+        """
+        Args:
+            ttl: 値をそのまま使う秒数
+            stale_ttl: TTL経過後、再取得しながら古い値を返してよい秒数
+            max_size: 最大件数
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        # (group_id, user_id) -> (display_name, fetched_at)
+        self._entries: "OrderedDict[Tuple[Optional[str], str], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='profile-refresh')
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._refresh_errors = 0
+        self._evictions = 0
+
+    def get_display_name(self, user_id: str, group_id: Optional[str] = None) -> str:
+        """
+        表示名を取得（キャッシュがなければLINE APIから取得）
+
+        Args:
+            user_id: ユーザーID
+            group_id: グループID（グループチャットの場合）
+
+        Returns:
+            str: 表示名
+        """
+        key = (group_id, user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                display_name, fetched_at = entry
+                age = now - fetched_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return display_name
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._stale_hits += 1
+                    self._schedule_refresh(key)
+                    return display_name
+                del self._entries[key]
+            self._misses += 1
+
+        display_name = self._fetch(user_id, group_id)
+        self._store(key, display_name)
+        return display_name
+
+    def peek(self, user_id: str, group_id: Optional[str] = None) -> Optional[str]:
+        """
+        キャッシュ済みの表示名だけを返す（API呼び出しなし、期限切れでも返す）
+
+        Returns:
+            Optional[str]: 表示名（未キャッシュならNone）
+        """
+        with self._lock:
+            entry = self._entries.get((group_id, user_id))
+        return entry[0] if entry else None
+
+    def invalidate(self, user_id: str, group_id: Optional[str] = None):
+        """キャッシュを破棄"""
+        with self._lock:
+            self._entries.pop((group_id, user_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット/ミス数などの統計を取得"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'stale_hits': self._stale_hits,
+                'misses': self._misses,
+                'refresh_errors': self._refresh_errors,
+                'evictions': self._evictions,
+            }
+
+    @staticmethod
+    def _fetch(user_id: str, group_id: Optional[str]) -> str:
+        if group_id:
+            profile = line_bot_api.get_group_member_profile(group_id, user_id)
+        else:
+            profile = line_bot_api.get_profile(user_id)
+        return profile.display_name
+
+    def _store(self, key, display_name: str):
+        with self._lock:
+            self._entries[key] = (display_name, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def _schedule_refresh(self, key):
+        # self._lock 保持中に呼ぶこと
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        self._refresher.submit(self._refresh, key)
+
+    def _refresh(self, key):
+        group_id, user_id = key
+        try:
+            self._store(key, self._fetch(user_id, group_id))
+        except Exception as e:
+            # 失敗時は古い値を使い続ける（stale_ttl 経過後はミス扱いになる）
+            with self._lock:
+                self._refresh_errors += 1
+            print(f"[ProfileCache] refresh failed user={user_id} group={group_id} err={e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+# グローバルインスタンス
+profile_cache = ProfileCache(
+    ttl=config.PROFILE_CACHE_TTL,
+    stale_ttl=config.PROFILE_CACHE_STALE_TTL,
+    max_size=config.PROFILE_CACHE_MAX_SIZE,
+)
@@ -0,0 +1,125 @@
+"""
+コマンドのレート制限（トークンバケット）
+
+ユーザーごと・グループごとに、コマンドの重さの区分（cheap / db / render）ごとの
+トークンバケットを持ち、1回の実行で1トークンを消費する。
+トークンが足りない場合はコマンドを実行せず、呼び出し側が軽い定型文だけを返す。
+バケットはプロセスごとに持つ（複数ワーカー構成では上限はワーカー数倍になる）。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+import config
+from core.metrics import metrics
+from core.router import COST_CHEAP, COST_DB, COST_RENDER
+
+SCOPE_USER = 'user'
+SCOPE_GROUP = 'group'
+
+
+def parse_limit(spec: str) -> Tuple[float, float]:
+    """'容量:毎秒の補充数' 形式の設定値を (capacity, refill_per_second) にする"""
+    capacity, rate = spec.split(':')
+    return float(capacity), float(rate)
+
+
+class RateLimiter:
+    """ユーザー/グループ × コマンド区分ごとのトークンバケット"""
+
+    def __init__(self, limits: Dict[Tuple[str, str], Tuple[float, float]], max_buckets: int, enabled: bool = True):
+        """
+        Args:
+            limits: (SCOPE_USER/SCOPE_GROUP, コマンド区分) -> (容量, 毎秒の補充数)
+            max_buckets: 保持するバケット数の上限（超えたら最も古く使われたものから破棄 = 満タン扱い）
+            enabled: False なら常に許可する
+        """
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.enabled = enabled
+        # (scope, id, cost) -> [残りトークン, 最終更新時刻]
+        self._buckets: "OrderedDict[Tuple[str, str, str], list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._allowed: Dict[str, int] = {}
+        self._limited: Dict[Tuple[str, str], int] = {}
+
+    def allow(self, user_id: str, group_id: Optional[str], cost: str) -> bool:
+        """
+        1回分の実行を許可するか（許可する場合はユーザーとグループの両方から1トークン消費する）
+
+        Args:
+            user_id: ユーザーID
+            group_id: グループID（グループチャットの場合）
+            cost: コマンド区分（COST_CHEAP / COST_DB / COST_RENDER）
+        """
+        if not self.enabled:
+            return True
+        keys = [(SCOPE_USER, user_id, cost)]
+        if group_id:
+            keys.append((SCOPE_GROUP, group_id, cost))
+
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            for key in keys:
+                limit = self.limits.get((key[0], cost))
+                if limit is None:
+                    continue
+                bucket = self._refill(key, limit, now)
+                if bucket[0] < 1:
+                    self._limited[(key[0], cost)] = self._limited.get((key[0], cost), 0) + 1
+                    blocked_by = key[0]
+                    break
+                buckets.append(bucket)
+            else:
+                for bucket in buckets:
+                    bucket[0] -= 1
+                self._allowed[cost] = self._allowed.get(cost, 0) + 1
+                return True
+
+        metrics.incr('linebot_rate_limited_total', 'Commands rejected by the rate limiter', cost=cost, scope=blocked_by)
+        return False
+
+    def _refill(self, key: Tuple[str, str, str], limit: Tuple[float, float], now: float) -> list:
+        """ロック内で呼ぶ"""
+        capacity, rate = limit
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [capacity, now]
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def stats(self) -> Dict[str, Any]:
+        """区分ごとの許可/拒否件数などの統計を取得"""
+        with self._lock:
+            result: Dict[str, Any] = {
+                'enabled': self.enabled,
+                'buckets': len(self._buckets),
+                'max_buckets': self.max_buckets,
+            }
+            for cost in (COST_CHEAP, COST_DB, COST_RENDER):
+                result[f'allowed_{cost}'] = self._allowed.get(cost, 0)
+                for scope in (SCOPE_USER, SCOPE_GROUP):
+                    result[f'limited_{scope}_{cost}'] = self._limited.get((scope, cost), 0)
+            return result
+
+
+# グローバルインスタンス
+rate_limiter = RateLimiter(
+    limits={
+        (SCOPE_USER, COST_CHEAP): parse_limit(config.RATE_LIMIT_USER_CHEAP),
+        (SCOPE_USER, COST_DB): parse_limit(config.RATE_LIMIT_USER_DB),
+        (SCOPE_USER, COST_RENDER): parse_limit(config.RATE_LIMIT_USER_RENDER),
+        (SCOPE_GROUP, COST_CHEAP): parse_limit(config.RATE_LIMIT_GROUP_CHEAP),
+        (SCOPE_GROUP, COST_DB): parse_limit(config.RATE_LIMIT_GROUP_DB),
+        (SCOPE_GROUP, COST_RENDER): parse_limit(config.RATE_LIMIT_GROUP_RENDER),
+    },
+    max_buckets=config.RATE_LIMIT_MAX_BUCKETS,
+    enabled=config.RATE_LIMIT_ENABLED,
+)
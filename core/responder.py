@@ -0,0 +1,257 @@
+"""
+返信期限を意識した応答の送信
+
+1イベントの処理中（scope 内）に同じ返信トークンへ送られたメッセージを溜め、
+処理の最後に1回の reply でまとめて送る（1回の reply は最大5件。超えた分は push）。
+
+返信トークンには有効期限があるため、イベントの発生時刻（event.timestamp）からの経過時間を追い、
+- 期限（REPLY_DEADLINE_SECONDS）を過ぎてから送る場合は reply せず push で送る
+- 時間のかかる処理の前に expect_delay() を呼ぶと、REPLY_INTERIM_AFTER 秒経っても
+  応答が送られていない場合に途中経過（または溜まっているメッセージ）を先に reply し、
+  残りは処理の最後に push で送る
+返信期限に間に合わなかった件数は stats() と linebot_reply_window_missed_total で数える。
+reply に失敗した場合も push で送り直す。送信のエラーは scope の外へ送出しない
+（handler の処理が終わった後に送るため、handler 側の例外処理では拾えない）。
+
+handler のコードは従来どおり line_bot_api.reply_message() を呼べばよい
+（core.api の LineBotApi がここに振り分ける）。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+from linebot.exceptions import LineBotApiError
+from linebot.models import TextSendMessage
+
+import config
+from core.metrics import metrics
+
+# 1回の reply / push で送れるメッセージ数の上限（LINE の仕様）
+MAX_MESSAGES_PER_CALL = 5
+
+
+def _as_list(messages) -> list:
+    return list(messages) if isinstance(messages, (list, tuple)) else [messages]
+
+
+def _push_target(event) -> Optional[str]:
+    """push の宛先（グループ/トークルームならその ID、1:1 ならユーザーID）"""
+    source = getattr(event, 'source', None)
+    if source is None:
+        return None
+    return getattr(source, 'group_id', None) or getattr(source, 'room_id', None) or getattr(source, 'user_id', None)
+
+
+def _is_expired_token_error(e: LineBotApiError) -> bool:
+    message = getattr(getattr(e, 'error', None), 'message', '') or ''
+    return e.status_code == 400 and 'reply token' in message.lower()
+
+
+class _Pending:
+    """1イベント分の送信待ちメッセージ"""
+
+    def __init__(self, event):
+        self.reply_token = getattr(event, 'reply_token', None)
+        self.to = _push_target(event)
+        timestamp = getattr(event, 'timestamp', None)
+        # イベントの発生時刻（epoch 秒）。不明なら受け取った時刻
+        self.received_at = timestamp / 1000 if timestamp else time.time()
+        self.messages: list = []
+        self.notification_disabled = False
+        # 返信トークンを使ったか（以降は push で送る）
+        self.replied = False
+        self.interim_timer: Optional[threading.Timer] = None
+        # 送信を直列化する（途中経過のタイマーとイベント処理スレッドの両方から送るため）
+        self.send_lock = threading.Lock()
+
+    def age(self) -> float:
+        return time.time() - self.received_at
+
+
+class Responder:
+    """返信トークンへの送信をまとめ、期限を過ぎたものは push に切り替える"""
+
+    def __init__(self, deadline: float, interim_after: float):
+        """
+        Args:
+            deadline: イベント発生からこの秒数を過ぎたら reply せず push で送る
+            interim_after: expect_delay() からこの秒数経っても未送信なら途中経過を reply する
+        """
+        self.deadline = deadline
+        self.interim_after = interim_after
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._replies = 0
+        self._reply_messages = 0
+        self._batched_calls = 0
+        self._interim_replies = 0
+        self._pushes = 0
+        self._missed_deadline = 0
+        self._expired_tokens = 0
+        self._send_errors = 0
+
+    # ---- イベント処理の範囲 ----
+
+    @contextmanager
+    def scope(self, event):
+        """1イベント分の処理を囲む（抜けるときに溜めたメッセージを送る）"""
+        if getattr(self._local, 'pending', None) is not None:
+            yield
+            return
+        pending = self._local.pending = _Pending(event)
+        try:
+            yield
+        finally:
+            self._local.pending = None
+            if pending.interim_timer is not None:
+                pending.interim_timer.cancel()
+            self._flush(pending)
+
+    def buffer(self, reply_token: str, messages, notification_disabled: bool = False) -> bool:
+        """
+        処理中のイベントの返信トークン宛てなら溜める
+
+        Returns:
+            bool: 溜めたか（False なら呼び出し側がそのまま reply する）
+        """
+        pending = getattr(self._local, 'pending', None)
+        if pending is None or not reply_token or reply_token != pending.reply_token:
+            return False
+        with self._lock:
+            if pending.messages:
+                self._batched_calls += 1
+            pending.messages.extend(_as_list(messages))
+            pending.notification_disabled = pending.notification_disabled or notification_disabled
+        return True
+
+    def flush_pending(self):
+        """溜まっているメッセージを今すぐ送る（push の前に呼び、送信順を保つ）"""
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            self._flush(pending)
+
+    def expect_delay(self, interim_text: str):
+        """
+        この後の処理に時間がかかることを知らせる
+
+        interim_after 秒（返信期限が先に来る場合はその少し前）経っても送信していなければ、
+        溜まっているメッセージ、なければ interim_text を先に reply する。
+        """
+        pending = getattr(self._local, 'pending', None)
+        if pending is None or pending.replied or pending.interim_timer is not None:
+            return
+        delay = max(0.0, min(self.interim_after, self.deadline - pending.age() - 1))
+        timer = threading.Timer(delay, self._send_interim, args=(pending, interim_text))
+        timer.daemon = True
+        pending.interim_timer = timer
+        timer.start()
+
+    # ---- 送信 ----
+
+    def _send_interim(self, pending: _Pending, interim_text: str):
+        with pending.send_lock:
+            if pending.replied:
+                return
+            with self._lock:
+                messages = pending.messages or [TextSendMessage(text=interim_text)]
+                pending.messages = []
+                self._interim_replies += 1
+            try:
+                self._send(pending, messages)
+            except Exception as e:
+                print(f"[Responder] interim reply failed to={pending.to} err={e}")
+
+    def _flush(self, pending: _Pending):
+        """溜まっているメッセージを送る（scope の終了時にも呼ぶため、送信エラーは送出しない）"""
+        with pending.send_lock:
+            with self._lock:
+                messages, pending.messages = pending.messages, []
+            if not messages:
+                return
+            try:
+                self._send(pending, messages)
+            except Exception as e:
+                with self._lock:
+                    self._send_errors += 1
+                print(f"[Responder] send failed to={pending.to} err={e}")
+
+    def _send(self, pending: _Pending, messages: list):
+        """send_lock 内で呼ぶ"""
+        from core.api import line_bot_api
+
+        if not pending.replied and pending.reply_token:
+            pending.replied = True
+            head, messages = messages[:MAX_MESSAGES_PER_CALL], messages[MAX_MESSAGES_PER_CALL:]
+            if pending.age() >= self.deadline:
+                self._count_missed('deadline')
+                messages = head + messages
+            else:
+                try:
+                    line_bot_api.send_reply(pending.reply_token, head, notification_disabled=pending.notification_disabled)
+                    with self._lock:
+                        self._replies += 1
+                        self._reply_messages += len(head)
+                except Exception as e:
+                    if isinstance(e, LineBotApiError) and _is_expired_token_error(e):
+                        self._count_missed('expired')
+                    else:
+                        # reply に失敗した場合も push で届ける
+                        with self._lock:
+                            self._send_errors += 1
+                        print(f"[Responder] reply failed, falling back to push to={pending.to} err={e}")
+                    messages = head + messages
+
+        if not messages:
+            return
+        if pending.to is None:
+            print(f"[Responder] push先が不明のため {len(messages)} 件を破棄しました")
+            return
+        for i in range(0, len(messages), MAX_MESSAGES_PER_CALL):
+            try:
+                line_bot_api.send_push(pending.to, messages[i:i + MAX_MESSAGES_PER_CALL],
+                                       notification_disabled=pending.notification_disabled)
+                with self._lock:
+                    self._pushes += 1
+            except Exception as e:
+                with self._lock:
+                    self._send_errors += 1
+                print(f"[Responder] push failed to={pending.to} err={e}")
+                return
+
+    def _count_missed(self, reason: str):
+        with self._lock:
+            if reason == 'deadline':
+                self._missed_deadline += 1
+            else:
+                self._expired_tokens += 1
+        metrics.incr('linebot_reply_window_missed_total', 'Replies sent by push because the reply token window was missed',
+                     reason=reason)
+
+    def stats(self) -> Dict[str, Any]:
+        """送信件数などの統計を取得"""
+        with self._lock:
+            return {
+                'deadline_seconds': self.deadline,
+                'interim_after_seconds': self.interim_after,
+                'replies': self._replies,
+                'reply_messages': self._reply_messages,
+                'batched_calls': self._batched_calls,
+                'interim_replies': self._interim_replies,
+                'pushes': self._pushes,
+                'missed_deadline': self._missed_deadline,
+                'expired_tokens': self._expired_tokens,
+                'send_errors': self._send_errors,
+            }
+
+
+# グローバルインスタンス
+responder = Responder(
+    deadline=config.REPLY_DEADLINE_SECONDS,
+    interim_after=config.REPLY_INTERIM_AFTER,
+)
+
+
+def expect_delay(interim_text: str):
+    """時間のかかる処理の前に呼ぶ（Responder.expect_delay を参照）"""
+    responder.expect_delay(interim_text)
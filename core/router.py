@@ -0,0 +1,276 @@
+"""
+コマンド/Postback ルーター
+
+テキストコマンドは完全一致を辞書、前方一致をトライ木で引き、
+Postback データはイベントごとに1回だけパースする。
+
+テキストの処理順序は「段（tier）」で表す。
+コマンドとセッションフックはそれぞれ段を持ち、
+一致したコマンドより前の段にあるセッションフックが先に実行される。
+（例: 振り込みセッション中は「?ショップ」よりセッション入力処理が優先されるが、
+「?ヘルプ」はセッションより前の段なので常に実行される）
+"""
+import urllib.parse
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Callable, Dict, List, Optional, Any
+
+# 適用範囲
+SCOPE_ANY = 'any'
+SCOPE_USER = 'user'    # 個別チャットのみ
+SCOPE_GROUP = 'group'  # グループチャットのみ
+
+# コマンドの重さの区分（レート制限のバケットを分ける）
+COST_CHEAP = 'cheap'    # DB をほぼ使わない
+COST_DB = 'db'          # 複数のクエリを実行する
+COST_RENDER = 'render'  # 画像生成・アップロードを伴う
+
+
+class RouteContext:
+    """1イベント分のルーティング情報"""
+
+    def __init__(self, event, text: str, user_id: str, group_id: Optional[str], display_name: str, sessions):
+        self.event = event
+        self.text = text
+        self.user_id = user_id
+        self.group_id = group_id
+        self.display_name = display_name
+        self.sessions = sessions
+        self.state = None
+        # 処理したルート/フックのラベル（計測用）
+        self.handled_by: Optional[str] = None
+        postback = getattr(event, 'postback', None)
+        self.data: Optional[str] = getattr(postback, 'data', None) if postback else None
+
+    @property
+    def source_type(self) -> str:
+        return self.event.source.type
+
+    @property
+    def reply_token(self) -> str:
+        return self.event.reply_token
+
+    @cached_property
+    def params(self) -> Dict[str, str]:
+        """Postback データのパース結果（初回アクセス時に1回だけパース）"""
+        return dict(urllib.parse.parse_qsl(self.data or ''))
+
+
+@dataclass
+class Route:
+    """ルート定義
+
+    handler は RouteContext を受け取る。明示的に False を返した場合は
+    「処理しなかった」とみなして後続の段へ進む。
+    """
+    pattern: str
+    handler: Callable[[RouteContext], Any]
+    kind: str                      # 'text' | 'postback'
+    match: str                     # 'exact' | 'prefix'
+    tier: int = 0
+    scope: str = SCOPE_ANY
+    allow_imprisoned: bool = False
+    name: str = ''
+    cost: str = COST_CHEAP
+
+    @property
+    def label(self) -> str:
+        return f"{self.kind}:{self.pattern}"
+
+    def accepts(self, ctx: RouteContext) -> bool:
+        return self.scope == SCOPE_ANY or self.scope == ctx.source_type
+
+
+@dataclass
+class SessionHook:
+    """セッション中の入力を処理するフック（True を返したら処理済み）"""
+    handler: Callable[[RouteContext], bool]
+    tier: int
+    scope: str = SCOPE_ANY
+    name: str = ''
+
+
+class _PrefixTrie:
+    """前方一致用のトライ木（最長一致）"""
+
+    _END = object()
+
+    def __init__(self):
+        self._root: Dict[Any, Any] = {}
+
+    def insert(self, prefix: str, value):
+        node = self._root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node[self._END] = value
+
+    def longest_match(self, text: str):
+        node = self._root
+        found = node.get(self._END)
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            if self._END in node:
+                found = node[self._END]
+        return found
+
+
+class _RouteTable:
+    def __init__(self):
+        self.exact: Dict[str, List[Route]] = {}
+        self.prefix = _PrefixTrie()
+        self.prefix_routes: Dict[str, List[Route]] = {}
+
+    def add(self, route: Route):
+        if route.match == 'exact':
+            self.exact.setdefault(route.pattern, []).append(route)
+        else:
+            routes = self.prefix_routes.get(route.pattern)
+            if routes is None:
+                routes = self.prefix_routes[route.pattern] = []
+                self.prefix.insert(route.pattern, routes)
+            routes.append(route)
+
+    def lookup(self, key: str, ctx: RouteContext) -> Optional[Route]:
+        """完全一致 → 最長前方一致の順に、適用範囲が合うルートを返す"""
+        for candidates in (self.exact.get(key), self.prefix.longest_match(key)):
+            if candidates:
+                for route in candidates:
+                    if route.accepts(ctx):
+                        return route
+        return None
+
+    def all_routes(self) -> List[Route]:
+        routes = [r for rs in self.exact.values() for r in rs]
+        routes += [r for rs in self.prefix_routes.values() for r in rs]
+        return routes
+
+
+class Router:
+    """テキストコマンド/Postback のルーティングテーブル"""
+
+    def __init__(self):
+        self._text = _RouteTable()
+        self._postback = _RouteTable()
+        self._hooks: List[SessionHook] = []
+        self._guard: Optional[Callable[[RouteContext, Route], bool]] = None
+
+    # ---- 登録 ----
+
+    def text(self, *patterns: str, tier: int, prefix: bool = False, scope: str = SCOPE_ANY,
+             allow_imprisoned: bool = False, cost: str = COST_CHEAP):
+        """テキストコマンドを登録するデコレーター"""
+        def decorator(func):
+            for pattern in patterns:
+                self._text.add(Route(
+                    pattern=pattern, handler=func, kind='text', match='prefix' if prefix else 'exact',
+                    tier=tier, scope=scope, allow_imprisoned=allow_imprisoned, name=func.__name__, cost=cost,
+                ))
+            return func
+        return decorator
+
+    def postback(self, *patterns: str, prefix: bool = False, scope: str = SCOPE_ANY, cost: str = COST_CHEAP):
+        """Postback アクションを登録するデコレーター"""
+        def decorator(func):
+            for pattern in patterns:
+                self._postback.add(Route(
+                    pattern=pattern, handler=func, kind='postback', match='prefix' if prefix else 'exact',
+                    scope=scope, name=func.__name__, cost=cost,
+                ))
+            return func
+        return decorator
+
+    def session_hook(self, *, tier: int, scope: str = SCOPE_ANY):
+        """セッション入力フックを登録するデコレーター"""
+        def decorator(func):
+            self._hooks.append(SessionHook(handler=func, tier=tier, scope=scope, name=func.__name__))
+            self._hooks.sort(key=lambda h: h.tier)
+            return func
+        return decorator
+
+    def set_guard(self, guard: Callable[[RouteContext, Route], bool]):
+        """
+        ルートを実行する直前に呼ぶ関数を設定する（レート制限用）
+
+        guard が False を返した場合はルートを実行せず処理済みとする（応答は guard 側で行う）。
+        """
+        self._guard = guard
+
+    # ---- 解決/実行 ----
+
+    def match_postback(self, ctx: RouteContext) -> Optional[Route]:
+        if ctx.data is None:
+            return None
+        return self._postback.lookup(ctx.data, ctx)
+
+    def match_text(self, ctx: RouteContext) -> Optional[Route]:
+        if not ctx.text:
+            return None
+        return self._text.lookup(ctx.text, ctx)
+
+    def run_postback(self, ctx: RouteContext, route: Route):
+        """一致した Postback アクションを実行する"""
+        self._run_route(ctx, route)
+
+    def run_text(self, ctx: RouteContext, route: Optional[Route]) -> bool:
+        """
+        一致したコマンドと、それより前の段のセッションフックを順に実行する
+
+        Returns:
+            bool: いずれかが処理したか
+        """
+        route_done = route is None
+        for hook in self._hooks:
+            if not route_done and route.tier < hook.tier:
+                route_done = True
+                if self._run_route(ctx, route):
+                    return True
+            if hook.scope != SCOPE_ANY and hook.scope != ctx.source_type:
+                continue
+            if hook.handler(ctx):
+                ctx.handled_by = f"hook:{hook.name}"
+                return True
+        if not route_done:
+            return self._run_route(ctx, route)
+        return False
+
+    def _run_route(self, ctx: RouteContext, route: Route) -> bool:
+        if self._guard is not None and not self._guard(ctx, route):
+            ctx.handled_by = 'rate_limited'
+            return True
+        ctx.handled_by = route.label
+        if route.handler(ctx) is not False:
+            return True
+        ctx.handled_by = None
+        return False
+
+    # ---- 診断 ----
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """ルーティングテーブルの一覧（診断用）"""
+        rows = []
+        for route in self._postback.all_routes() + self._text.all_routes():
+            rows.append({
+                'kind': route.kind,
+                'match': route.match,
+                'pattern': route.pattern,
+                'handler': route.name,
+                'tier': route.tier,
+                'scope': route.scope,
+                'allow_imprisoned': route.allow_imprisoned,
+                'cost': route.cost,
+            })
+        for hook in self._hooks:
+            rows.append({
+                'kind': 'session_hook',
+                'match': None,
+                'pattern': None,
+                'handler': hook.name,
+                'tier': hook.tier,
+                'scope': hook.scope,
+                'allow_imprisoned': False,
+                'cost': None,
+            })
+        rows.sort(key=lambda r: (r['kind'] != 'postback', r['tier'], r['pattern'] or ''))
+        return rows
@@ -0,0 +1,372 @@
+"""
+定期ジョブの統合スケジューラー
+
+株価更新・AI取引・配当・給付金配布・課税/回収/ローンを1つの APScheduler で実行する。
+各モジュールはインポート時に `job_scheduler.register(...)` でジョブを登録し、
+リーダーに選ばれたプロセスが `job_scheduler.start()` で動かす。
+
+- 重複実行の防止: 同じジョブは同時に1つまで（max_instances=1）
+- 遅延（misfire）: misfire_grace_time 以内なら遅れて1回だけ実行（coalesce）
+- 取りこぼし（catch-up）: 日次/週次ジョブは、起動時に直近の予定時刻以降の
+  実行記録がなければすぐに1回実行する（停止中やリーダー交代中に予定時刻を過ぎた場合）
+- 実行履歴: プロセス内に直近の結果を保持し、scheduler_job_runs テーブルにも記録する
+- 停止: shutdown() は新しい実行を止め、実行中のジョブの終了を待つ。長いジョブは
+  ループごとに stop_requested() を確認し、途中までを確定して JobInterrupted を送出する。
+  中断された実行は取りこぼしの判定で未実行として扱われ、次の起動時に続きから実行される
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, List, Optional
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from apps.utilities.timezone_utils import now_jst
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TIMEZONE = 'Asia/Tokyo'
+
+# プロセス内に保持する実行履歴の件数（ジョブごと）
+_HISTORY_SIZE = 20
+# scheduler_job_runs の保持日数
+_HISTORY_RETENTION_DAYS = 14
+
+_HOLDER = f"{socket.gethostname()}:{os.getpid()}"
+
+# 中断された実行の error 列の接頭辞
+_INTERRUPTED = 'JobInterrupted'
+# 実行記録を書けずに実行しなかった場合の error
+_NOT_RECORDED = 'skipped: run could not be recorded'
+
+
+class JobInterrupted(Exception):
+    """停止要求によりジョブを途中で終えた（確定済みの分は次回の実行で飛ばす）"""
+
+
+@dataclass
+class JobSpec:
+    """登録されたジョブの定義"""
+    job_id: str
+    name: str
+    func: Callable[[], Any]
+    trigger: BaseTrigger
+    misfire_grace_time: int
+    catch_up: Optional[timedelta] = None  # 起動時に取りこぼしを確認する範囲
+    catch_up_delay: timedelta = timedelta(0)  # 取りこぼし実行を起動から遅らせる時間（実行順の維持用）
+    history: deque = field(default_factory=lambda: deque(maxlen=_HISTORY_SIZE))
+
+
+@dataclass
+class JobRun:
+    """1回分の実行結果"""
+    started_at: datetime
+    duration: float
+    success: bool
+    error: Optional[str] = None
+
+
+class JobScheduler:
+    """登録済みジョブを1つの BackgroundScheduler で実行する"""
+
+    def __init__(self):
+        self._specs: Dict[str, JobSpec] = {}
+        self._scheduler: Optional[BackgroundScheduler] = None
+        self._lock = threading.Lock()
+        # 停止要求（実行中のジョブが確認して途中で終える）
+        self._stopping = threading.Event()
+        # 実行中のジョブ数と job_id（停止時の待ち合わせ用）
+        self._active = 0
+        self._running: List[str] = []
+        self._idle = threading.Condition(self._lock)
+
+    # ---- 登録 ----
+
+    def register(self, job_id: str, name: str, func: Callable[[], Any], trigger: BaseTrigger, *,
+                 misfire_grace_time: int = 60, catch_up: Optional[timedelta] = None,
+                 catch_up_delay: timedelta = timedelta(0)):
+        """
+        ジョブを登録する（実行中のスケジューラーがあれば即座に追加）
+
+        Args:
+            job_id: ジョブID（履歴・メトリクスのキー）
+            name: 表示名
+            func: 実行する関数
+            trigger: APScheduler のトリガー
+            misfire_grace_time: 予定時刻からこの秒数以内なら遅れても実行する
+            catch_up: 起動時、この範囲内の予定時刻以降に実行記録がなければすぐに実行する
+                      （同じ日に2回実行しても問題ないジョブ、またはジョブ内で実行日を確認するジョブにだけ指定する）
+            catch_up_delay: 取りこぼし実行を起動からどれだけ遅らせるか
+        """
+        spec = JobSpec(job_id=job_id, name=name, func=func, trigger=trigger,
+                       misfire_grace_time=misfire_grace_time, catch_up=catch_up, catch_up_delay=catch_up_delay)
+        with self._lock:
+            self._specs[job_id] = spec
+            if self._scheduler is not None:
+                self._add(self._scheduler, spec)
+
+    # ---- 起動/停止 ----
+
+    def start(self):
+        """スケジューラーを開始（停止後の再開時は新しいスケジューラーを作る）"""
+        with self._lock:
+            if self._scheduler is not None:
+                logger.info("[Scheduler] already running")
+                return
+            scheduler = BackgroundScheduler(
+                timezone=TIMEZONE,
+                job_defaults={'coalesce': True, 'max_instances': 1},
+            )
+            self._stopping.clear()
+            for spec in self._specs.values():
+                self._add(scheduler, spec)
+            scheduler.start()
+            self._scheduler = scheduler
+        logger.info(f"[Scheduler] started ({len(self._specs)} jobs)")
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None) -> bool:
+        """
+        スケジューラーを停止する
+
+        新しい実行を止めて実行中のジョブに停止を要求し、wait=True なら終了を待つ。
+
+        Args:
+            wait: 実行中のジョブの終了を待つか
+            timeout: 待つ最大秒数（None なら終わるまで待つ）
+
+        Returns:
+            bool: 実行中のジョブがなくなったか
+        """
+        with self._lock:
+            scheduler, self._scheduler = self._scheduler, None
+        if scheduler is None:
+            return True
+        self._stopping.set()
+        scheduler.shutdown(wait=False)
+        idle = True
+        if wait:
+            with self._idle:
+                idle = self._idle.wait_for(lambda: self._active == 0, timeout)
+        if idle:
+            logger.info("[Scheduler] stopped")
+        else:
+            logger.warning(f"[Scheduler] stopped with {self._active} job(s) still running: {self.active_jobs()}")
+        return idle
+
+    def active_jobs(self) -> List[str]:
+        """実行中のジョブの job_id"""
+        with self._lock:
+            return list(self._running)
+
+    def stop_requested(self) -> bool:
+        """停止が要求されているか（長いジョブがループごとに確認する）"""
+        return self._stopping.is_set()
+
+    @property
+    def running(self) -> bool:
+        return self._scheduler is not None
+
+    # ---- 状態 ----
+
+    def job_summaries(self) -> List[Dict[str, Any]]:
+        """各ジョブの次回実行予定と直近の実行結果"""
+        scheduler = self._scheduler
+        now = now_jst()
+        summaries = []
+        for spec in self._specs.values():
+            next_run = None
+            if scheduler is not None:
+                job = scheduler.get_job(spec.job_id)
+                next_run = job.next_run_time if job else None
+            elif isinstance(spec.trigger, CronTrigger):
+                # 非リーダーでも日時指定のジョブは予定時刻を計算できる
+                next_run = spec.trigger.get_next_fire_time(None, now)
+            last = spec.history[-1] if spec.history else None
+            durations = [run.duration for run in spec.history]
+            summaries.append({
+                'job_id': spec.job_id,
+                'name': spec.name,
+                'next_run_time': next_run.isoformat() if next_run else None,
+                'last_started_at': last.started_at.isoformat() if last else None,
+                'last_duration': round(last.duration, 3) if last else None,
+                'last_success': last.success if last else None,
+                'last_error': last.error if last else None,
+                'avg_duration': round(sum(durations) / len(durations), 3) if durations else None,
+                'runs': len(spec.history),
+            })
+        summaries.sort(key=lambda s: s['next_run_time'] or '9999')
+        return summaries
+
+    def recent_runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """scheduler_job_runs から全プロセス分の直近の実行記録を取得"""
+        from core.db import raw_connection
+        with raw_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT job_id, holder, started_at, duration_ms, success, error
+                    FROM scheduler_job_runs ORDER BY started_at DESC LIMIT %s
+                    """,
+                    (limit,),
+                )
+                rows = cur.fetchall()
+        return [
+            {'job_id': job_id, 'holder': holder, 'started_at': started_at.isoformat(),
+             'duration_ms': duration_ms, 'success': success, 'error': error}
+            for job_id, holder, started_at, duration_ms, success, error in rows
+        ]
+
+    # ---- 内部処理 ----
+
+    def _add(self, scheduler: BackgroundScheduler, spec: JobSpec):
+        kwargs = {}
+        if spec.catch_up and self._missed_run(spec):
+            logger.info(f"[Scheduler] catch-up: {spec.job_id}")
+            kwargs['next_run_time'] = now_jst() + spec.catch_up_delay
+        scheduler.add_job(
+            self._run, spec.trigger, args=(spec,),
+            id=spec.job_id, name=spec.name,
+            misfire_grace_time=spec.misfire_grace_time,
+            replace_existing=True,
+            **kwargs,
+        )
+
+    def _missed_run(self, spec: JobSpec) -> bool:
+        """catch_up の範囲内に予定時刻があり、それ以降に実行の記録がないか"""
+        now = now_jst()
+        scheduled = None
+        fire_time = spec.trigger.get_next_fire_time(None, now - spec.catch_up)
+        while fire_time is not None and fire_time <= now:
+            scheduled = fire_time
+            fire_time = spec.trigger.get_next_fire_time(fire_time, fire_time + timedelta(microseconds=1))
+        if scheduled is None:
+            return False
+        try:
+            last_started = _last_started_at(spec.job_id)
+        except Exception as e:
+            # 記録が読めない場合は二重実行を避けて取りこぼしを許容する
+            logger.error(f"[Scheduler] catch-up check failed: {spec.job_id} {e}")
+            return False
+        if last_started is None:
+            # 記録が1件もない（初回のデプロイ直後など）場合は、前のスケジューラーで実行済みかもしれないので実行しない
+            logger.info(f"[Scheduler] catch-up skipped (no run history): {spec.job_id}")
+            return False
+        return last_started < scheduled
+
+    def _run(self, spec: JobSpec):
+        with self._lock:
+            self._active += 1
+            self._running.append(spec.job_id)
+        try:
+            self._execute(spec)
+        finally:
+            with self._idle:
+                self._active -= 1
+                self._running.remove(spec.job_id)
+                self._idle.notify_all()
+
+    def _execute(self, spec: JobSpec):
+        started_at = now_jst()
+        start = time.perf_counter()
+        run_id = _record_start(spec.job_id)
+        if run_id is None and spec.catch_up:
+            # 記録のない実行は次の起動時に取りこぼしとみなされ再実行されるので、二重実行を避けて実行しない
+            logger.error(f"[Scheduler] {spec.job_id} skipped: run could not be recorded")
+            spec.history.append(JobRun(started_at=started_at, duration=0.0, success=False, error=_NOT_RECORDED))
+            return
+        error = None
+        try:
+            with metrics.job_timer(spec.job_id):
+                spec.func()
+        except JobInterrupted as e:
+            error = f"{_INTERRUPTED}: {e}"
+            logger.warning(f"[Scheduler] {spec.job_id} interrupted: {e}")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.error(f"[Scheduler] {spec.job_id} error: {e}\n{traceback.format_exc()}")
+        duration = time.perf_counter() - start
+        spec.history.append(JobRun(started_at=started_at, duration=duration, success=error is None, error=error))
+        _record_finish(run_id, duration, error)
+
+
+def _last_started_at(job_id: str) -> Optional[datetime]:
+    from core.db import raw_connection
+    with raw_connection() as conn:
+        with conn.cursor() as cur:
+            # 中断された実行は未実行として扱う（次の起動時に続きから実行させる）
+            cur.execute(
+                """
+                SELECT max(started_at) FROM scheduler_job_runs
+                WHERE job_id = %s AND (error IS NULL OR error NOT LIKE %s)
+                """,
+                (job_id, f"{_INTERRUPTED}:%"),
+            )
+            return cur.fetchone()[0]
+
+
+def _record_start(job_id: str) -> Optional[int]:
+    from core.db import raw_connection
+    try:
+        with raw_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO scheduler_job_runs (job_id, holder) VALUES (%s, %s) RETURNING run_id",
+                    (job_id, _HOLDER),
+                )
+                run_id = cur.fetchone()[0]
+            conn.commit()
+        return run_id
+    except Exception as e:
+        logger.error(f"[Scheduler] failed to record run start: {job_id} {e}")
+        return None
+
+
+def _record_finish(run_id: Optional[int], duration: float, error: Optional[str]):
+    if run_id is None:
+        return
+    from core.db import raw_connection
+    try:
+        with raw_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE scheduler_job_runs
+                    SET finished_at = now(), duration_ms = %s, success = %s, error = %s
+                    WHERE run_id = %s
+                    """,
+                    (int(duration * 1000), error is None, error, run_id),
+                )
+            conn.commit()
+    except Exception as e:
+        logger.error(f"[Scheduler] failed to record run finish: {run_id} {e}")
+
+
+def _prune_history():
+    from core.db import raw_connection
+    with raw_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM scheduler_job_runs WHERE started_at < now() - %s * interval '1 day'",
+                (_HISTORY_RETENTION_DAYS,),
+            )
+        conn.commit()
+
+
+# グローバルインスタンス
+job_scheduler = JobScheduler()
+
+job_scheduler.register(
+    'scheduler.prune_history', '実行履歴の整理', _prune_history,
+    CronTrigger(hour=4, minute=30, timezone=TIMEZONE),
+    misfire_grace_time=3600,
+)
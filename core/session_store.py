@@ -0,0 +1,876 @@
+"""
+会話セッションの共通ストア
+
+銀行・株式・ショップ・ゲームの各セッションマネージャーが種類（kind）ごとの
+名前空間としてこのストアを使う。
+
+- 最後の操作から種類ごとの TTL を過ぎたセッションは破棄する
+  （アクセス時の判定 + バックグラウンドの定期掃除）
+- 破棄時のコールバックで、ロック中のチップ返却などの後始末を行う
+
+保存先は SESSION_BACKEND で切り替える。
+- 'memory': プロセス内の辞書。全セッション合計の概算メモリ量が上限を超えたら
+  最も古く使われたものから破棄する（ワーカー1つの構成向け）。
+  停止時に persist() で conversation_sessions に退避し、起動時に restore() で読み戻す
+- 'postgres': UNLOGGED テーブル conversation_sessions。ワーカー間で共有され、
+  ワーカーの再起動後も残る。イベント処理中（request_scope 内）は
+  キーごとに全種類を1回のクエリで読み、抜けるときに変更分だけを
+  バージョン比較付き（compare-and-set）で書き戻す
+"""
+import json
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Any, Optional, Callable, Tuple, List
+
+import config
+from core.metrics import metrics
+
+_MISSING = object()
+
+# on_expire(key, value, reason) の reason
+REASON_EXPIRED = 'expired'
+REASON_EVICTED = 'evicted'
+
+
+class SessionConflict(Exception):
+    """request_scope の書き戻しが他のワーカーの更新と競合し、一部のセッションを保存できなかった"""
+
+    def __init__(self, conflicts: List[Tuple[str, str]]):
+        super().__init__(f"session write conflict: {conflicts}")
+        # [(kind, key), ...]
+        self.conflicts = conflicts
+
+# これ以上のサイズのペイロードは zlib で圧縮して保存する
+_COMPRESS_MIN_BYTES = 512
+
+
+def estimate_size(obj, _depth: int = 0) -> int:
+    """オブジェクトの概算メモリ量（バイト）。辞書・リストなどは中身も数える"""
+    size = sys.getsizeof(obj)
+    if _depth >= 8:
+        return size
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            size += estimate_size(v, _depth + 1)
+    return size
+
+
+# ---- シリアライズ ----
+
+def _encode(obj):
+    if isinstance(obj, datetime):
+        return {'__dt': obj.isoformat()}
+    if isinstance(obj, date):
+        return {'__date': obj.isoformat()}
+    if isinstance(obj, Decimal):
+        return {'__dec': str(obj)}
+    if isinstance(obj, (set, frozenset)):
+        return {'__set': list(obj)}
+    raise TypeError(f"セッションに保存できない型です: {type(obj).__name__}")
+
+
+def _decode(obj: Dict):
+    if len(obj) == 1:
+        (tag, value), = obj.items()
+        if tag == '__dt':
+            return datetime.fromisoformat(value)
+        if tag == '__date':
+            return date.fromisoformat(value)
+        if tag == '__dec':
+            return Decimal(value)
+        if tag == '__set':
+            return set(value)
+    return obj
+
+
+def dumps_session(value: Any) -> bytes:
+    """セッションの値をバイト列にする（JSON。大きいものは zlib 圧縮。タプルはリストになる）"""
+    data = json.dumps(value, default=_encode, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(data) >= _COMPRESS_MIN_BYTES:
+        return b'z' + zlib.compress(data)
+    return b'j' + data
+
+
+def loads_session(payload: bytes) -> Any:
+    """dumps_session の逆変換"""
+    payload = bytes(payload)
+    data = zlib.decompress(payload[1:]) if payload[:1] == b'z' else payload[1:]
+    return json.loads(data, object_hook=_decode)
+
+
+# ---- 名前空間 ----
+
+class _KindStats:
+    __slots__ = ('ttl', 'on_expire', 'live', 'bytes', 'created', 'expired', 'evicted')
+
+    def __init__(self, ttl: int, on_expire: Optional[Callable]):
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self.live = 0
+        self.bytes = 0
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+
+class SessionNamespace:
+    """1種類分のセッション（ユーザーIDをキーとする辞書風インターフェース）
+
+    取得・設定のたびに有効期限が延びる。値の辞書をその場で書き換えた場合は
+    touch() を呼ぶとメモリ量の見積もりも更新される（postgres では
+    request_scope 外での書き換えを保存するのに必要）。
+    """
+
+    def __init__(self, store: 'SessionStore', kind: str):
+        self._store = store
+        self.kind = kind
+
+    def get(self, key: str, default=None):
+        value = self._store._get(self.kind, key)
+        return default if value is _MISSING else value
+
+    def set(self, key: str, value: Any):
+        self._store._set(self.kind, key, value)
+
+    def touch(self, key: str) -> bool:
+        """有効期限を延ばし、変更を反映する（存在しなければ False）"""
+        return self._store._touch(self.kind, key)
+
+    def pop(self, key: str, default=None):
+        value = self._store._pop(self.kind, key)
+        return default if value is _MISSING else value
+
+    def clear(self):
+        self._store._clear(self.kind)
+
+    def copy(self) -> Dict[str, Any]:
+        """有効なセッションのスナップショット（有効期限は延ばさない）"""
+        return self._store._snapshot(self.kind)
+
+    def __getitem__(self, key: str):
+        value = self._store._get(self.kind, key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        self._store._set(self.kind, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return self._store._get(self.kind, key) is not _MISSING
+
+    def __len__(self) -> int:
+        return self._store._live(self.kind)
+
+
+class SessionStore:
+    """セッションストアの共通部分（名前空間の登録・破棄コールバック・掃除スレッド）"""
+
+    backend = ''
+
+    def __init__(self, sweep_interval: int):
+        """
+        Args:
+            sweep_interval: 期限切れセッションを掃除する間隔（秒）
+        """
+        self.sweep_interval = sweep_interval
+        self._kinds: Dict[str, _KindStats] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._sweeps = 0
+        self._callback_errors = 0
+
+    def namespace(self, kind: str, ttl: int, on_expire: Optional[Callable[[str, Any, str], None]] = None) -> SessionNamespace:
+        """
+        種類ごとの名前空間を取得
+
+        Args:
+            kind: セッションの種類（'banking', 'stock' など）
+            ttl: 最後の操作から破棄するまでの秒数
+            on_expire: 期限切れ/上限超過で破棄されたときに (key, value, reason) で呼ばれる関数
+        """
+        with self._lock:
+            self._kinds[kind] = _KindStats(ttl, on_expire)
+        return SessionNamespace(self, kind)
+
+    @contextmanager
+    def request_scope(self):
+        """
+        1イベント分の処理を囲む（共有ストアでは抜けるときに変更を書き戻す）
+
+        Raises:
+            SessionConflict: 書き戻しが他のワーカーの更新と競合した（処理中に例外が無かった場合のみ）
+        """
+        yield
+
+    # ---- 実装ごとの操作 ----
+
+    def _get(self, kind: str, key: str):
+        raise NotImplementedError
+
+    def _set(self, kind: str, key: str, value: Any):
+        raise NotImplementedError
+
+    def _touch(self, kind: str, key: str) -> bool:
+        raise NotImplementedError
+
+    def _pop(self, kind: str, key: str):
+        raise NotImplementedError
+
+    def _clear(self, kind: str):
+        raise NotImplementedError
+
+    def _snapshot(self, kind: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _live(self, kind: str) -> int:
+        raise NotImplementedError
+
+    def sweep(self) -> int:
+        """
+        期限切れのセッションをすべて破棄する
+
+        Returns:
+            int: 破棄した件数
+        """
+        raise NotImplementedError
+
+    # ---- 破棄コールバック ----
+
+    def _notify(self, kind: str, key: str, value: Any, reason: str):
+        """破棄コールバックを呼ぶ（ロック外で呼ぶ）"""
+        stats = self._kinds.get(kind)
+        if stats is None:
+            return
+        with self._lock:
+            if reason == REASON_EXPIRED:
+                stats.expired += 1
+            else:
+                stats.evicted += 1
+        metrics.incr(f'linebot_sessions_{reason}_total', f'Sessions discarded ({reason})', kind=kind)
+        if stats.on_expire is None:
+            return
+        try:
+            stats.on_expire(key, value, reason)
+        except Exception as e:
+            with self._lock:
+                self._callback_errors += 1
+            print(f"[SessionStore] {kind} セッションの後始末に失敗しました: user={key}, {e}")
+
+    # ---- 掃除スレッド ----
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[SessionStore] 掃除に失敗しました: {e}")
+
+    def stop(self):
+        """掃除スレッドを停止"""
+        self._stop.set()
+
+    def persist(self) -> int:
+        """停止前に呼ぶ。プロセス内のセッションを退避する（共有ストアでは不要）"""
+        return 0
+
+    def restore(self) -> int:
+        """起動時に呼ぶ。persist() で退避したセッションを読み戻す"""
+        return 0
+
+    # ---- 診断 ----
+
+    def stats(self) -> Dict[str, Any]:
+        """種類ごとの件数・概算メモリ量などの統計を取得"""
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'sweeps': self._sweeps,
+                'callback_errors': self._callback_errors,
+                'by_kind': {
+                    kind: {
+                        'live': s.live,
+                        'bytes': s.bytes,
+                        'ttl': s.ttl,
+                        'created': s.created,
+                        'expired': s.expired,
+                        'evicted': s.evicted,
+                    }
+                    for kind, s in self._kinds.items()
+                },
+            }
+
+
+# ---- プロセス内ストア ----
+
+# 停止時の退避（プロセス内ストアでも共有ストアと同じテーブルを使う）
+_PERSIST_SQL = """
+    INSERT INTO conversation_sessions (kind, session_key, payload, version, ttl, expires_at, updated_at)
+    VALUES (%s, %s, %s, 1, %s, now() + %s * interval '1 second', now())
+    ON CONFLICT (session_key, kind) DO UPDATE
+    SET payload = EXCLUDED.payload, version = conversation_sessions.version + 1,
+        ttl = EXCLUDED.ttl, expires_at = EXCLUDED.expires_at, updated_at = now()
+"""
+# 起動時の読み戻し（登録済みの種類の行だけを読んで削除する。残り秒数が 0 以下なら停止中に期限切れ）
+_RESTORE_SQL = """
+    DELETE FROM conversation_sessions
+    WHERE kind = ANY(%s)
+    RETURNING kind, session_key, payload, extract(epoch FROM expires_at - now())
+"""
+
+class _Entry:
+    __slots__ = ('value', 'expires_at', 'size')
+
+    def __init__(self, value, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class LocalSessionStore(SessionStore):
+    """TTL/LRU とメモリ上限付きのセッションストア（プロセス内）"""
+
+    backend = 'memory'
+
+    def __init__(self, memory_cap_bytes: int, sweep_interval: int):
+        """
+        Args:
+            memory_cap_bytes: 全セッション合計の概算メモリ量の上限（バイト）
+            sweep_interval: 期限切れセッションを掃除する間隔（秒）
+        """
+        super().__init__(sweep_interval)
+        self.memory_cap_bytes = memory_cap_bytes
+        # (kind, key) -> _Entry（古く使われた順）
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+
+    def _get(self, kind: str, key: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                return _MISSING
+            if entry.expires_at > now:
+                entry.expires_at = now + self._kinds[kind].ttl
+                self._entries.move_to_end((kind, key))
+                return entry.value
+            self._remove((kind, key), entry)
+        self._notify(kind, key, entry.value, REASON_EXPIRED)
+        return _MISSING
+
+    def _set(self, kind: str, key: str, value: Any):
+        self._ensure_started()
+        size = estimate_size(value)
+        with self._lock:
+            stats = self._kinds[kind]
+            old = self._entries.pop((kind, key), None)
+            if old is not None:
+                stats.bytes -= old.size
+                self._bytes -= old.size
+            else:
+                stats.live += 1
+                stats.created += 1
+            self._entries[(kind, key)] = _Entry(value, time.monotonic() + stats.ttl, size)
+            stats.bytes += size
+            self._bytes += size
+            evicted = self._evict_over_cap()
+        for k, v in evicted:
+            self._notify(k[0], k[1], v, REASON_EVICTED)
+
+    def _touch(self, kind: str, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get((kind, key))
+        if entry is None:
+            return False
+        size = estimate_size(entry.value)
+        with self._lock:
+            if self._entries.get((kind, key)) is not entry:
+                return False
+            stats = self._kinds[kind]
+            stats.bytes += size - entry.size
+            self._bytes += size - entry.size
+            entry.size = size
+            entry.expires_at = time.monotonic() + stats.ttl
+            self._entries.move_to_end((kind, key))
+            evicted = self._evict_over_cap()
+        for k, v in evicted:
+            self._notify(k[0], k[1], v, REASON_EVICTED)
+        return True
+
+    def _pop(self, kind: str, key: str):
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                return _MISSING
+            self._remove((kind, key), entry)
+            return entry.value
+
+    def _clear(self, kind: str):
+        with self._lock:
+            for k in [k for k in self._entries if k[0] == kind]:
+                self._remove(k, self._entries[k])
+
+    def _snapshot(self, kind: str) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {k[1]: e.value for k, e in self._entries.items() if k[0] == kind and e.expires_at > now}
+
+    def _live(self, kind: str) -> int:
+        with self._lock:
+            return self._kinds[kind].live
+
+    def _remove(self, k: Tuple[str, str], entry: _Entry):
+        """ロック内で呼ぶ"""
+        del self._entries[k]
+        stats = self._kinds[k[0]]
+        stats.live -= 1
+        stats.bytes -= entry.size
+        self._bytes -= entry.size
+
+    def _evict_over_cap(self) -> List[Tuple[Tuple[str, str], Any]]:
+        """ロック内で呼ぶ。上限を超えている間、最も古く使われたものから破棄する（最新の1件は残す）"""
+        evicted = []
+        while self._bytes > self.memory_cap_bytes and len(self._entries) > 1:
+            k, entry = next(iter(self._entries.items()))
+            self._remove(k, entry)
+            evicted.append((k, entry.value))
+        return evicted
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [(k, e) for k, e in self._entries.items() if e.expires_at <= now]
+            for k, entry in expired:
+                self._remove(k, entry)
+            self._sweeps += 1
+        for (kind, key), entry in expired:
+            self._notify(kind, key, entry.value, REASON_EXPIRED)
+        return len(expired)
+
+    def persist(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            entries = [(k, e.value, e.expires_at - now) for k, e in self._entries.items() if e.expires_at > now]
+        rows = []
+        for (kind, key), value, remaining in entries:
+            try:
+                rows.append((kind, key, dumps_session(value), self._kinds[kind].ttl, remaining))
+            except Exception as e:
+                print(f"[SessionStore] 退避できないセッションを飛ばしました kind={kind} key={key} err={e}")
+        if not rows:
+            return 0
+        from core.db import raw_connection
+        with raw_connection() as conn:
+            with conn.cursor() as cur:
+                cur.executemany(_PERSIST_SQL, rows)
+            conn.commit()
+        return len(rows)
+
+    def restore(self) -> int:
+        # 未登録の種類の行は残す（名前空間をすべて登録してから呼ぶこと）
+        with self._lock:
+            kinds = list(self._kinds)
+        if not kinds:
+            return 0
+        rows = PostgresSessionStore._execute(_RESTORE_SQL, (kinds,), fetch=True) or []
+        now = time.monotonic()
+        restored = 0
+        expired = []
+        for kind, key, payload, remaining in rows:
+            if kind not in self._kinds:
+                continue
+            try:
+                value = loads_session(payload)
+            except Exception as e:
+                print(f"[SessionStore] 読み戻せないセッションを破棄しました kind={kind} key={key} err={e}")
+                continue
+            if remaining <= 0:
+                # 停止中に期限切れになったものは破棄コールバック（チップ返却など）を呼ぶ
+                expired.append((kind, key, value))
+                continue
+            size = estimate_size(value)
+            with self._lock:
+                if (kind, key) in self._entries:
+                    continue
+                stats = self._kinds[kind]
+                self._entries[(kind, key)] = _Entry(value, now + min(float(remaining), stats.ttl), size)
+                stats.live += 1
+                stats.created += 1
+                stats.bytes += size
+                self._bytes += size
+            restored += 1
+        if restored:
+            self._ensure_started()
+        for kind, key, value in expired:
+            self._notify(kind, key, value, REASON_EXPIRED)
+        return restored
+
+    def stats(self) -> Dict[str, Any]:
+        result = super().stats()
+        with self._lock:
+            result.update({
+                'sessions': len(self._entries),
+                'bytes': self._bytes,
+                'memory_cap_bytes': self.memory_cap_bytes,
+            })
+        return result
+
+
+# ---- Postgres 共有ストア ----
+
+# キーの全種類を読む。期限切れは削除して返し（破棄コールバック用）、
+# 残り時間が TTL の半分を切ったものは期限を延ばす
+_LOAD_SQL = """
+    WITH expired AS (
+        DELETE FROM conversation_sessions
+        WHERE session_key = %(key)s AND expires_at <= now()
+        RETURNING kind, payload, version
+    ), touched AS (
+        UPDATE conversation_sessions SET expires_at = now() + ttl * interval '1 second'
+        WHERE session_key = %(key)s AND expires_at > now()
+          AND expires_at < now() + ttl * interval '0.5 second'
+        RETURNING kind
+    )
+    SELECT kind, payload, version, false FROM conversation_sessions
+    WHERE session_key = %(key)s AND expires_at > now()
+    UNION ALL
+    SELECT kind, payload, version, true FROM expired
+"""
+_INSERT_SQL = """
+    INSERT INTO conversation_sessions (kind, session_key, payload, version, ttl, expires_at, updated_at)
+    VALUES (%s, %s, %s, 1, %s, now() + %s * interval '1 second', now())
+    ON CONFLICT (session_key, kind) DO NOTHING
+"""
+_UPDATE_SQL = """
+    UPDATE conversation_sessions
+    SET payload = %s, version = version + 1, ttl = %s,
+        expires_at = now() + %s * interval '1 second', updated_at = now()
+    WHERE kind = %s AND session_key = %s AND version = %s
+"""
+_DELETE_SQL = "DELETE FROM conversation_sessions WHERE kind = %s AND session_key = %s AND version = %s"
+_CLEAR_SQL = "DELETE FROM conversation_sessions WHERE kind = %s"
+_SNAPSHOT_SQL = "SELECT session_key, payload FROM conversation_sessions WHERE kind = %s AND expires_at > now()"
+_SWEEP_SQL = "DELETE FROM conversation_sessions WHERE expires_at <= now() RETURNING kind, session_key, payload"
+_STATS_SQL = """
+    SELECT kind, count(*), coalesce(sum(octet_length(payload)), 0)
+    FROM conversation_sessions WHERE expires_at > now() GROUP BY kind
+"""
+
+
+class _Row:
+    """request_scope 内で読んだ1セッション"""
+    __slots__ = ('value', 'version', 'snapshot', 'dirty', 'deleted')
+
+    def __init__(self, value, version: Optional[int], snapshot: Optional[bytes]):
+        self.value = value
+        self.version = version      # None = まだテーブルにない
+        self.snapshot = snapshot    # 読んだ時点のペイロード（変更検出用）
+        self.dirty = False
+        self.deleted = False
+
+
+class _Scope:
+    def __init__(self):
+        self.loaded = set()
+        # (kind, key) -> _Row
+        self.rows: Dict[Tuple[str, str], _Row] = {}
+
+
+class PostgresSessionStore(SessionStore):
+    """Postgres の UNLOGGED テーブルに保存するワーカー間共有のセッションストア"""
+
+    backend = 'postgres'
+
+    def __init__(self, sweep_interval: int, read_cache_ttl: float, read_cache_size: int):
+        """
+        Args:
+            sweep_interval: 期限切れセッションを掃除する間隔（秒）
+            read_cache_ttl: 読み込み結果をプロセス内で使い回す秒数（0 で無効）
+            read_cache_size: 読み込みキャッシュの最大キー数
+        """
+        super().__init__(sweep_interval)
+        self.read_cache_ttl = read_cache_ttl
+        self.read_cache_size = read_cache_size
+        self._local = threading.local()
+        # key -> (読み込み時刻, [(kind, payload, version), ...])
+        self._read_cache: "OrderedDict[str, Tuple[float, List[Tuple[str, bytes, int]]]]" = OrderedDict()
+        self._loads = 0
+        self._cache_hits = 0
+        self._writes = 0
+        self._conflicts = 0
+        self._backend_errors = 0
+
+    # ---- スコープ ----
+
+    @contextmanager
+    def request_scope(self):
+        if getattr(self._local, 'scope', None) is not None:
+            yield
+            return
+        self._ensure_started()
+        scope = self._local.scope = _Scope()
+        try:
+            yield
+        except BaseException:
+            self._local.scope = None
+            self._flush(scope)
+            raise
+        self._local.scope = None
+        # 返信より前に書き戻し、競合した場合は呼び出し側に知らせる。
+        # ハンドラーの DB 操作（送金など）は確定済みなので、取り消されるのはセッションの変更だけ
+        conflicts = self._flush(scope)
+        if conflicts:
+            raise SessionConflict(conflicts)
+
+    @contextmanager
+    def _scope(self):
+        """操作対象のスコープ（request_scope 外では1操作ごとに書き戻す）"""
+        scope = getattr(self._local, 'scope', None)
+        if scope is not None:
+            yield scope
+            return
+        self._ensure_started()
+        scope = _Scope()
+        yield scope
+        self._flush(scope)
+
+    def _row(self, scope: _Scope, kind: str, key: str) -> Optional[_Row]:
+        if key not in scope.loaded:
+            self._load(scope, key)
+        row = scope.rows.get((kind, key))
+        if row is None or row.deleted:
+            return None
+        return row
+
+    # ---- 操作 ----
+
+    def _get(self, kind: str, key: str):
+        with self._scope() as scope:
+            row = self._row(scope, kind, key)
+            return _MISSING if row is None else row.value
+
+    def _set(self, kind: str, key: str, value: Any):
+        with self._scope() as scope:
+            row = self._row(scope, kind, key)
+            if row is None:
+                old = scope.rows.get((kind, key))
+                row = scope.rows[(kind, key)] = _Row(value, old.version if old else None, None)
+            row.value = value
+            row.dirty = True
+
+    def _touch(self, kind: str, key: str) -> bool:
+        with self._scope() as scope:
+            row = self._row(scope, kind, key)
+            if row is None:
+                return False
+            row.dirty = True
+            return True
+
+    def _pop(self, kind: str, key: str):
+        with self._scope() as scope:
+            row = self._row(scope, kind, key)
+            if row is None:
+                return _MISSING
+            row.deleted = True
+            return row.value
+
+    def _clear(self, kind: str):
+        scope = getattr(self._local, 'scope', None)
+        if scope is not None:
+            for k in [k for k in scope.rows if k[0] == kind]:
+                del scope.rows[k]
+        self._execute(_CLEAR_SQL, (kind,))
+        with self._lock:
+            self._read_cache.clear()
+
+    def _snapshot(self, kind: str) -> Dict[str, Any]:
+        rows = self._execute(_SNAPSHOT_SQL, (kind,), fetch=True) or []
+        return {key: loads_session(payload) for key, payload in rows}
+
+    def _live(self, kind: str) -> int:
+        return self.stats()['by_kind'].get(kind, {}).get('live', 0)
+
+    # ---- 読み込み/書き戻し ----
+
+    def _load(self, scope: _Scope, key: str):
+        scope.loaded.add(key)
+        rows = self._cached_rows(key)
+        if rows is None:
+            try:
+                result = self._execute(_LOAD_SQL, {'key': key}, fetch=True)
+            except Exception as e:
+                print(f"[SessionStore] セッションの読み込みに失敗: user={key}, {e}")
+                with self._lock:
+                    self._backend_errors += 1
+                return
+            rows = []
+            expired = []
+            for kind, payload, version, is_expired in result:
+                payload = bytes(payload)
+                (expired if is_expired else rows).append((kind, payload, version))
+            with self._lock:
+                self._loads += 1
+            self._cache_rows(key, rows)
+            for kind, payload, _ in expired:
+                self._notify(kind, key, loads_session(payload), REASON_EXPIRED)
+        for kind, payload, version in rows:
+            scope.rows[(kind, key)] = _Row(loads_session(payload), version, payload)
+
+    def _flush(self, scope: _Scope) -> List[Tuple[str, str]]:
+        """
+        スコープ内の変更をバージョン比較付きで書き戻す
+
+        Returns:
+            List[Tuple[str, str]]: 他のワーカーが先に更新していたため書き込めなかった (kind, key)
+        """
+        statements = []
+        for (kind, key), row in scope.rows.items():
+            stats = self._kinds.get(kind)
+            if stats is None:
+                continue
+            if row.deleted:
+                if row.version is not None:
+                    statements.append((kind, key, _DELETE_SQL, (kind, key, row.version)))
+                continue
+            try:
+                payload = dumps_session(row.value)
+            except (TypeError, ValueError) as e:
+                print(f"[SessionStore] {kind} セッションを保存できません: user={key}, {e}")
+                with self._lock:
+                    self._backend_errors += 1
+                continue
+            if row.version is None:
+                statements.append((kind, key, _INSERT_SQL, (kind, key, payload, stats.ttl, stats.ttl)))
+            elif row.dirty or payload != row.snapshot:
+                statements.append((kind, key, _UPDATE_SQL, (payload, stats.ttl, stats.ttl, kind, key, row.version)))
+        if not statements:
+            return []
+
+        from core.db import raw_connection
+        conflicts = []
+        try:
+            with raw_connection() as conn:
+                with conn.cursor() as cur:
+                    for kind, key, sql, params in statements:
+                        cur.execute(sql, params)
+                        if cur.rowcount == 0:
+                            conflicts.append((kind, key))
+                conn.commit()
+        except Exception as e:
+            print(f"[SessionStore] セッションの書き込みに失敗: {e}")
+            with self._lock:
+                self._backend_errors += 1
+            conflicts = []
+        with self._lock:
+            self._writes += len(statements) - len(conflicts)
+            self._conflicts += len(conflicts)
+            for key in {key for _, key, _, _ in statements}:
+                self._read_cache.pop(key, None)
+            for kind, key, sql, params in statements:
+                if sql is _INSERT_SQL and (kind, key) not in conflicts:
+                    self._kinds[kind].created += 1
+        for kind, key in conflicts:
+            print(f"[SessionStore] {kind} セッションは他のワーカーが先に更新したため書き込みを破棄: user={key}")
+        return conflicts
+
+    # ---- 読み込みキャッシュ ----
+
+    def _cached_rows(self, key: str) -> Optional[List[Tuple[str, bytes, int]]]:
+        if self.read_cache_ttl <= 0:
+            return None
+        with self._lock:
+            cached = self._read_cache.get(key)
+            if cached is None:
+                return None
+            loaded_at, rows = cached
+            if time.monotonic() - loaded_at >= self.read_cache_ttl:
+                del self._read_cache[key]
+                return None
+            self._read_cache.move_to_end(key)
+            self._cache_hits += 1
+            return rows
+
+    def _cache_rows(self, key: str, rows: List[Tuple[str, bytes, int]]):
+        if self.read_cache_ttl <= 0:
+            return
+        with self._lock:
+            self._read_cache[key] = (time.monotonic(), rows)
+            self._read_cache.move_to_end(key)
+            while len(self._read_cache) > self.read_cache_size:
+                self._read_cache.popitem(last=False)
+
+    # ---- 掃除 ----
+
+    def sweep(self) -> int:
+        # DELETE ... RETURNING で削除した行だけを処理するので、コールバックは全ワーカーで1回だけ呼ばれる
+        rows = self._execute(_SWEEP_SQL, (), fetch=True) or []
+        with self._lock:
+            self._sweeps += 1
+        for kind, key, payload in rows:
+            self._notify(kind, key, loads_session(payload), REASON_EXPIRED)
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            counts = {kind: (live, size) for kind, live, size in self._execute(_STATS_SQL, (), fetch=True)}
+        except Exception as e:
+            print(f"[SessionStore] 統計の取得に失敗: {e}")
+            counts = {}
+        with self._lock:
+            for kind, s in self._kinds.items():
+                s.live, s.bytes = counts.get(kind, (0, 0))
+        result = super().stats()
+        with self._lock:
+            result.update({
+                'sessions': sum(live for live, _ in counts.values()),
+                'bytes': sum(size for _, size in counts.values()),
+                'loads': self._loads,
+                'read_cache_hits': self._cache_hits,
+                'read_cache_size': len(self._read_cache),
+                'writes': self._writes,
+                'conflicts': self._conflicts,
+                'backend_errors': self._backend_errors,
+            })
+        return result
+
+    @staticmethod
+    def _execute(sql: str, params, fetch: bool = False):
+        from core.db import raw_connection
+        with raw_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                result = cur.fetchall() if fetch else None
+            conn.commit()
+        return result
+
+
+# グローバルインスタンス
+if config.SESSION_BACKEND == 'postgres':
+    session_store: SessionStore = PostgresSessionStore(
+        sweep_interval=config.SESSION_SWEEP_INTERVAL,
+        read_cache_ttl=config.SESSION_READ_CACHE_TTL,
+        read_cache_size=config.SESSION_READ_CACHE_SIZE,
+    )
+else:
+    session_store = LocalSessionStore(
+        memory_cap_bytes=config.SESSION_MEMORY_CAP_BYTES,
+        sweep_interval=config.SESSION_SWEEP_INTERVAL,
+    )
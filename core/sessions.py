@@ -1,6 +1,7 @@
 """
 ユーザーセッション管理モジュール（統合インターフェース）
 各機能専用のセッションマネージャーへのアクセスを提供
+（保存先は core/session_store。SESSION_BACKEND=postgres ならワーカー間で共有される）
 """
 from typing import Dict, Any, Optional
 
@@ -1,48 +1,203 @@
-from flask import Flask, request, abort
+from flask import Flask, Response, request, abort, jsonify
 from linebot.exceptions import InvalidSignatureError
-from core.api import handler
 import core.handler
-from apps.stock.background_updater import start_background_updater
-from apps.prison.rehabilitation_scheduler import start_rehabilitation_distribution_scheduler
-from apps.tax.tax_scheduler import start_tax_collections_loan_scheduler
-from apps.rich_menu import create_rich_menus, set_default_rich_menu
+from core.dispatcher import dispatcher, DispatcherBusy
+from core.dedup import deduplicator
+from core.profile_cache import profile_cache
+from apps.recording_logs import log_sink
+from core.db import pool_stats, contention_stats
+from core.http_client import http_client
+from core.session_store import session_store
+from core.rate_limit import rate_limiter
+from core.responder import responder
+from core.metrics import metrics, stats_gauge
+from apps.auto_reply import router
+import config
+from core.leader import scheduler_leader
+from core.scheduler import job_scheduler
+from core.lifecycle import lifecycle
+# 定期ジョブの登録（インポート時に job_scheduler へ登録される）
+import apps.stock.background_updater
+import apps.prison.rehabilitation_scheduler
+import apps.tax.tax_scheduler
+import apps.banking.ledger_sweeper
+from apps.rich_menu import start_rich_menu_bootstrap
+from apps.prison.sentence_index import sentence_index
+from apps.collections.notice_index import notice_index
+from apps.games.minigames import persist_pending_games, restore_pending_games
+from apps.banking.hot_accounts import hot_accounts
+from core.api import line_bot_api
 from apps.web.routes import liff_blueprint
 
 app = Flask(__name__)
 app.register_blueprint(liff_blueprint)
 
-# 株価バックグラウンド更新を開始
-start_background_updater()
+# /metrics で公開するゲージ（各コンポーネントの stats() をそのまま出す）
+metrics.register_gauge('linebot_dispatcher', 'Webhook dispatcher state', stats_gauge(dispatcher.stats))
+metrics.register_gauge('linebot_webhook_dedup', 'Webhook redelivery dedup state', stats_gauge(deduplicator.stats))
+metrics.register_gauge('linebot_profile_cache', 'LINE profile cache state', stats_gauge(profile_cache.stats))
+metrics.register_gauge('linebot_log_sink', 'Message log sink state', stats_gauge(log_sink.stats))
+metrics.register_gauge('linebot_db_pool', 'DB connection pool state', stats_gauge(pool_stats))
+metrics.register_gauge('linebot_db_contention', 'Row lock waits and transaction retries', stats_gauge(contention_stats))
+metrics.register_gauge('linebot_hot_accounts', 'System account bucket credits and sweeps', stats_gauge(hot_accounts.stats))
+metrics.register_gauge('linebot_http_client', 'Outbound HTTP client state', stats_gauge(http_client.stats))
+metrics.register_gauge('linebot_prison_index', 'Active prison sentence index state', stats_gauge(sentence_index.stats))
+metrics.register_gauge('linebot_collections_notice', 'Collections notice index state', stats_gauge(notice_index.stats))
+metrics.register_gauge('linebot_rate_limiter', 'Command rate limiter state', stats_gauge(rate_limiter.stats))
+metrics.register_gauge('linebot_responder', 'Reply batching and reply-window state', stats_gauge(responder.stats))
+metrics.register_gauge('linebot_session_store', 'Conversation session store state', stats_gauge(session_store.stats))
+metrics.register_gauge(
+    'linebot_sessions_live', 'Live conversation sessions by type',
+    lambda: {(('kind', kind),): s['live'] for kind, s in session_store.stats()['by_kind'].items()},
+)
+metrics.register_gauge(
+    'linebot_sessions_bytes', 'Estimated memory used by conversation sessions by type',
+    lambda: {(('kind', kind),): s['bytes'] for kind, s in session_store.stats()['by_kind'].items()},
+)
 
-# 懲役システムの給付金配布スケジューラーを開始
-start_rehabilitation_distribution_scheduler()
+def start_schedulers():
+    # 株価更新・AI取引・配当、給付金配布・自動釈放、税/回収/ローンを1つのスケジューラーで開始
+    job_scheduler.start()
 
-# 税/回収/ローンのスケジューラーを開始
-start_tax_collections_loan_scheduler()
+def stop_schedulers():
+    # リーダーのスレッドで呼ばれるので、長いジョブがあっても待つのは SHUTDOWN_JOB_TIMEOUT 秒まで
+    # （待ち切れなかったジョブは停止要求を見て抜けるまで動き続ける）
+    if not job_scheduler.shutdown(wait=True, timeout=config.SHUTDOWN_JOB_TIMEOUT):
+        print(f"[Leader] リーダーを降りた後もジョブが実行中です（{config.SHUTDOWN_JOB_TIMEOUT}秒待って打ち切り）: "
+              f"{job_scheduler.active_jobs()}")
 
-# リッチメニューの初期化（起動時に自動作成）
+# スケジューラーは全ワーカーのうちリーダーに選ばれた1プロセスだけで動かす
+if config.LEADER_ELECTION_ENABLED:
+    scheduler_leader.on_elected(start_schedulers)
+    scheduler_leader.on_demoted(stop_schedulers)
+    scheduler_leader.start()
+else:
+    start_schedulers()
+
+# リッチメニューの同期（内容に変更があるページのみ作り直す。起動はブロックしない）
+start_rich_menu_bootstrap()
+
+# 懲役中ユーザー・督促通知の索引を読み込む（以降のメッセージごとのチェックは DB に問い合わせない）
+sentence_index.load()
+notice_index.load()
+
+# 前回の停止時に退避したセッションとじゃんけんゲームを読み戻す
+# （セッションの種類は各 session_manager のインポート時に登録されるため、読み戻しの前にすべて読み込む）
+import apps.banking.session_manager
+import apps.games.session_manager
+import apps.shop.session_manager
+import apps.stock.session_manager
 try:
-    print("[起動] リッチメニューを初期化中...")
-    create_rich_menus()
-    set_default_rich_menu()
-    print("[起動] リッチメニューの初期化が完了しました")
+    print(f"[Startup] セッションを読み戻しました: {session_store.restore()}件")
 except Exception as e:
-    print(f"[起動] リッチメニューの初期化に失敗しました: {e}")
-    print("[起動] 手動で ?メニュー作成 コマンドを実行して作成してください")
+    print(f"[Startup] セッションの読み戻しに失敗: {e}")
+print(f"[Startup] じゃんけんゲームを読み戻しました: {restore_pending_games(line_bot_api)}件")
+
+# 停止処理（SIGTERM）: 受付停止 → ジョブ停止 → 退避/書き込み の順に実行する
+def _persist_sessions(remaining):
+    session_store.stop()
+    return session_store.persist()
+
+lifecycle.on_shutdown('dispatcher', lambda t: dispatcher.drain(min(t, config.SHUTDOWN_DRAIN_TIMEOUT)))
+lifecycle.on_shutdown('scheduler', lambda t: job_scheduler.shutdown(wait=True, timeout=min(t, config.SHUTDOWN_JOB_TIMEOUT)))
+lifecycle.on_shutdown('leader', lambda t: scheduler_leader.stop(timeout=min(t, 5)))
+lifecycle.on_shutdown('janken_games', lambda t: persist_pending_games())
+lifecycle.on_shutdown('sessions', _persist_sessions)
+lifecycle.on_shutdown('log_sink', lambda t: log_sink.stop(timeout=max(t, 1)))
+lifecycle.install_signal_handlers()
 
 @app.route("/callback", methods=['POST'])
 def callback():
     signature = request.headers['X-Line-Signature']
     body = request.get_data(as_text=True)
+    # 署名検証とパースのみ同期で行い、イベント処理はワーカーに任せて即座に200を返す
     try:
-        handler.handle(body, signature)
+        dispatcher.dispatch(body, signature)
     except InvalidSignatureError:
         abort(400)
+    except DispatcherBusy as e:
+        print(f"[Callback] 受付上限に達しました: {e}")
+        abort(503)
     return 'OK'
 
 @app.route("/health")
 def health():
+    # 停止処理中はロードバランサーに新しいリクエストを送らせない
+    if lifecycle.stopping:
+        return "stopping", 503
     return "ok", 200
 
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route("/status/dispatcher")
+def dispatcher_status():
+    return jsonify(dispatcher.stats()), 200
+
+@app.route("/status/dedup")
+def dedup_status():
+    return jsonify(deduplicator.stats()), 200
+
+@app.route("/status/profile_cache")
+def profile_cache_status():
+    return jsonify(profile_cache.stats()), 200
+
+@app.route("/status/log_sink")
+def log_sink_status():
+    return jsonify(log_sink.stats()), 200
+
+@app.route("/status/db_pool")
+def db_pool_status():
+    return jsonify(pool_stats()), 200
+
+@app.route("/status/db_contention")
+def db_contention_status():
+    return jsonify(contention_stats()), 200
+
+@app.route("/status/hot_accounts")
+def hot_accounts_status():
+    return jsonify(hot_accounts.stats()), 200
+
+@app.route("/status/http_client")
+def http_client_status():
+    return jsonify(http_client.stats()), 200
+
+@app.route("/status/sessions")
+def sessions_status():
+    return jsonify(session_store.stats()), 200
+
+@app.route("/status/prison_index")
+def prison_index_status():
+    return jsonify(sentence_index.stats()), 200
+
+@app.route("/status/collections_notice")
+def collections_notice_status():
+    return jsonify(notice_index.stats()), 200
+
+@app.route("/status/rate_limit")
+def rate_limit_status():
+    return jsonify(rate_limiter.stats()), 200
+
+@app.route("/status/replies")
+def replies_status():
+    return jsonify(responder.stats()), 200
+
+@app.route("/status/lifecycle")
+def lifecycle_status():
+    return jsonify(lifecycle.status()), 200
+
+@app.route("/status/leader")
+def leader_status():
+    return jsonify(scheduler_leader.status()), 200
+
+@app.route("/status/jobs")
+def jobs_status():
+    return jsonify(job_scheduler.job_summaries()), 200
+
+@app.route("/status/routes")
+def routes_status():
+    return jsonify(router.describe()), 200
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=10000)
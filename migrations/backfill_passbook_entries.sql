@@ -0,0 +1,28 @@
+-- 通帳（apps/banking/passbook.py）用: 仕訳のない過去の取引（更生給付金の入金・配布）の仕訳を補う。
+-- created_at は取引の実行時刻に揃え、通帳の並び順を従来（executed_at 順）と同じにする。
+-- 1つのトランザクションで実行する（途中で失敗しても半端に補完されない。再実行しても重複しない）。
+-- インデックスは別ファイル migrations/create_passbook_indexes.sql（こちらの後に実行する）。
+
+BEGIN;
+
+INSERT INTO transaction_entries (transaction_id, account_id, entry_type, amount, created_at)
+SELECT t.transaction_id, t.from_account_id, 'debit', t.amount, COALESCE(t.executed_at, t.created_at)
+FROM transactions t
+WHERE t.from_account_id IS NOT NULL
+  AND NOT EXISTS (
+      SELECT 1 FROM transaction_entries e
+      WHERE e.transaction_id = t.transaction_id AND e.account_id = t.from_account_id AND e.entry_type = 'debit'
+  );
+
+INSERT INTO transaction_entries (transaction_id, account_id, entry_type, amount, created_at)
+SELECT t.transaction_id, t.to_account_id, 'credit', t.amount, COALESCE(t.executed_at, t.created_at)
+FROM transactions t
+WHERE t.to_account_id IS NOT NULL
+  AND NOT EXISTS (
+      SELECT 1 FROM transaction_entries e
+      WHERE e.transaction_id = t.transaction_id AND e.account_id = t.to_account_id AND e.entry_type = 'credit'
+  );
+
+COMMIT;
+
+ANALYZE transaction_entries;
@@ -0,0 +1,14 @@
+-- システム口座の残高の分散先（apps/banking/hot_accounts.py）
+-- 準備預金・ショップ運営・給与支払元・税金の納付先・ミニゲーム運営口座への入金は
+-- accounts の行をロックせず、この表の (account_id, bucket_no) の1行に加算する。
+-- 口座の残高は accounts.balance とこの表の合計。定期ジョブが accounts.balance に寄せて行を削除する。
+
+CREATE TABLE IF NOT EXISTS account_balance_buckets (
+    account_id BIGINT NOT NULL REFERENCES accounts(account_id) ON DELETE CASCADE,
+    bucket_no INTEGER NOT NULL,
+    balance NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (account_id, bucket_no)
+);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE account_balance_buckets TO PUBLIC;
@@ -0,0 +1,12 @@
+-- バックグラウンドジョブのリーダー情報（core/leader.py）
+-- リーダーの排他自体は advisory lock で行い、このテーブルは状態表示用。
+-- リーダーは LEADER_RENEW_INTERVAL ごとに renewed_at を更新する。
+
+CREATE TABLE IF NOT EXISTS background_leader (
+    name TEXT PRIMARY KEY,              -- 選出対象（'schedulers'）
+    holder TEXT NOT NULL,               -- ホスト名:PID
+    acquired_at TIMESTAMPTZ NOT NULL,
+    renewed_at TIMESTAMPTZ NOT NULL
+);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE background_leader TO PUBLIC;
@@ -0,0 +1,21 @@
+-- 会話セッション（銀行・株式・ショップ・ゲーム）の共有テーブル（SESSION_BACKEND=postgres の場合に使用）
+-- SESSION_BACKEND=memory の場合も、停止時の退避と起動時の読み戻しに使う。
+-- 複数ワーカープロセスで同じユーザーの手続きを引き継げるようにする。
+-- payload は JSON（大きいものは zlib 圧縮）、version は compare-and-set 用。
+-- 一時的なデータなので UNLOGGED にして WAL を書かない（クラッシュ時は空になる）。
+
+CREATE UNLOGGED TABLE IF NOT EXISTS conversation_sessions (
+    session_key TEXT NOT NULL,
+    kind VARCHAR(32) NOT NULL,
+    payload BYTEA NOT NULL,
+    version BIGINT NOT NULL DEFAULT 1,
+    ttl INTEGER NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (session_key, kind)
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversation_sessions_expires_at ON conversation_sessions(expires_at);
+CREATE INDEX IF NOT EXISTS idx_conversation_sessions_kind ON conversation_sessions(kind);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE conversation_sessions TO PUBLIC;
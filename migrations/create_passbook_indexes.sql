@@ -0,0 +1,16 @@
+-- 通帳（apps/banking/passbook.py）のキーセットページング用インデックス
+-- 口座ごとの仕訳を (created_at DESC, entry_id DESC) の順にインデックスだけで辿れるようにする。
+-- 件数の多い本番ではロックを避けるため CONCURRENTLY で作成する。
+-- CONCURRENTLY はトランザクション内では実行できないので、BEGIN で囲まず、
+-- psql の -1 / --single-transaction も付けずに実行すること（例: psql "$DATABASE_URL" -f このファイル）。
+-- scripts/apply_sql.py は全体を1つのトランザクションで実行するため、このファイルには使えない。
+-- 過去の取引の仕訳の補完は migrations/backfill_passbook_entries.sql（先に実行する）。
+-- 作成に失敗すると INVALID なインデックスが残るので、DROP INDEX CONCURRENTLY してから再実行する。
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transaction_entries_account_created
+    ON transaction_entries (account_id, created_at DESC, entry_id DESC)
+    INCLUDE (transaction_id, entry_type, amount);
+
+-- 仕訳 → 取引の結合と、取引の削除時（ON DELETE CASCADE）の仕訳の検索用
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transaction_entries_transaction
+    ON transaction_entries (transaction_id);
@@ -0,0 +1,12 @@
+-- 停止時に退避したじゃんけんゲーム（募集中・進行中）
+-- 再デプロイでプロセス内のゲームとタイマーが失われ、参加費がロックされたままになるのを防ぐ。
+-- 起動時に読み戻して削除し、進行中のゲームは残り時間でタイマーを張り直す。
+-- payload は core.session_store.dumps_session 形式（JSON、大きいものは zlib 圧縮）。
+
+CREATE TABLE IF NOT EXISTS pending_janken_games (
+    group_id VARCHAR(255) PRIMARY KEY,
+    payload BYTEA NOT NULL,
+    saved_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE pending_janken_games TO PUBLIC;
@@ -0,0 +1,12 @@
+-- リッチメニューIDの対応表
+-- 起動時の同期処理（apps/rich_menu/menu_manager.sync_rich_menus）が
+-- テンプレート+画像の内容ハッシュと合わせて保存し、変更のないページは作り直さない。
+
+CREATE TABLE IF NOT EXISTS rich_menu_registry (
+    page_key TEXT PRIMARY KEY,          -- 'page1-1' など
+    rich_menu_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,         -- テンプレートJSON + 画像の SHA-256
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE rich_menu_registry TO PUBLIC;
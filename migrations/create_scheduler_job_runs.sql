@@ -0,0 +1,19 @@
+-- 定期ジョブの実行履歴（core/scheduler.py）
+-- 開始時に行を作り、終了時に結果を書き込む。
+-- 起動時の取りこぼし実行（catch-up）は、直近の予定時刻以降に開始記録があるかで判定する。
+
+CREATE TABLE IF NOT EXISTS scheduler_job_runs (
+    run_id BIGSERIAL PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    holder TEXT NOT NULL,               -- 実行したプロセス（ホスト名:PID）
+    started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    finished_at TIMESTAMPTZ,
+    duration_ms INTEGER,
+    success BOOLEAN,
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_scheduler_job_runs_job_started ON scheduler_job_runs(job_id, started_at DESC);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE scheduler_job_runs TO PUBLIC;
+GRANT USAGE, SELECT ON SEQUENCE scheduler_job_runs_run_id_seq TO PUBLIC;
@@ -0,0 +1,12 @@
+-- Webhook 再送の重複排除用テーブル（WEBHOOK_DEDUP_BACKEND=postgres の場合に使用）
+-- 複数ワーカープロセスで受信済みの webhookEventId を共有する。
+-- 一時的なデータなので UNLOGGED にして WAL を書かない。
+
+CREATE UNLOGGED TABLE IF NOT EXISTS webhook_event_dedup (
+    event_id TEXT PRIMARY KEY,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_webhook_event_dedup_expires_at ON webhook_event_dedup(expires_at);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE webhook_event_dedup TO PUBLIC;
@@ -0,0 +1,130 @@
+"""
+送金の同時実行ベンチマーク（ローカルの Postgres 向け）
+
+既存の口座の間で少額の送金を複数スレッドから双方向に流し、
+スループット・レイテンシ・デッドロック/リトライ回数を表示する。
+終了後に対象口座の残高合計が変わっていないこと（お金が増減していないこと）を確認する。
+
+    python scripts/bench_transfer_contention.py --accounts 7777777,1234567,2345678 --threads 16 --seconds 20
+    python scripts/bench_transfer_contention.py --accounts ... --legacy   # 旧実装（呼び出し順にロック）と比較
+
+注意: 指定した口座の間で実際に送金される（各口座の残高は増減するが合計は変わらない）。本番 DB では実行しないこと。
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+sys.path.append(os.getcwd())
+
+from sqlalchemy import select, func
+
+from apps.banking.main_bank_system import SessionLocal, Account
+from apps.banking.bank_service import transfer_funds
+from apps.banking.hot_accounts import hot_accounts
+from core.db import contention_stats, retryable_reason
+
+
+def legacy_transfer(from_account_number: str, to_account_number: str, amount: Decimal):
+    """旧実装のロック順（送金元 → 送金先の呼び出し順）を再現した送金（残高の移動のみ）"""
+    db = SessionLocal()
+    try:
+        with db.begin():
+            from_acc = db.execute(select(Account).filter_by(account_number=from_account_number).with_for_update()).scalars().first()
+            # 逆向きの送金と交差しやすくする
+            time.sleep(0.001)
+            to_acc = db.execute(select(Account).filter_by(account_number=to_account_number).with_for_update()).scalars().first()
+            if from_acc.balance < amount:
+                raise ValueError("Insufficient funds")
+            from_acc.balance = from_acc.balance - amount
+            to_acc.balance = to_acc.balance + amount
+    finally:
+        db.close()
+
+
+def total_balance(account_numbers) -> Decimal:
+    """残高の合計（システム口座はバケットの分も含める）"""
+    balances = select(hot_accounts.balance_column()).where(Account.account_number.in_(account_numbers)).subquery()
+    db = SessionLocal()
+    try:
+        return db.execute(select(func.coalesce(func.sum(balances.c.balance), 0))).scalar_one()
+    finally:
+        db.close()
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', required=True, help='カンマ区切りの口座番号（2つ以上。残高が少しずつあること）')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--amount', default='1')
+    parser.add_argument('--legacy', action='store_true', help='旧実装のロック順で実行する（リトライなし）')
+    args = parser.parse_args()
+
+    accounts = [a.strip() for a in args.accounts.split(',') if a.strip()]
+    if len(accounts) < 2:
+        parser.error('口座は2つ以上指定してください')
+    amount = Decimal(args.amount)
+
+    before = total_balance(accounts)
+    deadline = time.monotonic() + args.seconds
+    latencies = []
+    outcomes = Counter()
+    lock = threading.Lock()
+
+    def worker():
+        rng = random.Random()
+        local_latencies = []
+        local_outcomes = Counter()
+        while time.monotonic() < deadline:
+            src, dst = rng.sample(accounts, 2)
+            start = time.perf_counter()
+            try:
+                if args.legacy:
+                    legacy_transfer(src, dst, amount)
+                else:
+                    transfer_funds(src, dst, amount, description='bench')
+                local_outcomes['ok'] += 1
+            except ValueError:
+                local_outcomes['insufficient_funds'] += 1
+            except Exception as e:
+                local_outcomes[retryable_reason(e) or type(e).__name__] += 1
+            local_latencies.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local_latencies)
+            outcomes.update(local_outcomes)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    after = total_balance(accounts)
+
+    print(f"mode={'legacy' if args.legacy else 'ordered'} threads={args.threads} accounts={len(accounts)} seconds={elapsed:.1f}")
+    print(f"transfers={outcomes['ok']} ({outcomes['ok'] / elapsed:.1f}/s)")
+    print(f"latency p50={percentile(latencies, 0.5) * 1000:.1f}ms p99={percentile(latencies, 0.99) * 1000:.1f}ms "
+          f"max={max(latencies, default=0) * 1000:.1f}ms")
+    print(f"outcomes={dict(outcomes)}")
+    for key, value in sorted(contention_stats().items()):
+        print(f"  {key}={value}")
+    print(f"balance total before={before} after={after} {'OK' if before == after else 'MISMATCH'}")
+    if before != after:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
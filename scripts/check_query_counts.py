@@ -0,0 +1,205 @@
+"""
+銀行の参照系のクエリ数チェック（デプロイ前のチェック。ローカル/ステージングの Postgres 向け）
+
+口座情報・通帳の取得が 1 回の呼び出しにつき決まった数のクエリで済んでいるか
+（リレーションの遅延読み込みや、別セッションでの再取得で増えていないか）を確認する。
+クエリ数は core.metrics の計測スコープ（engine のイベントで数える）で数える。
+
+    python scripts/check_query_counts.py                       # 検証用のユーザー・口座・取引を作って確認し、最後に削除する
+    python scripts/check_query_counts.py --user-id Uxxxxxxxx   # 既存のユーザーで確認する（データは変更しない）
+
+マイグレーションの適用後、デプロイの前に引数なしで実行する（document/subsystems/banking.md）。
+想定より多い呼び出しがあれば一覧を表示して終了コード 1 で終わる。
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.getcwd())
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import delete, select, text
+
+from apps.banking.main_bank_system import (
+    SessionLocal, Account, AccountBalanceBucket, Branch, Customer, Transaction, TransactionEntry,
+)
+from apps.banking import bank_service
+from core.metrics import metrics
+
+# 呼び出しごとに許すクエリ数の上限（対象が無く問い合わせない場合は 0）
+EXPECTED_QUERIES = 1
+
+# 検証用のデータ（--user-id を指定しない場合に作って最後に削除する）
+FIXTURE_USER_ID = 'query_count_check'
+FIXTURE_ACCOUNTS = 2
+FIXTURE_TRANSFERS = 5
+
+
+def count_queries(name: str, func):
+    """func を実行し、(戻り値, 発行されたクエリ数) を返す"""
+    with metrics.job_timer(f'query_count.{name}') as scope:
+        result = func()
+    return result, scope.queries
+
+
+def create_fixture() -> None:
+    """検証用のユーザーに口座を2つ作り、口座間の取引（仕訳つき）を FIXTURE_TRANSFERS 件作る"""
+    remove_fixture()
+    db = SessionLocal()
+    try:
+        with db.begin():
+            branch = db.execute(select(Branch).order_by(Branch.branch_id)).scalars().first()
+            if branch is None:
+                raise RuntimeError("支店がありません（branches を作成してから実行してください）")
+            customer = Customer(full_name='ｸｴﾘｽｳ ﾁｪｯｸ', date_of_birth=datetime(2000, 1, 1), user_id=FIXTURE_USER_ID)
+            db.add(customer)
+            db.flush()
+            accounts = []
+            for _ in range(FIXTURE_ACCOUNTS):
+                acc = Account(
+                    customer_id=customer.customer_id,
+                    user_id=FIXTURE_USER_ID,
+                    account_number=bank_service.generate_account_number(db, branch),
+                    balance=Decimal('10000'),
+                    currency='JPY',
+                    type='ordinary',
+                    branch_id=branch.branch_id,
+                )
+                db.add(acc)
+                db.flush()
+                accounts.append(acc)
+
+            executed_at = datetime.now().astimezone() - timedelta(minutes=FIXTURE_TRANSFERS)
+            for i in range(FIXTURE_TRANSFERS):
+                from_acc, to_acc = accounts[i % 2], accounts[(i + 1) % 2]
+                tx = Transaction(
+                    from_account_id=from_acc.account_id,
+                    to_account_id=to_acc.account_id,
+                    amount=Decimal('100'),
+                    currency='JPY',
+                    type='transfer',
+                    status='completed',
+                    description='クエリ数チェック',
+                    executed_at=executed_at + timedelta(minutes=i),
+                )
+                db.add(tx)
+                db.flush()
+                db.add_all([
+                    TransactionEntry(transaction_id=tx.transaction_id, account_id=from_acc.account_id,
+                                     entry_type='debit', amount=tx.amount, created_at=tx.executed_at),
+                    TransactionEntry(transaction_id=tx.transaction_id, account_id=to_acc.account_id,
+                                     entry_type='credit', amount=tx.amount, created_at=tx.executed_at),
+                ])
+    finally:
+        db.close()
+
+
+def remove_fixture() -> None:
+    """検証用のユーザーのデータを削除する（前回の実行の残りも含む）"""
+    db = SessionLocal()
+    try:
+        with db.begin():
+            account_ids = select(Account.account_id).where(Account.user_id == FIXTURE_USER_ID).scalar_subquery()
+            tx_ids = (
+                select(Transaction.transaction_id)
+                .where((Transaction.from_account_id.in_(account_ids)) | (Transaction.to_account_id.in_(account_ids)))
+                .scalar_subquery()
+            )
+            db.execute(delete(TransactionEntry).where(TransactionEntry.transaction_id.in_(tx_ids)))
+            db.execute(delete(Transaction).where(Transaction.transaction_id.in_(tx_ids)))
+            db.execute(delete(AccountBalanceBucket).where(AccountBalanceBucket.account_id.in_(account_ids)))
+            db.execute(delete(Account).where(Account.user_id == FIXTURE_USER_ID))
+            db.execute(delete(Customer).where(Customer.user_id == FIXTURE_USER_ID))
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-id', help='口座を持つユーザーID（省略時は検証用のデータを作って確認する）')
+    parser.add_argument('--limit', type=int, help='通帳の1ページの件数（省略時は 20。検証用のデータでは 2）')
+    args = parser.parse_args()
+
+    if args.user_id:
+        failures = run_checks(args.user_id, args.limit or 20)
+    else:
+        create_fixture()
+        try:
+            # 2ページ目（カーソル付き）も確認できるように件数を小さくする
+            failures = run_checks(FIXTURE_USER_ID, args.limit or 2, expected_accounts=FIXTURE_ACCOUNTS)
+        finally:
+            remove_fixture()
+
+    if failures:
+        print(f"{len(failures)} call(s) issued more than {EXPECTED_QUERIES} query: {', '.join(failures)}")
+        sys.exit(1)
+
+
+def run_checks(user_id: str, limit: int, expected_accounts: int = None) -> list:
+    """
+    参照系の各呼び出しのクエリ数を表示する
+
+    Args:
+        expected_accounts: 検証用のデータの口座数（取得できた口座数が違えば失敗にする）
+
+    Returns:
+        list: 上限を超えた呼び出し（と口座数の不一致）の名前
+    """
+    # 接続の確立（初回接続時の問い合わせ）を計測に含めない
+    db = SessionLocal()
+    try:
+        db.execute(text('SELECT 1'))
+    finally:
+        db.close()
+
+    checks = []
+
+    account_ids, queries = count_queries('get_account_ids_by_user', lambda: bank_service.get_account_ids_by_user(user_id))
+    checks.append(('get_account_ids_by_user', queries, f"{len(account_ids)} accounts"))
+
+    info, queries = count_queries('get_account_info_by_user', lambda: bank_service.get_account_info_by_user(user_id))
+    checks.append(('get_account_info_by_user', queries, 'found' if info else 'none'))
+
+    accounts, queries = count_queries('get_accounts_by_account_ids', lambda: bank_service.get_accounts_by_account_ids(account_ids))
+    checks.append(('get_accounts_by_account_ids', queries, f"{len(accounts)} accounts"))
+
+    txs, queries = count_queries(
+        'get_account_transactions_by_user',
+        lambda: bank_service.get_account_transactions_by_user(user_id, limit),
+    )
+    checks.append(('get_account_transactions_by_user', queries, f"{len(txs)} rows"))
+
+    page, queries = count_queries('get_passbook_page_by_user', lambda: bank_service.get_passbook_page_by_user(user_id, limit))
+    checks.append(('get_passbook_page_by_user', queries, f"{len(page['items'])} rows"))
+
+    for acc in accounts:
+        label = f"{acc['branch_code']}-{acc['account_number']}"
+        page, queries = count_queries(
+            'get_passbook_page',
+            lambda: bank_service.get_passbook_page(acc['account_number'], acc['branch_code'], limit),
+        )
+        checks.append((f"get_passbook_page {label}", queries, f"{len(page['items'])} rows"))
+        if page['next_cursor']:
+            page, queries = count_queries(
+                'get_passbook_page',
+                lambda: bank_service.get_passbook_page(acc['account_number'], acc['branch_code'], limit,
+                                                       page['next_cursor']),
+            )
+            checks.append((f"get_passbook_page {label} (next)", queries, f"{len(page['items'])} rows"))
+
+    failures = []
+    for name, queries, detail in checks:
+        ok = queries <= EXPECTED_QUERIES
+        print(f"{'OK ' if ok else 'NG '} {name}: queries={queries} ({detail})")
+        if not ok:
+            failures.append(name)
+    if expected_accounts is not None and len(accounts) != expected_accounts:
+        print(f"NG  fixture: {len(accounts)} accounts found, expected {expected_accounts}")
+        failures.append('fixture accounts')
+    return failures
+
+
+if __name__ == "__main__":
+    main()